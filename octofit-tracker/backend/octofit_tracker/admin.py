@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import User, Team, Activity, Leaderboard, TeamStanding, Workout
 
 
 @admin.register(User)
@@ -31,6 +31,13 @@ class LeaderboardAdmin(admin.ModelAdmin):
     ordering = ('rank',)
 
 
+@admin.register(TeamStanding)
+class TeamStandingAdmin(admin.ModelAdmin):
+    list_display = ('team_id', 'total_calories', 'member_count', 'average_calories', 'rank')
+    search_fields = ('team_id',)
+    ordering = ('rank',)
+
+
 @admin.register(Workout)
 class WorkoutAdmin(admin.ModelAdmin):
     list_display = ('name', 'activity_type', 'difficulty', 'duration', 'calories_per_session')
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from octofit_tracker.realtime import leaderboard_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Long-lived event streams are served outside Django, whose ASGI handler
+    # iterates streaming responses synchronously
+    if scope['type'] == 'http' and scope['path'] == '/api/stream/leaderboard/':
+        await leaderboard_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,164 @@
+"""
+Async read-only views served from MongoDB without going through djongo.
+
+Under the ASGI application these never block a worker thread: every query
+is awaited on the async driver. Output matches the DRF serializers.
+"""
+import datetime
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from pymongo import ASCENDING, DESCENDING
+
+from . import mongo
+from .repository import to_mongo, decode_cursor, encode_cursor
+
+MAX_PAGE_SIZE = 500
+
+
+async def leaderboard_list(request):
+    return await _list(request, 'leaderboard', 'rank', int, ASCENDING, _leaderboard_rows)
+
+
+async def leaderboard_detail(request, pk):
+    return await _detail('leaderboard', pk, _leaderboard_rows)
+
+
+async def activity_list(request):
+    query = {}
+    if request.GET.get('user_id'):
+        query['user_id'] = request.GET['user_id']
+    return await _list(request, 'activities', 'date', datetime.datetime, DESCENDING, _activity_rows, query)
+
+
+async def activity_detail(request, pk):
+    return await _detail('activities', pk, _activity_rows)
+
+
+async def workout_list(request):
+    return await _list(request, 'workouts', 'created_at', datetime.datetime, DESCENDING, _workout_rows)
+
+
+async def workout_detail(request, pk):
+    return await _detail('workouts', pk, _workout_rows)
+
+
+async def _list(request, collection, key, key_type, direction, to_rows, query=None):
+    """
+    Keyset-paginated list ordered by ``key``, of type ``key_type`` (with
+    ``id`` as tie-breaker).
+    """
+    try:
+        page_size = min(int(request.GET.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE'])), MAX_PAGE_SIZE)
+        if page_size < 1:
+            raise ValueError(page_size)
+        after = decode_cursor(request.GET.get('cursor'), key_type)
+    except (TypeError, ValueError):
+        return JsonResponse({'detail': 'Invalid cursor or page size.'}, status=400)
+
+    query = dict(query or {})
+    if after is not None:
+        value, last_id = after
+        value = to_mongo(value)
+        beyond = '$gt' if direction == ASCENDING else '$lt'
+        query['$or'] = [{key: {beyond: value}}, {key: value, 'id': {beyond: last_id}}]
+
+    database = mongo.get_async_database()
+    cursor = database[collection].find(query).sort([(key, direction), ('id', direction)])
+    documents = await cursor.limit(page_size + 1).to_list(page_size + 1)
+
+    next_url = None
+    if len(documents) > page_size:
+        documents = documents[:page_size]
+        last = documents[-1]
+        params = request.GET.copy()
+        params['cursor'] = encode_cursor(last[key], last['id'])
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+    return JsonResponse({'next': next_url, 'results': await to_rows(database, documents)})
+
+
+async def _detail(collection, pk, to_rows):
+    database = mongo.get_async_database()
+    document = await database[collection].find_one({'id': pk})
+    if document is None:
+        raise Http404
+    rows = await to_rows(database, [document])
+    return JsonResponse(rows[0])
+
+
+async def _leaderboard_rows(database, documents):
+    user_names = await _names(database, 'users', (document['user_id'] for document in documents))
+    team_names = await _names(database, 'teams', (document['team_id'] for document in documents))
+    return [
+        {
+            'id': str(document['id']),
+            'user_id': document['user_id'],
+            'user': user_names.get(str(document['user_id']), 'Unknown User'),
+            'team_id': document['team_id'],
+            'team': team_names.get(str(document['team_id'])),
+            'total_calories': document['total_calories'],
+            'total_activities': document['total_activities'],
+            'total_duration': document['total_duration'],
+            'rank': document['rank'],
+            'updated_at': _isoformat(document.get('updated_at')),
+        }
+        for document in documents
+    ]
+
+
+async def _activity_rows(database, documents):
+    return [
+        {
+            'id': str(document['id']),
+            'user_id': document['user_id'],
+            'activity_type': document['activity_type'],
+            'duration': document['duration'],
+            'distance': document.get('distance'),
+            'calories': document['calories'],
+            'date': _isoformat(document['date']),
+            'created_at': _isoformat(document.get('created_at')),
+        }
+        for document in documents
+    ]
+
+
+async def _workout_rows(database, documents):
+    return [
+        {
+            'id': str(document['id']),
+            'name': document['name'],
+            'description': document['description'],
+            'activity_type': document['activity_type'],
+            'difficulty': document['difficulty'],
+            'duration': document['duration'],
+            'calories_per_session': document['calories_per_session'],
+            'created_at': _isoformat(document.get('created_at')),
+        }
+        for document in documents
+    ]
+
+
+async def _names(database, collection, ids):
+    pks = set()
+    for value in ids:
+        try:
+            pks.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    if not pks:
+        return {}
+    cursor = database[collection].find({'id': {'$in': list(pks)}}, {'id': 1, 'name': 1})
+    return {str(document['id']): document['name'] for document in await cursor.to_list(None)}
+
+
+def _isoformat(value):
+    # pymongo returns naive UTC datetimes; render them like DRF does
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
@@ -0,0 +1,148 @@
+"""
+Load-testing harness for the REST API.
+
+Every endpoint is first requested once on a cold response cache to count
+its database queries, then driven by concurrent in-process clients to
+measure latency percentiles and throughput. Results are plain dicts that
+can be saved as a JSON baseline and compared against later runs.
+"""
+import datetime
+import itertools
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .caching import reset_response_cache
+from .models import User
+
+
+def _activity_payload(rng, user_ids):
+    return {
+        'user_id': rng.choice(user_ids),
+        'activity_type': 'Running',
+        'duration': rng.randint(20, 90),
+        'calories': rng.randint(100, 900),
+        # A random minute of the year, so posts aren't rejected as resubmissions
+        'date': (datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+                 + datetime.timedelta(minutes=rng.randrange(365 * 24 * 60))).isoformat(),
+    }
+
+
+# name -> (method, path, payload factory)
+ENDPOINTS = {
+    'users': ('get', '/api/users/', None),
+    'teams': ('get', '/api/teams/', None),
+    'activities': ('get', '/api/activities/', None),
+    'leaderboard': ('get', '/api/leaderboard/', None),
+    'workouts': ('get', '/api/workouts/', None),
+    'activity-create': ('post', '/api/activities/', _activity_payload),
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def _client():
+    return Client(SERVER_NAME='localhost')
+
+
+def _send(client, method, path, payload):
+    if payload is None:
+        return getattr(client, method)(path)
+    return getattr(client, method)(path, payload, content_type='application/json')
+
+
+def count_queries(method, path, payload=None):
+    reset_response_cache()
+    with CaptureQueriesContext(connection) as queries:
+        response = _send(_client(), method, path, payload)
+    return len(queries), response.status_code
+
+
+def drive(method, path, payloads, concurrency):
+    """Send one request per payload; return latencies (seconds) and error count."""
+    def worker(chunk):
+        client = _client()
+        latencies, errors = [], 0
+        try:
+            for payload in chunk:
+                started = time.perf_counter()
+                response = _send(client, method, path, payload)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+        finally:
+            if concurrency > 1:
+                connections.close_all()
+        return latencies, errors
+
+    chunks = [payloads[index::concurrency] for index in range(concurrency)]
+    if concurrency == 1:
+        results = [worker(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, chunks))
+    latencies = sorted(itertools.chain.from_iterable(latencies for latencies, _ in results))
+    return latencies, sum(errors for _, errors in results)
+
+
+def run(requests=100, concurrency=4, endpoints=None, seed=0):
+    rng = random.Random(seed)
+    user_ids = [str(pk) for pk in User.objects.values_list('pk', flat=True)[:1000]]
+    results = {}
+    for name in endpoints or ENDPOINTS:
+        method, path, make_payload = ENDPOINTS[name]
+        if make_payload is not None and not user_ids:
+            continue
+        payloads = [
+            make_payload(rng, user_ids) if make_payload else None for _ in range(requests)
+        ]
+        queries, status_code = count_queries(method, path, payloads[0])
+
+        started = time.perf_counter()
+        latencies, errors = drive(method, path, payloads, concurrency)
+        elapsed = time.perf_counter() - started
+
+        results[name] = {
+            'status': status_code,
+            'queries': queries,
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'mean_ms': round(1000 * sum(latencies) / len(latencies), 3),
+            'p50_ms': round(1000 * percentile(latencies, 0.50), 3),
+            'p95_ms': round(1000 * percentile(latencies, 0.95), 3),
+            'p99_ms': round(1000 * percentile(latencies, 0.99), 3),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Return human-readable regressions of ``results`` against ``baseline``:
+    any increase in query count, or a p95 latency more than ``tolerance``
+    above the baseline.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f"{name}: {current['queries']} queries (baseline {previous['queries']})"
+            )
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']}ms (baseline {previous['p95_ms']}ms)"
+            )
+    return regressions
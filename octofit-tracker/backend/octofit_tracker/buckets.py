@@ -0,0 +1,127 @@
+"""
+Per-user, per-day activity totals backing the rolling-window leaderboards.
+
+A window ranking sums at most one bucket per user and day instead of
+scanning ``activities`` by date. Buckets older than the longest window are
+compacted away as writes come in.
+"""
+import datetime
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ActivityDayBucket
+
+WINDOWS = {
+    'day': 1,
+    'week': 7,
+    'month': 30,
+}
+
+COMPACT_INTERVAL_SECONDS = 3600
+
+_last_compacted = None
+_compact_lock = threading.Lock()
+
+
+def retention_days():
+    return getattr(settings, 'OCTOFIT_BUCKET_RETENTION_DAYS', max(WINDOWS.values()))
+
+
+def window_start(window, today=None):
+    today = today or timezone.localdate()
+    return today - datetime.timedelta(days=WINDOWS[window] - 1)
+
+
+def activity_day(activity):
+    date = activity.date
+    if isinstance(date, datetime.datetime):
+        return timezone.localdate(date) if timezone.is_aware(date) else date.date()
+    return date
+
+
+def bucket_deltas(activities, sign=1, deltas=None):
+    """
+    Fold activities into ``{(user_id, day): [calories, activities, duration]}``,
+    skipping days that are already past retention.
+    """
+    if deltas is None:
+        deltas = defaultdict(lambda: [0, 0, 0])
+    oldest = timezone.localdate() - datetime.timedelta(days=retention_days() - 1)
+    for activity in activities:
+        day = activity_day(activity)
+        if day < oldest:
+            continue
+        delta = deltas[(str(activity.user_id), day)]
+        delta[0] += sign * activity.calories
+        delta[1] += sign
+        delta[2] += sign * activity.duration
+    return deltas
+
+
+def day_totals(activities):
+    """
+    Sum the activities of the queryset ``activities`` per user and day,
+    like ``bucket_deltas``, reading only those within retention.
+    """
+    oldest = timezone.localdate() - datetime.timedelta(days=retention_days() - 1)
+    start = timezone.make_aware(datetime.datetime.combine(oldest, datetime.time()))
+    activities = activities.filter(date__gte=start).only('user_id', 'date', 'calories', 'duration')
+    return bucket_deltas(activities.iterator())
+
+
+def apply_bucket_deltas(deltas):
+    with transaction.atomic():
+        for (user_id, day), (calories, activities, duration) in deltas.items():
+            if not (calories or activities or duration):
+                continue
+            bucket, _ = ActivityDayBucket.objects.get_or_create(user_id=user_id, day=day)
+            bucket.total_calories += calories
+            bucket.total_activities += activities
+            bucket.total_duration += duration
+            if bucket.total_activities <= 0:
+                bucket.delete()
+            else:
+                bucket.save()
+    compact_if_due()
+
+
+def compact(today=None):
+    """Delete the buckets that no window can reach any more."""
+    today = today or timezone.localdate()
+    oldest = today - datetime.timedelta(days=retention_days() - 1)
+    deleted, _ = ActivityDayBucket.objects.filter(day__lt=oldest).delete()
+    return deleted
+
+
+def compact_if_due():
+    global _last_compacted
+    now = time.monotonic()
+    with _compact_lock:
+        if _last_compacted is not None and now - _last_compacted < COMPACT_INTERVAL_SECONDS:
+            return
+        _last_compacted = now
+    compact()
+
+
+def window_ranking(window, limit, today=None):
+    """
+    Return the top ``limit`` users of a rolling window as
+    ``user_id``/totals/``rank`` dicts, largest calorie total first.
+    """
+    rows = (
+        ActivityDayBucket.objects.filter(day__gte=window_start(window, today))
+        .values('user_id')
+        .annotate(
+            total_calories=Sum('total_calories'),
+            total_activities=Sum('total_activities'),
+            total_duration=Sum('total_duration'),
+        )
+        .order_by('-total_calories', 'user_id')[:limit]
+    )
+    return [dict(row, rank=rank) for rank, row in enumerate(rows, start=1)]
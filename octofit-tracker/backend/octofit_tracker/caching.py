@@ -0,0 +1,195 @@
+"""
+In-process caches shared by the API.
+"""
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+from . import mongo
+
+
+class TTLCache:
+    """
+    Thread-safe LRU mapping bounded to ``maxsize`` entries, each of which
+    expires ``ttl`` seconds after it was stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires <= self.timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalGenerations:
+    """Per-process generation counters: only this worker sees its bumps."""
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, label):
+        return self._generations.get(label, 0)
+
+    def bump(self, label):
+        with self._lock:
+            self._generations[label] = self._generations.get(label, 0) + 1
+
+
+class MongoGenerations:
+    """Generation counters in a MongoDB collection, so every worker sees each bump."""
+
+    def __init__(self, collection='response_cache_generations'):
+        self.collection = collection
+
+    def get(self, label):
+        document = mongo.get_database()[self.collection].find_one({'label': label}, {'generation': 1})
+        return document['generation'] if document else 0
+
+    def bump(self, label):
+        mongo.get_database()[self.collection].update_one(
+            {'label': label}, {'$inc': {'generation': 1}}, upsert=True
+        )
+
+
+GENERATION_STORES = {
+    'local': LocalGenerations,
+    'mongo': MongoGenerations,
+}
+
+
+class LocalResponseCache:
+    """
+    Per-process response cache backed by a ``TTLCache``.
+
+    A write in one worker has to invalidate the entries of all of them, so
+    ``generations`` defaults to ``mongo`` when the database is MongoDB;
+    ``local`` counters only suit a single process.
+    """
+
+    def __init__(self, max_entries=512, timeout=300, generations=None):
+        from django.conf import settings
+        self._entries = TTLCache(maxsize=max_entries, ttl=timeout)
+        if generations is None:
+            uses_mongo = settings.DATABASES['default']['ENGINE'] == 'djongo'
+            generations = 'mongo' if uses_mongo else 'local'
+        self._generations = GENERATION_STORES[generations]()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+    def generation(self, label):
+        return self._generations.get(label)
+
+    def bump(self, label):
+        self._generations.bump(label)
+
+
+class DjangoResponseCache:
+    """Response cache stored in one of the ``CACHES`` so it is shared between workers."""
+
+    def __init__(self, alias='default', timeout=300, prefix='octofit'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.cache.get(f'{self.prefix}:response:{key}')
+
+    def set(self, key, value):
+        self.cache.set(f'{self.prefix}:response:{key}', value, self.timeout)
+
+    def generation(self, label):
+        return self.cache.get_or_set(f'{self.prefix}:generation:{label}', 0, None)
+
+    def bump(self, label):
+        key = f'{self.prefix}:generation:{label}'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, None)
+
+
+RESPONSE_CACHE_BACKENDS = {
+    'local': LocalResponseCache,
+    'django': DjangoResponseCache,
+}
+
+_response_cache = None
+
+
+def get_response_cache():
+    """
+    Return the response cache configured by ``OCTOFIT_RESPONSE_CACHE``.
+
+    ``BACKEND`` is ``local``, ``django`` or the dotted path of a class with
+    the same interface; the remaining options its constructor takes are
+    passed to it, so switching backends doesn't require editing the others'
+    options out.
+    """
+    global _response_cache
+    if _response_cache is None:
+        from django.conf import settings
+        from django.utils.module_loading import import_string
+        options = {
+            key.lower(): value
+            for key, value in getattr(settings, 'OCTOFIT_RESPONSE_CACHE', {}).items()
+        }
+        backend = options.pop('backend', 'local')
+        backend_class = RESPONSE_CACHE_BACKENDS.get(backend) or import_string(backend)
+        _response_cache = backend_class(**_accepted_options(backend_class, options))
+    return _response_cache
+
+
+def _accepted_options(backend_class, options):
+    parameters = inspect.signature(backend_class).parameters.values()
+    if any(parameter.kind is parameter.VAR_KEYWORD for parameter in parameters):
+        return options
+    names = {parameter.name for parameter in parameters}
+    return {key: value for key, value in options.items() if key in names}
+
+
+def reset_response_cache():
+    global _response_cache
+    _response_cache = None
+
+
+def invalidate_model(model):
+    """Invalidate every cached response that depends on ``model``."""
+    get_response_cache().bump(model._meta.label_lower)
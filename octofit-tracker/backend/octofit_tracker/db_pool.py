@@ -0,0 +1,119 @@
+"""
+Connection pool metrics for the pymongo clients.
+
+``pool_listener`` is registered on every client through the ``CLIENT``
+options in settings, so it sees the pools of djongo and the native Mongo
+paths alike. Metrics are per process.
+"""
+import threading
+from collections import Counter
+
+from pymongo import monitoring
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._pools = {}
+
+    def _pool(self, address):
+        key = '%s:%s' % address
+        if key not in self._pools:
+            self._pools[key] = {
+                'open': 0,
+                'checked_out': 0,
+                'peak_checked_out': 0,
+                'created': 0,
+                'closed': 0,
+                'checkouts': 0,
+                'checkout_failures': Counter(),
+                'cleared': 0,
+            }
+        return self._pools[key]
+
+    def _update(self, address, **changes):
+        with self._lock:
+            pool = self._pool(address)
+            for name, delta in changes.items():
+                pool[name] += delta
+            pool['peak_checked_out'] = max(pool['peak_checked_out'], pool['checked_out'])
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        self._update(event.address)
+
+    def connection_created(self, event):
+        self._update(event.address, created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._pool(event.address)['checkout_failures'][event.reason] += 1
+
+    def connection_checked_out(self, event):
+        self._update(event.address, checkouts=1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def snapshot(self):
+        """Return the current metrics of every pool, keyed by ``host:port``."""
+        with self._lock:
+            return {
+                address: dict(pool, checkout_failures=dict(pool['checkout_failures']))
+                for address, pool in self._pools.items()
+            }
+
+
+pool_listener = PoolMetricsListener()
+
+
+# Environment variable -> (MongoClient option, type)
+CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGO_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGO_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGO_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGO_COMPRESSORS': ('compressors', str),
+    'MONGO_ZLIB_COMPRESSION_LEVEL': ('zlibCompressionLevel', int),
+    'MONGO_APPNAME': ('appname', str),
+}
+
+
+def client_options(environ, read_preference=None):
+    """
+    Build MongoClient keyword arguments from ``environ``.
+
+    Options whose variable is unset keep the pymongo default.
+    """
+    options = {
+        'host': environ.get('MONGO_HOST', 'localhost'),
+        'port': int(environ.get('MONGO_PORT', 27017)),
+        'event_listeners': [pool_listener],
+    }
+    for variable, (option, cast) in CLIENT_OPTIONS.items():
+        if environ.get(variable):
+            options[option] = cast(environ[variable])
+    if read_preference:
+        options['readPreference'] = read_preference
+    return options
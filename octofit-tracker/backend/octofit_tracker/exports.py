@@ -0,0 +1,57 @@
+"""
+Constant-memory CSV and NDJSON exports.
+
+Rows are read with a server-side cursor and encoded one at a time, so the
+size of an export is bounded by the output stream rather than by memory.
+"""
+import csv
+import datetime
+import json
+
+ACTIVITY_FIELDS = [
+    'id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date', 'created_at'
+]
+LEADERBOARD_FIELDS = [
+    'id', 'user_id', 'team_id', 'total_calories', 'total_activities', 'total_duration',
+    'rank', 'updated_at'
+]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose ``write`` returns the value instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(queryset, fields, export_format, chunk_size=2000):
+    """Yield the encoded lines of an export of ``queryset``."""
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    if export_format == 'csv':
+        return _csv_lines(rows, fields)
+    if export_format == 'ndjson':
+        return _ndjson_lines(rows, fields)
+    raise ValueError(f'Unknown export format: {export_format}')
+
+
+def _csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def _ndjson_lines(rows, fields):
+    for row in rows:
+        yield json.dumps({field: _plain(value) for field, value in zip(fields, row)}) + '\n'
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
@@ -0,0 +1,176 @@
+"""
+Duplicate detection for activity submissions.
+
+Every activity stores the ``content_hash`` of its user, type, date and
+duration under a unique index. Before inserting, the API looks the hash up
+in a per-process Bloom filter of the hashes written in the last
+``OCTOFIT_IDEMPOTENCY['FILTER_WINDOW_HOURS']``, where resubmissions
+cluster: a miss skips the database lookup and goes straight to the insert,
+a hit is confirmed against the index. The index stays the source of truth,
+so older rows and rows written by other processes only cost an insert that
+fails and resolves to the stored row. The filter grows as hashes are added
+instead of being reloaded.
+
+Requests carrying an ``Idempotency-Key`` header also record the activity
+they created, so a retry with the same key gets it back. Keys older than
+``OCTOFIT_IDEMPOTENCY['KEY_TTL_HOURS']`` are pruned.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+PRUNE_INTERVAL_SECONDS = 3600
+
+_filter = None
+_filter_lock = threading.Lock()
+_last_pruned = None
+_prune_lock = threading.Lock()
+
+
+class BloomFilter:
+    """
+    Thread-safe Bloom filter of strings, sized for ``capacity`` items at a
+    false positive rate of ``error_rate``.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hash_count)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        return self._count
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows instead of saturating: once the newest stage
+    holds its capacity, a stage twice as large at half the error rate takes
+    the next items. Lookups check every stage, which keeps the overall
+    false positive rate under ``error_rate``.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self._stages = [BloomFilter(capacity, error_rate / 2)]
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        with self._lock:
+            stage = self._stages[-1]
+            if len(stage) >= stage.capacity:
+                stage = BloomFilter(stage.capacity * 2, stage.error_rate / 2)
+                self._stages.append(stage)
+        stage.add(item)
+
+    def __contains__(self, item):
+        return any(item in stage for stage in self._stages)
+
+    def __len__(self):
+        return sum(len(stage) for stage in self._stages)
+
+
+def _config():
+    return getattr(settings, 'OCTOFIT_IDEMPOTENCY', {})
+
+
+def content_filter(repository):
+    """The process's filter of recently written hashes, loaded on first use."""
+    global _filter
+    with _filter_lock:
+        if _filter is None:
+            config = _config()
+            since = timezone.now() - datetime.timedelta(hours=config.get('FILTER_WINDOW_HOURS', 72))
+            bloom = ScalableBloomFilter(
+                config.get('FILTER_CAPACITY', 100000), config.get('FILTER_ERROR_RATE', 0.01)
+            )
+            for content_hash in repository.activity_hashes(since):
+                bloom.add(content_hash)
+            _filter = bloom
+        return _filter
+
+
+def find_duplicates(repository, content_hashes):
+    """``{content_hash: activity}`` of the stored activities among ``content_hashes``."""
+    bloom = content_filter(repository)
+    candidates = [content_hash for content_hash in content_hashes if content_hash in bloom]
+    if not candidates:
+        return {}
+    return repository.activities_by_hash(candidates)
+
+
+def find_duplicate(repository, content_hash):
+    return find_duplicates(repository, [content_hash]).get(content_hash)
+
+
+def remember(content_hashes):
+    """Add newly stored hashes to the filter, if it is loaded."""
+    with _filter_lock:
+        bloom = _filter
+    if bloom is None:
+        return
+    for content_hash in content_hashes:
+        bloom.add(content_hash)
+
+
+def reset():
+    global _filter
+    with _filter_lock:
+        _filter = None
+
+
+def recorded_key(key):
+    """The ``IdempotencyKey`` recorded for ``key``, if any."""
+    return IdempotencyKey.objects.filter(key=key).first()
+
+
+def record_key(key, content_hash, activity_id):
+    # Re-pointed when the activity the key created was deleted
+    IdempotencyKey.objects.update_or_create(
+        key=key, defaults={'content_hash': content_hash, 'activity_id': str(activity_id)}
+    )
+    prune_if_due()
+
+
+def prune(now=None):
+    """Delete the keys older than the retention window."""
+    oldest = (now or timezone.now()) - datetime.timedelta(hours=_config().get('KEY_TTL_HOURS', 24))
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=oldest).delete()
+    return deleted
+
+
+def prune_if_due():
+    global _last_pruned
+    now = time.monotonic()
+    with _prune_lock:
+        if _last_pruned is not None and now - _last_pruned < PRUNE_INTERVAL_SECONDS:
+            return
+        _last_pruned = now
+    prune()
@@ -0,0 +1,295 @@
+"""
+Incremental maintenance of the leaderboard and team standings.
+
+Activity writes are turned into per-user deltas that are added to the
+existing ``Leaderboard`` totals and to the ``TeamStanding`` of the user's
+team. Only the entries whose rank actually changes are touched when
+re-ranking, so a single workout never triggers a scan of the
+``activities`` collection.
+
+Totals are read, changed and written back, and ranks are shifted row by
+row, so writers to the same board run one at a time (see ``serialized``).
+"""
+import threading
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import buckets, mongo
+from .models import Leaderboard, Team, TeamStanding, User
+from .realtime import broadcaster
+
+_state = threading.local()
+
+
+def activity_deltas(activities, sign=1, deltas=None):
+    """
+    Fold activities into ``{user_id: [calories, activities, duration]}``.
+
+    Use ``sign=-1`` for activities that are being removed. Pass an existing
+    ``deltas`` mapping to accumulate several batches before applying them.
+    """
+    if deltas is None:
+        deltas = defaultdict(lambda: [0, 0, 0])
+    for activity in activities:
+        delta = deltas[str(activity.user_id)]
+        delta[0] += sign * activity.calories
+        delta[1] += sign
+        delta[2] += sign * activity.duration
+    return deltas
+
+
+def record_activities_created(activities):
+    activities = list(activities)
+    buckets.apply_bucket_deltas(buckets.bucket_deltas(activities))
+    return apply_deltas(activity_deltas(activities))
+
+
+def record_activity_created(activity):
+    return record_activities_created([activity])
+
+
+def record_activity_updated(old_activity, new_activity):
+    day_deltas = buckets.bucket_deltas([old_activity], sign=-1)
+    buckets.apply_bucket_deltas(buckets.bucket_deltas([new_activity], deltas=day_deltas))
+    deltas = activity_deltas([old_activity], sign=-1)
+    return apply_deltas(activity_deltas([new_activity], deltas=deltas))
+
+
+def record_activity_deleted(activity):
+    buckets.apply_bucket_deltas(buckets.bucket_deltas([activity], sign=-1))
+    return apply_deltas(activity_deltas([activity], sign=-1))
+
+
+def apply_deltas(deltas):
+    """
+    Apply per-user deltas to the leaderboard and re-rank the affected window.
+
+    Returns the list of ``Leaderboard`` entries whose totals changed. When
+    clients are listening, the rank/total diffs are published on commit.
+    """
+    changed = []
+    shifted = [] if broadcaster.has_subscribers() else None
+    team_deltas = team_member_deltas()
+    with serialized(Leaderboard):
+        for user_id, (calories, activities, duration) in deltas.items():
+            if not (calories or activities or duration):
+                continue
+            entry = _entry_for(user_id)
+            old_calories = entry.total_calories
+            entry.total_calories += calories
+            entry.total_activities += activities
+            entry.total_duration += duration
+            entry.rank = rerank(Leaderboard, entry, old_calories, shifted)
+            entry.save()
+            changed.append(entry)
+            _add_team_delta(team_deltas, entry.team_id, calories, activities, duration)
+        apply_team_deltas(team_deltas)
+        if shifted is not None and changed:
+            diffs = _diffs(changed, shifted)
+            transaction.on_commit(lambda: broadcaster.publish(diffs))
+    return changed
+
+
+def membership_tracked():
+    return not getattr(_state, 'suppressed', False)
+
+
+@contextmanager
+def membership_untracked():
+    """Leave team standings alone for user writes in this block, e.g. when wiping a collection."""
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def team_member_deltas():
+    """Empty ``{team_id: [calories, activities, duration, members]}`` mapping."""
+    return defaultdict(lambda: [0, 0, 0, 0])
+
+
+def record_users_created(users):
+    deltas = team_member_deltas()
+    for user in users:
+        _add_team_delta(deltas, user.team_id, members=1)
+    return apply_team_deltas(deltas)
+
+
+def record_user_moved(user, old_team_id):
+    """Move the user's totals and membership when they change team."""
+    if (old_team_id or '') == (user.team_id or ''):
+        return []
+    with serialized(Leaderboard):
+        entry = Leaderboard.objects.filter(user_id=str(user.pk)).first()
+        totals = (0, 0, 0)
+        if entry is not None:
+            totals = (entry.total_calories, entry.total_activities, entry.total_duration)
+            entry.team_id = user.team_id or ''
+            entry.save(update_fields=['team_id', 'updated_at'])
+        deltas = team_member_deltas()
+        _add_team_delta(deltas, old_team_id, *(-total for total in totals), members=-1)
+        _add_team_delta(deltas, user.team_id, *totals, members=1)
+        return apply_team_deltas(deltas)
+
+
+def record_user_deleted(user):
+    with serialized(Leaderboard):
+        entry = Leaderboard.objects.filter(user_id=str(user.pk)).first()
+        totals = (0, 0, 0)
+        if entry is not None:
+            totals = (entry.total_calories, entry.total_activities, entry.total_duration)
+        deltas = team_member_deltas()
+        _add_team_delta(deltas, user.team_id, *(-total for total in totals), members=-1)
+        return apply_team_deltas(deltas)
+
+
+def apply_team_deltas(deltas):
+    """
+    Apply per-team deltas to the team standings and re-rank the affected
+    window. Returns the list of ``TeamStanding`` rows that changed.
+    """
+    changed = []
+    with serialized(TeamStanding):
+        _touch_teams(team_id for team_id, delta in deltas.items() if delta[3])
+        for team_id, (calories, activities, duration, members) in deltas.items():
+            if not (calories or activities or duration or members):
+                continue
+            standing = _standing_for(team_id)
+            old_calories = standing.total_calories
+            standing.total_calories += calories
+            standing.total_activities += activities
+            standing.total_duration += duration
+            standing.member_count += members
+            standing.average_calories = average_per_member(
+                standing.total_calories, standing.member_count
+            )
+            standing.rank = rerank(TeamStanding, standing, old_calories)
+            standing.save()
+            changed.append(standing)
+    return changed
+
+
+@contextmanager
+def serialized(model):
+    """
+    Run the block as the only writer of ``model``'s totals and ranks.
+
+    djongo doesn't support transactions, so ``atomic()`` isolates nothing
+    there and concurrent writers would lose deltas and leave duplicate or
+    skipped ranks; they take a lock in MongoDB instead. Re-entrant within
+    a thread.
+    """
+    held = _state.__dict__.setdefault('serialized', set())
+    name = model._meta.db_table
+    with ExitStack() as stack:
+        if name not in held and not connection.features.supports_transactions:
+            stack.enter_context(mongo.lock(f'{name}_updates'))
+            held.add(name)
+            stack.callback(held.discard, name)
+        stack.enter_context(transaction.atomic())
+        yield
+
+
+def average_per_member(total, member_count):
+    return total / member_count if member_count > 0 else 0
+
+
+def rerank(model, entry, old_calories, shifted=None):
+    """
+    Shift the ranks of the entries between the old and new position of
+    ``entry`` and return its new rank.
+
+    If ``shifted`` is a list, the user ids of the shifted entries are
+    appended to it.
+
+    Ranks are assumed to be contiguous and ordered by ``-total_calories``.
+    An entry moving up is placed below existing entries with equal totals,
+    an entry moving down is placed above them, so ties keep their order.
+    """
+    new_calories = entry.total_calories
+    if new_calories > old_calories:
+        window = model.objects.filter(rank__lt=entry.rank, total_calories__lt=new_calories)
+        step = 1
+    elif new_calories < old_calories:
+        window = model.objects.filter(rank__gt=entry.rank, total_calories__gt=new_calories)
+        step = -1
+    else:
+        return entry.rank
+    if shifted is not None:
+        shifted.extend(window.values_list('user_id', flat=True))
+    # djongo can't translate UPDATE ... SET rank = rank + 1, so each shifted
+    # entry gets its new rank as a literal. update() skips auto_now, but
+    # shifted entries must show up in delta syncs
+    now = timezone.now()
+    ranks = list(window.values_list('pk', 'rank'))
+    for pk, rank in ranks:
+        model.objects.filter(pk=pk).update(rank=rank + step, updated_at=now)
+    return entry.rank - step * len(ranks)
+
+
+def _diffs(changed, shifted):
+    # Re-read the final state: an entry updated early in a batch may have
+    # been shifted again by a later one
+    totals_changed = {entry.user_id for entry in changed}
+    rows = Leaderboard.objects.filter(user_id__in=totals_changed | set(shifted)).values(
+        'user_id', 'team_id', 'rank', 'total_calories', 'total_activities', 'total_duration'
+    )
+    diffs = []
+    for row in rows:
+        if row['user_id'] not in totals_changed:
+            row = {key: row[key] for key in ('user_id', 'team_id', 'rank')}
+        diffs.append(row)
+    return diffs
+
+
+def _add_team_delta(deltas, team_id, calories=0, activities=0, duration=0, members=0):
+    if not team_id:
+        return
+    delta = deltas[team_id]
+    delta[0] += calories
+    delta[1] += activities
+    delta[2] += duration
+    delta[3] += members
+
+
+def _touch_teams(team_ids):
+    # A team's member count is part of its representation, so delta sync
+    # has to see the team as changed
+    team_ids = [team_id for team_id in team_ids if str(team_id).isdigit()]
+    if team_ids:
+        Team.objects.filter(pk__in=team_ids).update(updated_at=timezone.now())
+
+
+def _standing_for(team_id):
+    standing = TeamStanding.objects.filter(team_id=team_id).first()
+    if standing is None:
+        standing = TeamStanding.objects.create(
+            team_id=team_id,
+            rank=TeamStanding.objects.count() + 1,
+        )
+    return standing
+
+
+def _entry_for(user_id):
+    entry = Leaderboard.objects.filter(user_id=user_id).first()
+    if entry is None:
+        # New users start at the bottom with empty totals
+        entry = Leaderboard.objects.create(
+            user_id=user_id,
+            team_id=_team_for(user_id),
+            rank=Leaderboard.objects.count() + 1,
+        )
+    return entry
+
+
+def _team_for(user_id):
+    try:
+        team_id = User.objects.filter(pk=user_id).values_list('team_id', flat=True).first()
+    except (ValueError, TypeError):
+        team_id = None
+    return team_id or ''
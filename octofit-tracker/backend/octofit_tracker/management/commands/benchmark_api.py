@@ -0,0 +1,80 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from octofit_tracker import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the REST API endpoints and compare the results with a JSON baseline '
+        '(set OCTOFIT_DB=sqlite to run without a MongoDB server)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints', choices=list(benchmark.ENDPOINTS),
+            help='Endpoint to benchmark (repeatable, default: all)',
+        )
+        parser.add_argument(
+            '--seed-users', type=int,
+            help='Replace the database contents with a synthetic dataset of this many users first',
+        )
+        parser.add_argument('--activities-per-user', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Fail if results regress against this JSON file')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed relative p95 slowdown against the baseline (default: 0.25)',
+        )
+
+    def handle(self, *args, **options):
+        if options['seed_users']:
+            self.stdout.write(f"Seeding {options['seed_users']} users...")
+            call_command(
+                'populate_db', users=options['seed_users'],
+                activities_per_user=options['activities_per_user'], seed=options['seed'],
+                stdout=StringIO(),
+            )
+
+        results = benchmark.run(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            endpoints=options['endpoints'],
+            seed=options['seed'],
+        )
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'seed_users': options['seed_users'],
+                'activities_per_user': options['activities_per_user'],
+            },
+            'endpoints': results,
+        }
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:16} p50 {result['p50_ms']:>9}ms  p95 {result['p95_ms']:>9}ms  "
+                f"p99 {result['p99_ms']:>9}ms  {result['throughput_rps']:>9} req/s  "
+                f"{result['queries']} queries  {result['errors']} errors"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)['endpoints']
+            regressions = benchmark.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
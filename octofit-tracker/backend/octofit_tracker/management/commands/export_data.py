@@ -0,0 +1,57 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from octofit_tracker.exports import ACTIVITY_FIELDS, LEADERBOARD_FIELDS, export_lines
+from octofit_tracker.models import Activity, Leaderboard
+from octofit_tracker.stats import filter_activities
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Stream activities or leaderboard entries to CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection', choices=['activities', 'leaderboard'])
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv', dest='export_format')
+        parser.add_argument('--start', type=parse_moment, help='Only activities on or after this date')
+        parser.add_argument('--end', type=parse_moment, help='Only activities before this date')
+        parser.add_argument('--user', dest='user_id', help='Only rows for this user id')
+        parser.add_argument('--team', dest='team_id', help='Only leaderboard rows for this team id')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['collection'] == 'activities':
+            queryset = filter_activities(
+                Activity.objects.order_by('date', 'id'),
+                start=options['start'], end=options['end'], user_id=options['user_id'],
+            )
+            fields = ACTIVITY_FIELDS
+        else:
+            queryset = Leaderboard.objects.order_by('rank', 'id')
+            if options['user_id']:
+                queryset = queryset.filter(user_id=options['user_id'])
+            if options['team_id']:
+                queryset = queryset.filter(team_id=options['team_id'])
+            fields = LEADERBOARD_FIELDS
+
+        lines = export_lines(queryset, fields, options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
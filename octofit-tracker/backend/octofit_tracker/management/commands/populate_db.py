@@ -1,24 +1,162 @@
-from django.core.management.base import BaseCommand
-from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
-from datetime import datetime, timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from octofit_tracker.buckets import bucket_deltas
+from octofit_tracker.leaderboard import average_per_member, membership_untracked
+from octofit_tracker.models import (
+    User, Team, Activity, ActivityDayBucket, IdempotencyKey, Leaderboard, TeamStanding, Tombstone,
+    Workout
+)
+from octofit_tracker.passwords import hash_passwords
+from octofit_tracker.realtime import broadcaster
+from octofit_tracker.sync import tombstones_suppressed
+from octofit_tracker.utils import batched
+from datetime import timedelta
 import random
 
 
+MARVEL_HEROES = [
+    {'name': 'Iron Man', 'email': 'tony.stark@marvel.com', 'password': 'ironman123'},
+    {'name': 'Captain America', 'email': 'steve.rogers@marvel.com', 'password': 'cap123'},
+    {'name': 'Thor', 'email': 'thor.odinson@marvel.com', 'password': 'thor123'},
+    {'name': 'Black Widow', 'email': 'natasha.romanoff@marvel.com', 'password': 'widow123'},
+    {'name': 'Hulk', 'email': 'bruce.banner@marvel.com', 'password': 'hulk123'},
+    {'name': 'Spider-Man', 'email': 'peter.parker@marvel.com', 'password': 'spidey123'},
+]
+
+DC_HEROES = [
+    {'name': 'Superman', 'email': 'clark.kent@dc.com', 'password': 'superman123'},
+    {'name': 'Batman', 'email': 'bruce.wayne@dc.com', 'password': 'batman123'},
+    {'name': 'Wonder Woman', 'email': 'diana.prince@dc.com', 'password': 'wonder123'},
+    {'name': 'Flash', 'email': 'barry.allen@dc.com', 'password': 'flash123'},
+    {'name': 'Aquaman', 'email': 'arthur.curry@dc.com', 'password': 'aquaman123'},
+    {'name': 'Green Lantern', 'email': 'hal.jordan@dc.com', 'password': 'lantern123'},
+]
+
+WORKOUTS = [
+    {
+        'name': 'Super Soldier Training',
+        'description': 'Intense full-body workout inspired by Captain America',
+        'activity_type': 'Strength Training',
+        'difficulty': 'Hard',
+        'duration': 60,
+        'calories_per_session': 500
+    },
+    {
+        'name': 'Web-Slinger Cardio',
+        'description': 'High-intensity cardio workout like Spider-Man',
+        'activity_type': 'Running',
+        'difficulty': 'Medium',
+        'duration': 45,
+        'calories_per_session': 400
+    },
+    {
+        'name': 'Asgardian Hammer Lift',
+        'description': 'Heavy lifting workout worthy of Thor',
+        'activity_type': 'Weight Lifting',
+        'difficulty': 'Hard',
+        'duration': 50,
+        'calories_per_session': 450
+    },
+    {
+        'name': 'Speed Force Sprint',
+        'description': 'Lightning-fast interval running workout',
+        'activity_type': 'Running',
+        'difficulty': 'Hard',
+        'duration': 30,
+        'calories_per_session': 350
+    },
+    {
+        'name': 'Atlantean Swim',
+        'description': 'Endurance swimming workout like Aquaman',
+        'activity_type': 'Swimming',
+        'difficulty': 'Medium',
+        'duration': 40,
+        'calories_per_session': 380
+    },
+    {
+        'name': 'Bat-Cave Circuit',
+        'description': 'Full-body circuit training in the dark',
+        'activity_type': 'Circuit Training',
+        'difficulty': 'Hard',
+        'duration': 55,
+        'calories_per_session': 480
+    },
+    {
+        'name': 'Amazon Warrior Yoga',
+        'description': 'Flexibility and strength yoga session',
+        'activity_type': 'Yoga',
+        'difficulty': 'Easy',
+        'duration': 35,
+        'calories_per_session': 200
+    },
+    {
+        'name': 'Gamma Rage HIIT',
+        'description': 'High-intensity interval training for explosive power',
+        'activity_type': 'HIIT',
+        'difficulty': 'Hard',
+        'duration': 40,
+        'calories_per_session': 420
+    },
+]
+
+ACTIVITY_TYPES = ['Running', 'Swimming', 'Cycling', 'Weight Lifting', 'Yoga', 'HIIT', 'Circuit Training']
+DISTANCE_TYPES = {'Running', 'Swimming', 'Cycling'}
+
+# Random draws allowed per activity before giving up on distinct content hashes
+MAX_DRAWS_PER_ACTIVITY = 10
+
+SYNTHETIC_PASSWORD = 'octofit123'
+
+
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            help='Generate this many synthetic users instead of the hero roster',
+        )
+        parser.add_argument(
+            '--activities-per-user',
+            type=int,
+            help='Activities to create per user (default: random between 5 and 10)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Seed for the random generator, for reproducible datasets',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of documents written per bulk insert (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
         self.stdout.write('Clearing existing data...')
-        
-        # Delete existing data using Django ORM
-        User.objects.all().delete()
-        Team.objects.all().delete()
-        Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
-        Workout.objects.all().delete()
-        
+
+        # Delete existing data using Django ORM. Sync tokens don't survive a
+        # reseed, so skip the per-row tombstones and drop the old ones; the
+        # team standings are rebuilt below
+        with tombstones_suppressed(), membership_untracked():
+            User.objects.all().delete()
+            Team.objects.all().delete()
+            Activity.objects.all().delete()
+            Leaderboard.objects.all().delete()
+            TeamStanding.objects.all().delete()
+            ActivityDayBucket.objects.all().delete()
+            Workout.objects.all().delete()
+            IdempotencyKey.objects.all().delete()
+        Tombstone.objects.all().delete()
+
         self.stdout.write(self.style.SUCCESS('Existing data cleared!'))
-        
+
         # Create Teams
         self.stdout.write('Creating teams...')
         team_marvel = Team.objects.create(
@@ -30,191 +168,185 @@ class Command(BaseCommand):
             description='Justice League - Defending health and wellness!'
         )
         self.stdout.write(self.style.SUCCESS(f'Created {Team.objects.count()} teams'))
-        
-        # Create Marvel Heroes
-        marvel_heroes = [
-            {'name': 'Iron Man', 'email': 'tony.stark@marvel.com', 'password': 'ironman123'},
-            {'name': 'Captain America', 'email': 'steve.rogers@marvel.com', 'password': 'cap123'},
-            {'name': 'Thor', 'email': 'thor.odinson@marvel.com', 'password': 'thor123'},
-            {'name': 'Black Widow', 'email': 'natasha.romanoff@marvel.com', 'password': 'widow123'},
-            {'name': 'Hulk', 'email': 'bruce.banner@marvel.com', 'password': 'hulk123'},
-            {'name': 'Spider-Man', 'email': 'peter.parker@marvel.com', 'password': 'spidey123'},
-        ]
-        
-        # Create DC Heroes
-        dc_heroes = [
-            {'name': 'Superman', 'email': 'clark.kent@dc.com', 'password': 'superman123'},
-            {'name': 'Batman', 'email': 'bruce.wayne@dc.com', 'password': 'batman123'},
-            {'name': 'Wonder Woman', 'email': 'diana.prince@dc.com', 'password': 'wonder123'},
-            {'name': 'Flash', 'email': 'barry.allen@dc.com', 'password': 'flash123'},
-            {'name': 'Aquaman', 'email': 'arthur.curry@dc.com', 'password': 'aquaman123'},
-            {'name': 'Green Lantern', 'email': 'hal.jordan@dc.com', 'password': 'lantern123'},
-        ]
-        
+
         # Create Users
         self.stdout.write('Creating users...')
-        marvel_users = []
-        for hero in marvel_heroes:
-            user = User.objects.create(
-                name=hero['name'],
-                email=hero['email'],
-                password=hero['password'],
-                team_id=str(team_marvel.id)
-            )
-            marvel_users.append(user)
-        
-        dc_users = []
-        for hero in dc_heroes:
-            user = User.objects.create(
-                name=hero['name'],
-                email=hero['email'],
-                password=hero['password'],
-                team_id=str(team_dc.id)
-            )
-            dc_users.append(user)
-        
-        all_users = marvel_users + dc_users
-        self.stdout.write(self.style.SUCCESS(f'Created {User.objects.count()} users'))
-        
+        if options['users'] is None:
+            users = self.create_heroes(team_marvel, team_dc)
+        else:
+            users = self.create_synthetic_users(options['users'], [team_marvel, team_dc])
+        self.stdout.write(self.style.SUCCESS(f'Created {len(users)} users'))
+
         # Create Workouts
         self.stdout.write('Creating workouts...')
-        workouts_data = [
-            {
-                'name': 'Super Soldier Training',
-                'description': 'Intense full-body workout inspired by Captain America',
-                'activity_type': 'Strength Training',
-                'difficulty': 'Hard',
-                'duration': 60,
-                'calories_per_session': 500
-            },
-            {
-                'name': 'Web-Slinger Cardio',
-                'description': 'High-intensity cardio workout like Spider-Man',
-                'activity_type': 'Running',
-                'difficulty': 'Medium',
-                'duration': 45,
-                'calories_per_session': 400
-            },
-            {
-                'name': 'Asgardian Hammer Lift',
-                'description': 'Heavy lifting workout worthy of Thor',
-                'activity_type': 'Weight Lifting',
-                'difficulty': 'Hard',
-                'duration': 50,
-                'calories_per_session': 450
-            },
-            {
-                'name': 'Speed Force Sprint',
-                'description': 'Lightning-fast interval running workout',
-                'activity_type': 'Running',
-                'difficulty': 'Hard',
-                'duration': 30,
-                'calories_per_session': 350
-            },
-            {
-                'name': 'Atlantean Swim',
-                'description': 'Endurance swimming workout like Aquaman',
-                'activity_type': 'Swimming',
-                'difficulty': 'Medium',
-                'duration': 40,
-                'calories_per_session': 380
-            },
-            {
-                'name': 'Bat-Cave Circuit',
-                'description': 'Full-body circuit training in the dark',
-                'activity_type': 'Circuit Training',
-                'difficulty': 'Hard',
-                'duration': 55,
-                'calories_per_session': 480
-            },
-            {
-                'name': 'Amazon Warrior Yoga',
-                'description': 'Flexibility and strength yoga session',
-                'activity_type': 'Yoga',
-                'difficulty': 'Easy',
-                'duration': 35,
-                'calories_per_session': 200
-            },
-            {
-                'name': 'Gamma Rage HIIT',
-                'description': 'High-intensity interval training for explosive power',
-                'activity_type': 'HIIT',
-                'difficulty': 'Hard',
-                'duration': 40,
-                'calories_per_session': 420
-            },
-        ]
-        
-        for workout_data in workouts_data:
-            Workout.objects.create(**workout_data)
-        
-        self.stdout.write(self.style.SUCCESS(f'Created {Workout.objects.count()} workouts'))
-        
-        # Create Activities
+        Workout.objects.bulk_create([Workout(**workout_data) for workout_data in WORKOUTS])
+        self.stdout.write(self.style.SUCCESS(f'Created {len(WORKOUTS)} workouts'))
+
+        # Create Activities, accumulating leaderboard totals as we go
         self.stdout.write('Creating activities...')
-        activity_types = ['Running', 'Swimming', 'Cycling', 'Weight Lifting', 'Yoga', 'HIIT', 'Circuit Training']
-        
-        for user in all_users:
-            # Create 5-10 activities per user
-            num_activities = random.randint(5, 10)
-            for i in range(num_activities):
-                activity_type = random.choice(activity_types)
-                duration = random.randint(20, 90)
-                distance = random.uniform(2, 15) if activity_type in ['Running', 'Swimming', 'Cycling'] else None
-                calories = duration * random.randint(6, 12)
-                
-                # Create activities from the past 30 days
-                days_ago = random.randint(0, 30)
-                activity_date = datetime.now() - timedelta(days=days_ago)
-                
-                Activity.objects.create(
-                    user_id=str(user.id),
-                    activity_type=activity_type,
-                    duration=duration,
-                    distance=distance,
-                    calories=calories,
-                    date=activity_date
-                )
-        
-        self.stdout.write(self.style.SUCCESS(f'Created {Activity.objects.count()} activities'))
-        
-        # Create Leaderboard entries
+        totals = {user_id: [0, 0, 0] for user_id in users}
+        activities = self.generate_activities(users, options['activities_per_user'], totals)
+        day_totals = None
+        created = 0
+        for batch in batched(activities, self.batch_size):
+            Activity.objects.bulk_create(batch)
+            day_totals = bucket_deltas(batch, deltas=day_totals)
+            created += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Created {created} activities'))
+
+        # Create the per-day buckets behind the windowed leaderboards
+        day_buckets = (
+            ActivityDayBucket(
+                user_id=user_id,
+                day=day,
+                total_calories=calories,
+                total_activities=count,
+                total_duration=duration
+            )
+            for (user_id, day), (calories, count, duration) in (day_totals or {}).items()
+        )
+        for batch in batched(day_buckets, self.batch_size):
+            ActivityDayBucket.objects.bulk_create(batch)
+
+        # Create Leaderboard entries ranked by total calories
         self.stdout.write('Creating leaderboard entries...')
-        for user in all_users:
-            # Calculate totals from activities
-            user_activities = Activity.objects.filter(user_id=str(user.id))
-            total_calories = sum(activity.calories for activity in user_activities)
-            total_activities = user_activities.count()
-            total_duration = sum(activity.duration for activity in user_activities)
-            
-            Leaderboard.objects.create(
-                user_id=str(user.id),
-                team_id=user.team_id,
-                total_calories=total_calories,
-                total_activities=total_activities,
-                total_duration=total_duration,
-                rank=0  # Will be updated based on sorting
+        ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+        entries = (
+            Leaderboard(
+                user_id=user_id,
+                team_id=users[user_id],
+                total_calories=calories,
+                total_activities=count,
+                total_duration=duration,
+                rank=rank
+            )
+            for rank, (user_id, (calories, count, duration)) in enumerate(ranked, start=1)
+        )
+        for batch in batched(entries, self.batch_size):
+            Leaderboard.objects.bulk_create(batch)
+        # Connected clients hold the old leaderboard
+        broadcaster.reset()
+
+        self.stdout.write(self.style.SUCCESS(f'Created {len(ranked)} leaderboard entries'))
+
+        # Create Team standings from the same in-memory totals
+        self.stdout.write('Creating team standings...')
+        team_totals = {}
+        for user_id, (calories, count, duration) in totals.items():
+            team = team_totals.setdefault(users[user_id], [0, 0, 0, 0])
+            team[0] += calories
+            team[1] += count
+            team[2] += duration
+            team[3] += 1
+        standings = sorted(team_totals.items(), key=lambda item: item[1][0], reverse=True)
+        TeamStanding.objects.bulk_create([
+            TeamStanding(
+                team_id=team_id,
+                total_calories=calories,
+                total_activities=count,
+                total_duration=duration,
+                member_count=members,
+                average_calories=average_per_member(calories, members),
+                rank=rank
             )
-        
-        # Update ranks based on total calories
-        leaderboard_entries = Leaderboard.objects.all().order_by('-total_calories')
-        for rank, entry in enumerate(leaderboard_entries, start=1):
-            entry.rank = rank
-            entry.save()
-        
-        self.stdout.write(self.style.SUCCESS(f'Created {Leaderboard.objects.count()} leaderboard entries'))
-        
+            for rank, (team_id, (calories, count, duration, members)) in enumerate(standings, start=1)
+        ])
+        self.stdout.write(self.style.SUCCESS(f'Created {len(standings)} team standings'))
+
         # Display summary
         self.stdout.write(self.style.SUCCESS('\n=== Database Population Complete ==='))
         self.stdout.write(f'Teams: {Team.objects.count()}')
-        self.stdout.write(f'Users: {User.objects.count()}')
-        self.stdout.write(f'Activities: {Activity.objects.count()}')
-        self.stdout.write(f'Workouts: {Workout.objects.count()}')
-        self.stdout.write(f'Leaderboard Entries: {Leaderboard.objects.count()}')
-        
+        self.stdout.write(f'Users: {len(users)}')
+        self.stdout.write(f'Activities: {created}')
+        self.stdout.write(f'Workouts: {len(WORKOUTS)}')
+        self.stdout.write(f'Leaderboard Entries: {len(ranked)}')
+
         # Display top 3 leaderboard
         self.stdout.write(self.style.SUCCESS('\n=== Top 3 Leaderboard ==='))
-        top_three = Leaderboard.objects.all().order_by('rank')[:3]
-        for entry in top_three:
-            user = User.objects.get(id=entry.user_id)
-            self.stdout.write(f'Rank {entry.rank}: {user.name} - {entry.total_calories} calories')
+        top_three = ranked[:3]
+        names = dict(User.objects.filter(pk__in=[int(user_id) for user_id, _ in top_three]).values_list('pk', 'name'))
+        for rank, (user_id, (calories, _, _)) in enumerate(top_three, start=1):
+            self.stdout.write(f'Rank {rank}: {names.get(int(user_id))} - {calories} calories')
+
+    def create_heroes(self, team_marvel, team_dc):
+        roster = [
+            (hero, team)
+            for heroes, team in ((MARVEL_HEROES, team_marvel), (DC_HEROES, team_dc))
+            for hero in heroes
+        ]
+        passwords = hash_passwords(hero['password'] for hero, _ in roster)
+        users = [
+            User(name=hero['name'], email=hero['email'], password=password, team_id=str(team.id))
+            for (hero, team), password in zip(roster, passwords)
+        ]
+        return self.bulk_create_users(users)
+
+    def create_synthetic_users(self, count, teams):
+        # Hashing is the slowest part of user creation, so every synthetic
+        # user shares one hash of the same password
+        password = make_password(SYNTHETIC_PASSWORD)
+        users = (
+            User(name=f'Athlete {n}', email=f'athlete{n}@octofit.example',
+                 password=password, team_id=str(teams[n % len(teams)].id))
+            for n in range(1, count + 1)
+        )
+        return self.bulk_create_users(users)
+
+    def bulk_create_users(self, users):
+        """Insert users in batches and return ``{user_id: team_id}``."""
+        created = {}
+        for batch in batched(users, self.batch_size):
+            User.objects.bulk_create(batch)
+            if any(user.pk is None for user in batch):
+                # Backends that can't return ids from a bulk insert
+                emails = [user.email for user in batch]
+                ids = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+                for user in batch:
+                    user.pk = ids[user.email]
+            created.update((str(user.pk), user.team_id) for user in batch)
+        return created
+
+    def generate_activities(self, users, per_user, totals):
+        now = timezone.now()
+        for user_id in users:
+            num_activities = per_user if per_user is not None else self.rng.randint(5, 10)
+            user_totals = totals[user_id]
+            content_hashes = set()
+            draws = 0
+            while len(content_hashes) < num_activities:
+                # Repeats are rare, so running out of draws means the
+                # requested count can't be made distinct
+                draws += 1
+                if draws > MAX_DRAWS_PER_ACTIVITY * num_activities:
+                    raise CommandError(
+                        f'Could not generate {num_activities} distinct activities for user {user_id}; '
+                        f'use a lower --activities-per-user'
+                    )
+                activity_type = self.rng.choice(ACTIVITY_TYPES)
+                duration = self.rng.randint(20, 90)
+                distance = self.rng.uniform(2, 15) if activity_type in DISTANCE_TYPES else None
+                calories = duration * self.rng.randint(6, 12)
+
+                # Create activities from the past 30 days, at any time of day
+                days_ago = self.rng.randint(0, 30)
+                seconds_ago = self.rng.randrange(24 * 60 * 60)
+
+                activity = Activity(
+                    user_id=user_id,
+                    activity_type=activity_type,
+                    duration=duration,
+                    distance=distance,
+                    calories=calories,
+                    date=now - timedelta(days=days_ago, seconds=seconds_ago)
+                )
+                # bulk_create doesn't call save(); redraw the rare repeat,
+                # which the unique index would reject
+                activity.content_hash = activity.compute_content_hash()
+                if activity.content_hash in content_hashes:
+                    continue
+                content_hashes.add(activity.content_hash)
+
+                user_totals[0] += calories
+                user_totals[1] += 1
+                user_totals[2] += duration
+                yield activity
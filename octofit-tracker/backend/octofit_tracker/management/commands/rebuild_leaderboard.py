@@ -0,0 +1,257 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from octofit_tracker import buckets, sync
+from octofit_tracker.caching import invalidate_model
+from octofit_tracker.leaderboard import average_per_member
+from octofit_tracker.models import Activity, ActivityDayBucket, Leaderboard, TeamStanding, User
+from octofit_tracker.realtime import broadcaster
+from octofit_tracker.repository import MongoRepository, to_mongo
+from octofit_tracker.signals import SYNCED_MODELS
+from octofit_tracker.utils import batched
+
+LEADERBOARD_FIELDS = ['team_id', 'total_calories', 'total_activities', 'total_duration', 'rank', 'updated_at']
+STANDING_FIELDS = [
+    'total_calories', 'total_activities', 'total_duration', 'member_count',
+    'average_calories', 'rank', 'updated_at',
+]
+BUCKET_FIELDS = ['total_calories', 'total_activities', 'total_duration', 'updated_at']
+
+
+def aggregate_shard(user_ids):
+    """Sum the activities of ``user_ids`` in the database: ``{user_id: (calories, activities, duration)}``."""
+    # Aliases named like a column or table trip up djongo's SQL translation
+    rows = (
+        Activity.objects.filter(user_id__in=user_ids)
+        .values('user_id')
+        .annotate(calorie_sum=Sum('calories'), activity_count=Count('pk'), duration_sum=Sum('duration'))
+        .order_by()
+    )
+    return {
+        row['user_id']: (row['calorie_sum'] or 0, row['activity_count'], row['duration_sum'] or 0)
+        for row in rows
+    }
+
+
+def swap_collection(database, name, documents, batch_size):
+    """
+    Replace the documents of collection ``name``: they are written to a
+    shadow collection with the same indexes, which is then renamed over the
+    live one, so readers see either the old or the new documents.
+    """
+    live = database[name]
+    shadow_name = f'{name}__rebuild'
+    database.drop_collection(shadow_name)
+    shadow = database.create_collection(shadow_name)
+    for index_name, index in live.index_information().items():
+        if index_name == '_id_':
+            continue
+        options = {key: value for key, value in index.items() if key not in ('key', 'v', 'ns')}
+        shadow.create_index(index['key'], name=index_name, **options)
+    for batch in batched(documents, batch_size):
+        shadow.insert_many(batch)
+    shadow.rename(name, dropTarget=True)
+
+
+def _init_worker():
+    # Workers started with "spawn" need their own app registry
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the leaderboard, team standings and day buckets from the activities collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            default=2000,
+            help='Users aggregated per query (default: 2000)',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            help='Worker processes aggregating shards (default: one per CPU, 1 to run in-process)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows written per bulk update or insert (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        # djongo has no transactions, so MongoDB collections are swapped instead
+        self.swap = connections['default'].vendor == 'djongo'
+        started = time.perf_counter()
+
+        teams_by_user = {
+            str(pk): team_id or '' for pk, team_id in User.objects.values_list('pk', 'team_id')
+        }
+        shards = list(batched(sorted(teams_by_user), options['shard_size']))
+        self.stdout.write(f'Aggregating activities of {len(teams_by_user)} users in {len(shards)} shards...')
+        totals = {}
+        for shard_totals in self.aggregate(shards, options['processes']):
+            totals.update(shard_totals)
+
+        # Ties are ordered by user id so rebuilds are deterministic
+        ranked = sorted(
+            teams_by_user,
+            key=lambda user_id: (-totals.get(user_id, (0,))[0], int(user_id)),
+        )
+
+        team_totals = {}
+        for user_id, team_id in teams_by_user.items():
+            if not team_id:
+                continue
+            team = team_totals.setdefault(team_id, [0, 0, 0, 0])
+            for index, total in enumerate(totals.get(user_id, (0, 0, 0))):
+                team[index] += total
+            team[3] += 1
+        standings = sorted(team_totals.items(), key=lambda item: (-item[1][0], item[0]))
+
+        # SQL databases rewrite the tables in one transaction. On MongoDB
+        # (djongo commits nothing) each collection is swapped whole instead,
+        # so readers see either its old or its new rows, never a mix
+        with transaction.atomic():
+            written = self.write_leaderboard(ranked, totals, teams_by_user)
+            team_written = self.write_standings(standings)
+            bucket_count, bucket_written = self.write_buckets()
+        # Bulk writes don't send post_save, nor publish diffs
+        invalidate_model(Leaderboard)
+        invalidate_model(TeamStanding)
+        invalidate_model(ActivityDayBucket)
+        broadcaster.reset()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(ranked)} leaderboard entries ({written} written), '
+            f'{len(standings)} team standings ({team_written} written) and '
+            f'{bucket_count} day buckets ({bucket_written} written) '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def aggregate(self, shards, processes):
+        if processes == 1 or len(shards) < 2:
+            return [aggregate_shard(shard) for shard in shards]
+        # Forked workers must open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+            return list(pool.map(aggregate_shard, shards))
+
+    def write_leaderboard(self, ranked, totals, teams_by_user):
+        now = timezone.now()
+        existing = {}
+        stale = []
+        for entry in Leaderboard.objects.all():
+            if entry.user_id in existing or entry.user_id not in teams_by_user:
+                stale.append(entry)
+            else:
+                existing[entry.user_id] = entry
+
+        changed, created, unchanged = [], [], []
+        for rank, user_id in enumerate(ranked, start=1):
+            calories, count, duration = totals.get(user_id, (0, 0, 0))
+            values = {
+                'team_id': teams_by_user[user_id],
+                'total_calories': calories,
+                'total_activities': count,
+                'total_duration': duration,
+                'rank': rank,
+            }
+            entry = existing.get(user_id)
+            if entry is None:
+                created.append(Leaderboard(user_id=user_id, updated_at=now, **values))
+            elif any(getattr(entry, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(entry, field, value)
+                entry.updated_at = now
+                changed.append(entry)
+            else:
+                unchanged.append(entry)
+        return self.write(Leaderboard, stale, changed, created, unchanged, LEADERBOARD_FIELDS)
+
+    def write_standings(self, standings):
+        now = timezone.now()
+        existing = {standing.team_id: standing for standing in TeamStanding.objects.all()}
+        changed, created, unchanged = [], [], []
+        for rank, (team_id, (calories, count, duration, members)) in enumerate(standings, start=1):
+            values = {
+                'total_calories': calories,
+                'total_activities': count,
+                'total_duration': duration,
+                'member_count': members,
+                'average_calories': average_per_member(calories, members),
+                'rank': rank,
+            }
+            standing = existing.pop(team_id, None)
+            if standing is None:
+                created.append(TeamStanding(team_id=team_id, updated_at=now, **values))
+            elif any(getattr(standing, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(standing, field, value)
+                standing.updated_at = now
+                changed.append(standing)
+            else:
+                unchanged.append(standing)
+        stale = list(existing.values())
+        return self.write(TeamStanding, stale, changed, created, unchanged, STANDING_FIELDS)
+
+    def write_buckets(self):
+        now = timezone.now()
+        totals = buckets.day_totals(Activity.objects.all())
+        existing = {(bucket.user_id, bucket.day): bucket for bucket in ActivityDayBucket.objects.all()}
+        changed, created, unchanged = [], [], []
+        for (user_id, day), (calories, count, duration) in totals.items():
+            values = {
+                'total_calories': calories,
+                'total_activities': count,
+                'total_duration': duration,
+            }
+            bucket = existing.pop((user_id, day), None)
+            if bucket is None:
+                created.append(ActivityDayBucket(user_id=user_id, day=day, updated_at=now, **values))
+            elif any(getattr(bucket, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(bucket, field, value)
+                bucket.updated_at = now
+                changed.append(bucket)
+            else:
+                unchanged.append(bucket)
+        stale = list(existing.values())
+        written = self.write(ActivityDayBucket, stale, changed, created, unchanged, BUCKET_FIELDS)
+        return len(totals), written
+
+    def write(self, model, stale, changed, created, unchanged, fields):
+        if self.swap:
+            self.swap_rows(model, stale, changed + created + unchanged, created)
+        else:
+            for batch in batched([row.pk for row in stale], self.batch_size):
+                model.objects.filter(pk__in=batch).delete()
+            model.objects.bulk_update(changed, fields, batch_size=self.batch_size)
+            for batch in batched(created, self.batch_size):
+                model.objects.bulk_create(batch)
+        return len(stale) + len(changed) + len(created)
+
+    def swap_rows(self, model, stale, rows, created):
+        repository = MongoRepository()
+        collection = model._meta.db_table
+        if created:
+            for row, pk in zip(created, repository.allocate_ids(collection, len(created))):
+                row.pk = pk
+        attnames = [field.attname for field in model._meta.concrete_fields]
+        documents = (
+            {attname: to_mongo(getattr(row, attname)) for attname in attnames} for row in rows
+        )
+        swap_collection(repository.database, collection, documents, self.batch_size)
+        # Rows removed by the swap don't send post_delete
+        if model in SYNCED_MODELS:
+            for row in stale:
+                sync.record_deletion(row)
@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Compare the indexes in the octofit_db database with the ones declared on the models'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create',
+            action='store_true',
+            help='Build the indexes that are declared on a model but missing from the database',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to inspect (default: "default")',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        missing_total = 0
+
+        for model in apps.get_app_config('octofit_tracker').get_models():
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, table)
+            existing = {name for name, info in constraints.items() if info['index']}
+            expected = {index.name: index for index in model._meta.indexes}
+
+            self.stdout.write(f'{table}:')
+            for name in sorted(expected):
+                if name in existing:
+                    self.stdout.write(f'  ok       {name}')
+                else:
+                    self.stdout.write(self.style.WARNING(f'  missing  {name}'))
+            for name in sorted(existing - set(expected)):
+                self.stdout.write(f'  extra    {name}')
+
+            missing = [index for name, index in expected.items() if name not in existing]
+            missing_total += len(missing)
+            if missing and options['create']:
+                with connection.schema_editor() as schema_editor:
+                    for index in missing:
+                        schema_editor.add_index(model, index)
+                        self.stdout.write(self.style.SUCCESS(f'  created  {index.name}'))
+
+        if not missing_total:
+            self.stdout.write(self.style.SUCCESS('All declared indexes exist'))
+        elif not options['create']:
+            self.stdout.write(self.style.WARNING(
+                f'{missing_total} declared indexes are missing; run with --create to build them'
+            ))
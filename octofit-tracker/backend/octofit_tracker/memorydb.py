@@ -0,0 +1,329 @@
+"""
+In-memory stand-in for the subset of the pymongo/motor API used by the
+native Mongo read paths, so they can be exercised without a server.
+
+Supported filters: equality, ``$in``, ``$nin``, ``$ne``, ``$gt``, ``$gte``,
+``$lt``, ``$lte`` and top-level ``$or``/``$and``. Supported updates:
+``$set`` and ``$inc``, including dotted paths. Aggregations support the
+``$match``, ``$group`` (``$sum`` of a field or a constant, grouped by a
+field or a ``$dateToString``) and ``$sort`` stages. Indexes are recorded
+but not enforced.
+"""
+import copy
+import datetime
+import itertools
+import threading
+import zoneinfo
+
+from pymongo.errors import CollectionInvalid
+
+ASCENDING = 1
+DESCENDING = -1
+
+_OPERATORS = {
+    '$in': lambda value, arg: value in arg,
+    '$nin': lambda value, arg: value not in arg,
+    '$ne': lambda value, arg: value != arg,
+    '$gt': lambda value, arg: value is not None and value > arg,
+    '$gte': lambda value, arg: value is not None and value >= arg,
+    '$lt': lambda value, arg: value is not None and value < arg,
+    '$lte': lambda value, arg: value is not None and value <= arg,
+}
+
+
+def matches(document, query):
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+            value = document.get(key)
+            for operator, argument in condition.items():
+                if operator not in _OPERATORS:
+                    raise NotImplementedError(f'Unsupported query operator: {operator}')
+                if not _OPERATORS[operator](value, argument):
+                    return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    fields = [field for field, included in projection.items() if included]
+    projected = {field: copy.deepcopy(document[field]) for field in fields if field in document}
+    if projection.get('_id', 1) and '_id' in document:
+        projected['_id'] = document['_id']
+    return projected
+
+
+def _sort_key(field):
+    # None sorts before every other value, like in MongoDB
+    def key(document):
+        value = document.get(field)
+        return (value is not None, value)
+    return key
+
+
+class MemoryCursor:
+    def __init__(self, documents, projection=None):
+        self._documents = documents
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=ASCENDING):
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction)]
+        self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _results(self):
+        documents = list(self._documents)
+        for field, direction in reversed(self._sort):
+            documents.sort(key=_sort_key(field), reverse=direction == DESCENDING)
+        documents = documents[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        return [_project(document, self._projection) for document in documents]
+
+    def __iter__(self):
+        return iter(self._results())
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results if length is None else results[:length]
+
+
+class MemoryCollection:
+    def __init__(self, name, database=None):
+        self.name = name
+        self.database = database
+        self._documents = []
+        self._indexes = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def find(self, filter=None, projection=None):
+        with self._lock:
+            documents = [document for document in self._documents if matches(document, filter)]
+        return MemoryCursor(documents, projection)
+
+    def find_one(self, filter=None, projection=None):
+        for document in self.find(filter, projection).limit(1):
+            return document
+        return None
+
+    def count_documents(self, filter):
+        with self._lock:
+            return sum(1 for document in self._documents if matches(document, filter))
+
+    def insert_one(self, document):
+        with self._lock:
+            document.setdefault('_id', next(self._ids))
+            self._documents.append(copy.deepcopy(document))
+        return InsertOneResult(document['_id'])
+
+    def insert_many(self, documents):
+        return InsertManyResult([self.insert_one(document).inserted_id for document in documents])
+
+    def update_one(self, filter, update, upsert=False):
+        return self.find_one_and_update(filter, update, upsert=upsert)
+
+    def find_one_and_update(self, filter, update, upsert=False, return_document=False):
+        with self._lock:
+            for document in self._documents:
+                if matches(document, filter):
+                    before = copy.deepcopy(document)
+                    _apply_update(document, update)
+                    return copy.deepcopy(document) if return_document else before
+            if not upsert:
+                return None
+            document = {key: value for key, value in filter.items() if not key.startswith('$')}
+            _apply_update(document, update)
+            document.setdefault('_id', next(self._ids))
+            self._documents.append(document)
+            return copy.deepcopy(document) if return_document else None
+
+    def aggregate(self, pipeline):
+        with self._lock:
+            documents = copy.deepcopy(self._documents)
+        for stage in pipeline:
+            (operator, argument), = stage.items()
+            if operator == '$match':
+                documents = [document for document in documents if matches(document, argument)]
+            elif operator == '$group':
+                documents = _group(documents, argument)
+            elif operator == '$sort':
+                documents = list(MemoryCursor(documents).sort(list(argument.items())))
+            else:
+                raise NotImplementedError(f'Unsupported pipeline stage: {operator}')
+        return iter(documents)
+
+    def delete_one(self, filter):
+        with self._lock:
+            for index, document in enumerate(self._documents):
+                if matches(document, filter):
+                    del self._documents[index]
+                    return DeleteResult(1)
+        return DeleteResult(0)
+
+    def create_index(self, keys, name=None, **options):
+        # Only recorded, for index_information(); unique isn't enforced
+        if isinstance(keys, str):
+            keys = [(keys, ASCENDING)]
+        keys = list(keys)
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        with self._lock:
+            self._indexes[name] = dict(options, key=keys)
+        return name
+
+    def index_information(self):
+        with self._lock:
+            return {'_id_': {'key': [('_id', ASCENDING)]}} | copy.deepcopy(self._indexes)
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+    def rename(self, new_name, dropTarget=False):
+        self.database.rename_collection(self.name, new_name, drop_target=dropTarget)
+
+
+def _evaluate(expression, document):
+    if isinstance(expression, str) and expression.startswith('$'):
+        return document.get(expression[1:])
+    if isinstance(expression, dict) and set(expression) == {'$dateToString'}:
+        options = expression['$dateToString']
+        date = _evaluate(options['date'], document)
+        if date is None:
+            return None
+        # Stored datetimes are naive UTC
+        date = date.replace(tzinfo=datetime.timezone.utc)
+        date = date.astimezone(zoneinfo.ZoneInfo(options.get('timezone', 'UTC')))
+        return date.strftime(options['format'])
+    if isinstance(expression, dict):
+        raise NotImplementedError(f'Unsupported expression: {expression}')
+    return expression
+
+
+def _group(documents, specification):
+    groups = {}
+    for document in documents:
+        key = _evaluate(specification['_id'], document)
+        group = groups.setdefault(key, {'_id': key})
+        for field, accumulator in specification.items():
+            if field == '_id':
+                continue
+            (operator, expression), = accumulator.items()
+            if operator != '$sum':
+                raise NotImplementedError(f'Unsupported accumulator: {operator}')
+            value = _evaluate(expression, document)
+            # Like MongoDB, $sum skips missing and non-numeric values
+            group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+    return list(groups.values())
+
+
+def _apply_update(document, update):
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            # Dotted paths update embedded documents, creating them as needed
+            *parents, field = path.split('.')
+            target = document
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            if operator == '$set':
+                target[field] = value
+            elif operator == '$inc':
+                target[field] = target.get(field, 0) + value
+            else:
+                raise NotImplementedError(f'Unsupported update operator: {operator}')
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+class MemoryDatabase:
+    def __init__(self, name='octofit_db'):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name, self)
+            return self._collections[name]
+
+    def create_collection(self, name, **options):
+        # Options such as capped collections are accepted and ignored
+        with self._lock:
+            if name in self._collections:
+                raise CollectionInvalid(f'collection {name} already exists')
+        return self[name]
+
+    def drop_collection(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def rename_collection(self, name, new_name, drop_target=False):
+        with self._lock:
+            if new_name in self._collections and not drop_target:
+                raise ValueError(f'Collection {new_name} already exists')
+            collection = self._collections.pop(name)
+            collection.name = new_name
+            self._collections[new_name] = collection
+
+
+class AsyncMemoryCollection:
+    """Motor-style wrapper: ``find`` returns a cursor, other methods are awaitable."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, filter=None, projection=None):
+        return self._collection.find(filter, projection)
+
+    async def find_one(self, filter=None, projection=None):
+        return self._collection.find_one(filter, projection)
+
+    async def count_documents(self, filter):
+        return self._collection.count_documents(filter)
+
+    async def insert_one(self, document):
+        return self._collection.insert_one(document)
+
+    async def insert_many(self, documents):
+        return self._collection.insert_many(documents)
+
+
+class AsyncMemoryDatabase:
+    def __init__(self, database):
+        self.sync = database
+
+    def __getitem__(self, name):
+        return AsyncMemoryCollection(self.sync[name])
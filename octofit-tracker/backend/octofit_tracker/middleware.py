@@ -0,0 +1,343 @@
+"""
+Request profiling and response compression middleware.
+
+``RequestProfilingMiddleware`` (opt-in) counts and times the database queries of a
+request and splits its wall time into view, serialize and render phases,
+serialize being the serializers' ``.data`` inside the view. The numbers
+are returned in a ``Server-Timing`` header and aggregated per URL name in
+``request_profiles``, which also keeps the slowest requests with their
+queries. Enable it with ``OCTOFIT_REQUEST_PROFILING['ENABLED']``; metrics
+are per process.
+
+``CompressionMiddleware`` brotli- (when installed) or
+gzip-encodes responses of at least ``OCTOFIT_COMPRESSION['MIN_SIZE']``
+bytes, as negotiated by ``Accept-Encoding``. Streaming responses are left
+alone.
+
+Both run natively under ASGI, so async views aren't pushed onto a thread.
+"""
+import gzip
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+HISTOGRAM_BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+UNRESOLVED = '<unresolved>'
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class RequestProfile:
+    """Timings of one request; also used as the DB execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.view_started = None
+        self.view_ended = None
+        self.render_started = None
+        self.render_ended = None
+        self.ended = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.db_time += duration
+            self.queries.append((sql, duration))
+
+    @contextmanager
+    def serializing(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.serialize_time += time.perf_counter() - started
+
+    def finish(self):
+        self.ended = time.perf_counter()
+        if self.view_started is not None and self.view_ended is None:
+            self.view_ended = self.ended
+
+    def timings(self):
+        """Durations in seconds, keyed by Server-Timing metric name."""
+        timings = {'db': self.db_time}
+        if self.view_started is not None:
+            timings['view'] = self.view_ended - self.view_started - self.serialize_time
+        if self.serialize_time:
+            timings['serialize'] = self.serialize_time
+        if self.render_started is not None and self.render_ended is not None:
+            timings['render'] = self.render_ended - self.render_started
+        timings['total'] = self.ended - self.started
+        return timings
+
+    def server_timing(self):
+        metrics = []
+        for name, seconds in self.timings().items():
+            metric = f'{name};dur={_ms(seconds)}'
+            if name == 'db':
+                metric += f';desc="{len(self.queries)} queries"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+
+class RequestProfiles:
+    """Thread-safe per-URL-name histograms and the slowest requests."""
+
+    def __init__(self, slowest=20):
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._slowest = []
+
+    def record(self, url_name, method, path, profile):
+        timings = profile.timings()
+        total_ms = _ms(timings['total'])
+        with self._lock:
+            endpoint = self._endpoints.get(url_name)
+            if endpoint is None:
+                endpoint = self._endpoints[url_name] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'db_ms': 0.0,
+                    'queries': 0,
+                    'max_queries': 0,
+                    'histogram': [0] * (len(HISTOGRAM_BOUNDS) + 1),
+                }
+            endpoint['count'] += 1
+            endpoint['total_ms'] += total_ms
+            endpoint['max_ms'] = max(endpoint['max_ms'], total_ms)
+            endpoint['db_ms'] += _ms(timings['db'])
+            endpoint['queries'] += len(profile.queries)
+            endpoint['max_queries'] = max(endpoint['max_queries'], len(profile.queries))
+            bucket = next(
+                (index for index, bound in enumerate(HISTOGRAM_BOUNDS) if total_ms <= bound),
+                len(HISTOGRAM_BOUNDS),
+            )
+            endpoint['histogram'][bucket] += 1
+
+            if self.slowest <= 0:
+                return
+            if len(self._slowest) >= self.slowest and total_ms <= self._slowest[0][0]:
+                return
+            request = {
+                'url_name': url_name,
+                'method': method,
+                'path': path,
+                'timings_ms': {name: _ms(seconds) for name, seconds in timings.items()},
+                'queries': [{'sql': sql, 'ms': _ms(seconds)} for sql, seconds in profile.queries],
+            }
+            item = (total_ms, next(self._sequence), request)
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heapreplace(self._slowest, item)
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {}
+            for url_name, endpoint in self._endpoints.items():
+                count = endpoint['count']
+                endpoints[url_name] = dict(
+                    endpoint,
+                    histogram=dict(zip(
+                        [f'le_{bound}ms' for bound in HISTOGRAM_BOUNDS] + ['inf'],
+                        endpoint['histogram'],
+                    )),
+                    mean_ms=round(endpoint['total_ms'] / count, 3),
+                    mean_queries=round(endpoint['queries'] / count, 2),
+                )
+            slowest = [request for _, _, request in sorted(self._slowest, reverse=True)]
+        return {'endpoints': endpoints, 'slowest': slowest}
+
+
+request_profiles = RequestProfiles()
+
+
+class RequestProfilingMiddleware:
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        config = settings.OCTOFIT_REQUEST_PROFILING
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.log_threshold_ms = config.get('LOG_THRESHOLD_MS')
+        request_profiles.slowest = config.get('SLOWEST', request_profiles.slowest)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = self.start(request)
+        with self.tracing(profile):
+            response = self.get_response(request)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = self.start(request)
+        with self.tracing(profile):
+            response = await self.get_response(request)
+        return self.finish(request, response, profile)
+
+    @staticmethod
+    def start(request):
+        profile = RequestProfile()
+        request.octofit_profile = profile
+        return profile
+
+    @staticmethod
+    def tracing(profile):
+        # Queries of sync_to_async code run on another thread's connection
+        # and aren't counted
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        return stack
+
+    def finish(self, request, response, profile):
+        profile.finish()
+
+        response['Server-Timing'] = profile.server_timing()
+        match = request.resolver_match
+        url_name = (match and match.url_name) or UNRESOLVED
+        request_profiles.record(url_name, request.method, request.get_full_path(), profile)
+
+        total_ms = _ms(profile.ended - profile.started)
+        if self.log_threshold_ms is not None and total_ms >= self.log_threshold_ms:
+            logger.warning(
+                'Slow request %s %s (%s): %sms, %d queries\n%s',
+                request.method, request.get_full_path(), url_name, total_ms,
+                len(profile.queries), '\n'.join(sql for sql, _ in profile.queries),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.octofit_profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook returns
+        profile = request.octofit_profile
+        profile.view_ended = profile.render_started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: self._rendered(profile))
+        return response
+
+    @staticmethod
+    def _rendered(profile):
+        profile.render_ended = time.perf_counter()
+
+
+_ACCEPT_ENCODING = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def accepted_encodings(header):
+    """``{encoding: quality}`` from an ``Accept-Encoding`` header."""
+    encodings = {}
+    for part in header.split(','):
+        match = _ACCEPT_ENCODING.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+        encodings[match[1].lower()] = quality
+    return encodings
+
+
+class CompressionMiddleware:
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        config = settings.OCTOFIT_COMPRESSION
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.min_size = config.get('MIN_SIZE', 1024)
+        self.gzip_level = config.get('GZIP_LEVEL', 6)
+        self.brotli_quality = config.get('BROTLI_QUALITY', 5)
+        self.encoders = {'gzip': self._gzip}
+        if brotli is not None:
+            # Preferred when the client accepts both
+            self.encoders = {'br': self._brotli, 'gzip': self._gzip}
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < self.min_size:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = self.encoders[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The encoded body differs byte for byte, so the validator is weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def negotiate(self, header):
+        accepted = accepted_encodings(header)
+        wildcard = accepted.get('*', 0)
+        best, best_quality = None, 0
+        for encoding in self.encoders:
+            quality = accepted.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def _gzip(self, content):
+        return gzip.compress(content, compresslevel=self.gzip_level, mtime=0)
+
+    def _brotli(self, content):
+        return brotli.compress(content, quality=self.brotli_quality)
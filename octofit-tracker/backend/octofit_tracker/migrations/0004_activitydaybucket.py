@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0003_teamstanding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityDayBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('total_calories', models.IntegerField(default=0)),
+                ('total_activities', models.IntegerField(default=0)),
+                ('total_duration', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'activity_day_buckets',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activitydaybucket',
+            index=models.Index(fields=['day', 'user_id'], name='activity_day_buckets_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='activitydaybucket',
+            constraint=models.UniqueConstraint(fields=('user_id', 'day'), name='activity_day_buckets_user_day_uniq'),
+        ),
+    ]
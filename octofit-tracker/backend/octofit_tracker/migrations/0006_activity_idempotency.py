@@ -0,0 +1,72 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:17
+
+import datetime
+import hashlib
+
+from django.db import migrations, models
+
+
+def activity_content_hash(user_id, activity_type, date, duration):
+    # Copy of octofit_tracker.models.activity_content_hash as of this migration
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    date = date.astimezone(datetime.timezone.utc).isoformat()
+    content = '\x1f'.join((str(user_id), activity_type, date, str(duration)))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def backfill_content_hashes(apps, schema_editor):
+    # Activities submitted more than once keep their rows; all but the first
+    # get a hash no submission can produce, so the unique index can be built.
+    # Sorting on the hashed fields puts repeats next to each other, and each
+    # row is updated on its own since djongo can't translate bulk_update()
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    rows = Activity.objects.order_by('user_id', 'activity_type', 'date', 'duration', 'pk').values_list(
+        'pk', 'user_id', 'activity_type', 'date', 'duration'
+    )
+    previous = None
+    for pk, user_id, activity_type, date, duration in rows.iterator():
+        content_hash = activity_content_hash(user_id, activity_type, date, duration)
+        if content_hash == previous:
+            Activity.objects.filter(pk=pk).update(content_hash=f'duplicate:{pk}')
+        else:
+            Activity.objects.filter(pk=pk).update(content_hash=content_hash)
+        previous = content_hash
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0005_delta_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('activity_id', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'idempotency_keys',
+            },
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='content_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='activity',
+            name='content_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='idempotencykey',
+            index=models.Index(fields=['created_at'], name='idempotency_keys_created_idx'),
+        ),
+    ]
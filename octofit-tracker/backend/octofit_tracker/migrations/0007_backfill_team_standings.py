@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def backfill_team_standings(apps, schema_editor):
+    # Standings only counted the members written through the API before
+    # membership was tracked with signals, so rebuild them from scratch
+    User = apps.get_model('octofit_tracker', 'User')
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    TeamStanding = apps.get_model('octofit_tracker', 'TeamStanding')
+
+    teams_by_user = {
+        str(pk): team_id for pk, team_id in User.objects.values_list('pk', 'team_id') if team_id
+    }
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+    for team_id in teams_by_user.values():
+        totals[team_id][3] += 1
+    # Aliases named like a column or table trip up djongo's SQL translation
+    rows = (
+        Activity.objects.values('user_id')
+        .annotate(calorie_sum=Sum('calories'), activity_count=Count('pk'), duration_sum=Sum('duration'))
+        .order_by()
+    )
+    for row in rows:
+        team_id = teams_by_user.get(row['user_id'])
+        if team_id:
+            team = totals[team_id]
+            team[0] += row['calorie_sum'] or 0
+            team[1] += row['activity_count']
+            team[2] += row['duration_sum'] or 0
+
+    TeamStanding.objects.all().delete()
+    standings = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    for rank, (team_id, (calories, count, duration, members)) in enumerate(standings, start=1):
+        TeamStanding.objects.create(
+            team_id=team_id,
+            total_calories=calories,
+            total_activities=count,
+            total_duration=duration,
+            member_count=members,
+            average_calories=calories / members if members > 0 else 0,
+            rank=rank,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0006_activity_idempotency'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_team_standings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_activity_day_buckets(apps, schema_editor):
+    # Buckets were only written for activities logged after 0004, so
+    # rebuild the ones still within retention from scratch
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    ActivityDayBucket = apps.get_model('octofit_tracker', 'ActivityDayBucket')
+
+    oldest = timezone.localdate() - datetime.timedelta(days=settings.OCTOFIT_BUCKET_RETENTION_DAYS - 1)
+    start = timezone.make_aware(datetime.datetime.combine(oldest, datetime.time()))
+    totals = defaultdict(lambda: [0, 0, 0])
+    rows = Activity.objects.filter(date__gte=start).values_list('user_id', 'date', 'calories', 'duration')
+    for user_id, date, calories, duration in rows.iterator():
+        day = timezone.localdate(date) if timezone.is_aware(date) else date.date()
+        bucket = totals[(str(user_id), day)]
+        bucket[0] += calories
+        bucket[1] += 1
+        bucket[2] += duration
+
+    ActivityDayBucket.objects.all().delete()
+    ActivityDayBucket.objects.bulk_create(
+        ActivityDayBucket(
+            user_id=user_id,
+            day=day,
+            total_calories=calories,
+            total_activities=count,
+            total_duration=duration,
+        )
+        for (user_id, day), (calories, count, duration) in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0007_backfill_team_standings'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_activity_day_buckets, migrations.RunPython.noop),
+    ]
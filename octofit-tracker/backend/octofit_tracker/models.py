@@ -1,26 +1,52 @@
+import datetime
+import hashlib
+
 from django.db import models
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import make_password
+
+from .passwords import hash_passwords, needs_hashing, verify_password
+
+
+class UserManager(models.Manager):
+    def bulk_create_hashed(self, users, batch_size=None, processes=None):
+        """
+        Hash the raw passwords of ``users`` in parallel, then insert them
+        with ``bulk_create`` (which bypasses ``User.save``).
+        """
+        users = list(users)
+        pending = [user for user in users if needs_hashing(user.password)]
+        hashed = hash_passwords([user.password for user in pending], processes=processes)
+        for user, password in zip(pending, hashed):
+            user.password = password
+        return self.bulk_create(users, batch_size=batch_size)
 
 
 class User(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
-    password = models.CharField(max_length=128)  # Increased to accommodate hashed passwords
+    password = models.CharField(max_length=200)  # Increased to accommodate hashed passwords
     team_id = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = UserManager()
     
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['team_id'], name='users_team_id_idx'),
+            models.Index(fields=['updated_at'], name='users_updated_at_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         # Hash password before saving if it's not already hashed
-        if self.password and not self.password.startswith('pbkdf2_'):
+        if needs_hashing(self.password):
             self.password = make_password(self.password)
         super().save(*args, **kwargs)
     
     def verify_password(self, raw_password):
         """Check if the provided password matches the hashed password"""
-        return check_password(raw_password, self.password)
+        return verify_password(raw_password, self.password)
     
     def __str__(self):
         return self.name
@@ -30,14 +56,30 @@ class Team(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'teams'
+        indexes = [
+            models.Index(fields=['updated_at'], name='teams_updated_at_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
 
+def activity_content_hash(user_id, activity_type, date, duration):
+    """
+    Fingerprint of the fields that identify an activity, used to detect
+    resubmissions of the same workout.
+    """
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    date = date.astimezone(datetime.timezone.utc).isoformat()
+    content = '\x1f'.join((str(user_id), activity_type, date, str(duration)))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
 class Activity(models.Model):
     user_id = models.CharField(max_length=100)
     activity_type = models.CharField(max_length=100)
@@ -46,9 +88,26 @@ class Activity(models.Model):
     calories = models.IntegerField()
     date = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    content_hash = models.CharField(max_length=64, unique=True)
     
     class Meta:
         db_table = 'activities'
+        indexes = [
+            models.Index(fields=['user_id', '-date'], name='activities_user_date_idx'),
+            models.Index(fields=['-date'], name='activities_date_idx'),
+            models.Index(fields=['updated_at'], name='activities_updated_at_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        super().save(*args, **kwargs)
+    
+    def compute_content_hash(self):
+        # Values assigned before saving may still be strings
+        date = self._meta.get_field('date').to_python(self.date)
+        duration = self._meta.get_field('duration').to_python(self.duration)
+        return activity_content_hash(self.user_id, self.activity_type, date, duration)
     
     def __str__(self):
         return f"{self.activity_type} - {self.user_id}"
@@ -65,11 +124,91 @@ class Leaderboard(models.Model):
     
     class Meta:
         db_table = 'leaderboard'
+        indexes = [
+            models.Index(fields=['rank'], name='leaderboard_rank_idx'),
+            models.Index(fields=['team_id', 'rank'], name='leaderboard_team_rank_idx'),
+            models.Index(fields=['user_id'], name='leaderboard_user_id_idx'),
+            models.Index(fields=['updated_at'], name='leaderboard_updated_at_idx'),
+        ]
     
     def __str__(self):
         return f"Rank {self.rank}: {self.user_id}"
 
 
+class TeamStanding(models.Model):
+    team_id = models.CharField(max_length=100, unique=True)
+    total_calories = models.IntegerField(default=0)
+    total_activities = models.IntegerField(default=0)
+    total_duration = models.IntegerField(default=0)  # in minutes
+    member_count = models.IntegerField(default=0)
+    average_calories = models.FloatField(default=0)  # per member
+    rank = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'team_standings'
+        indexes = [
+            models.Index(fields=['rank'], name='team_standings_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Rank {self.rank}: {self.team_id}"
+
+
+class ActivityDayBucket(models.Model):
+    user_id = models.CharField(max_length=100)
+    day = models.DateField()
+    total_calories = models.IntegerField(default=0)
+    total_activities = models.IntegerField(default=0)
+    total_duration = models.IntegerField(default=0)  # in minutes
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'activity_day_buckets'
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'day'], name='activity_day_buckets_user_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'user_id'], name='activity_day_buckets_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.day}"
+
+
+class IdempotencyKey(models.Model):
+    """The activity created by a request carrying an ``Idempotency-Key`` header."""
+    key = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64)
+    activity_id = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_keys_created_idx'),
+        ]
+    
+    def __str__(self):
+        return self.key
+
+
+class Tombstone(models.Model):
+    """Record of a deleted row, so delta syncs can report the deletion."""
+    model = models.CharField(max_length=100)  # model label, e.g. 'octofit_tracker.activity'
+    object_id = models.CharField(max_length=100)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'tombstones'
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstones_model_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
 class Workout(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
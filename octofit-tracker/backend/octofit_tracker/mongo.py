@@ -0,0 +1,111 @@
+"""
+Direct access to the ``octofit_db`` collections, bypassing the ORM.
+
+``OCTOFIT_MONGO['BACKEND']`` selects a real client (``mongo``) or the
+in-memory stand-in from ``memorydb`` (``memory``). Connection options are
+taken from ``DATABASES['default']`` so both paths hit the same database.
+"""
+import datetime
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from pymongo.errors import DuplicateKeyError
+
+from .memorydb import AsyncMemoryDatabase, MemoryDatabase
+
+LOCK_COLLECTION = 'locks'
+LOCK_POLL_SECONDS = 0.01
+
+_async_database = None
+_database = None
+_locks_indexed = False
+_memory_database = None
+
+
+def _backend():
+    return getattr(settings, 'OCTOFIT_MONGO', {}).get('BACKEND', 'mongo')
+
+
+def _client_options():
+    database = settings.DATABASES['default']
+    return database['NAME'], dict(database.get('CLIENT', {}))
+
+
+def _memory():
+    # Shared by the sync and async accessors, like one server would be
+    global _memory_database
+    if _memory_database is None:
+        _memory_database = MemoryDatabase(_client_options()[0])
+    return _memory_database
+
+
+def get_database():
+    """Return a pymongo database, or its in-memory stand-in."""
+    global _database
+    if _database is None:
+        name, options = _client_options()
+        if _backend() == 'memory':
+            _database = _memory()
+        else:
+            from pymongo import MongoClient
+            _database = MongoClient(**options)[name]
+    return _database
+
+
+def get_async_database():
+    """Return a motor database, or its in-memory stand-in."""
+    global _async_database
+    if _async_database is None:
+        name, options = _client_options()
+        if _backend() == 'memory':
+            _async_database = AsyncMemoryDatabase(_memory())
+        else:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            _async_database = AsyncIOMotorClient(**options)[name]
+    return _async_database
+
+
+@contextmanager
+def lock(name, timeout=10, lease=30):
+    """
+    Hold the lock ``name`` across processes for the duration of the block.
+
+    A holder that dies without releasing it loses it once its ``lease``
+    (in seconds) runs out. Raises ``TimeoutError`` when the lock can't be
+    acquired within ``timeout`` seconds.
+    """
+    global _locks_indexed
+    locks = get_database()[LOCK_COLLECTION]
+    if not _locks_indexed:
+        locks.create_index('name', unique=True)
+        _locks_indexed = True
+    try:
+        locks.update_one({'name': name}, {'$set': {'name': name}}, upsert=True)
+    except DuplicateKeyError:
+        # Created concurrently by another process
+        pass
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while True:
+        now = datetime.datetime.utcnow()
+        previous = locks.find_one_and_update(
+            {'name': name, '$or': [{'owner': None}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'owner': owner, 'expires_at': now + datetime.timedelta(seconds=lease)}},
+        )
+        if previous is not None:
+            break
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f'Could not acquire the {name} lock')
+        time.sleep(LOCK_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        locks.update_one({'name': name, 'owner': owner}, {'$set': {'owner': None}})
+
+
+def reset():
+    global _async_database, _database, _locks_indexed, _memory_database
+    _async_database = _database = _memory_database = None
+    _locks_indexed = False
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OctofitCursorPagination(CursorPagination):
+    """
+    Keyset pagination over each viewset's ``ordering``.
+
+    Cursors are opaque and stay stable while rows are inserted, and deep
+    pages cost the same as the first one since no offset skip is needed.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
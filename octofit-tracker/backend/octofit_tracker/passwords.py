@@ -0,0 +1,70 @@
+"""
+Password hashing helpers for bulk user imports and repeated logins.
+"""
+import hashlib
+import hmac
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from .caching import TTLCache
+
+_verified = None
+
+
+def needs_hashing(password):
+    return bool(password) and not password.startswith('pbkdf2_')
+
+
+def hash_passwords(raw_passwords, processes=None, chunksize=16):
+    """
+    Hash many passwords, spreading the work over a process pool.
+
+    PBKDF2 is CPU bound, so threads would serialize on the GIL.
+    """
+    raw_passwords = list(raw_passwords)
+    if processes == 1 or len(raw_passwords) < 2:
+        return [make_password(password) for password in raw_passwords]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        return list(pool.map(make_password, raw_passwords, chunksize=chunksize))
+
+
+def verify_password(raw_password, encoded):
+    """
+    ``check_password`` with a bounded, expiring cache of successful checks.
+
+    Entries are keyed on an HMAC of the stored hash and the raw password,
+    so neither is kept in memory and a changed password never matches.
+    """
+    key = hmac.new(
+        settings.SECRET_KEY.encode(),
+        f'{encoded}\0{raw_password}'.encode(),
+        hashlib.sha256,
+    ).digest()
+    cache = _verification_cache()
+    if cache.get(key):
+        return True
+    verified = check_password(raw_password, encoded)
+    if verified:
+        cache.set(key, True)
+    return verified
+
+
+def _verification_cache():
+    global _verified
+    if _verified is None:
+        options = getattr(settings, 'OCTOFIT_PASSWORD_CACHE', {})
+        _verified = TTLCache(
+            maxsize=options.get('MAX_ENTRIES', 10000),
+            ttl=options.get('TIMEOUT', 300),
+        )
+    return _verified
+
+
+def _init_worker():
+    # Workers started with "spawn" need their own app registry
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
@@ -0,0 +1,277 @@
+"""
+Server-sent events for live leaderboard updates.
+
+The leaderboard engine publishes the rank/total diffs of each write to the
+``broadcaster``; connected clients receive only those diffs (optionally
+restricted to one team) instead of polling the full list. Rebuilds and
+batches too large to replay publish a ``reset`` instead, which tells
+clients to refetch.
+
+Events travel over the channel selected by ``OCTOFIT_REALTIME['CHANNEL']``:
+``local`` delivers them to the subscribers of the publishing process only,
+``mongo`` inserts them into a capped collection that every process with
+subscribers tails, so writes handled by any worker (or a management
+command) reach every client.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from pymongo import DESCENDING, CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from . import mongo
+
+EVENTS = ('leaderboard', 'reset')
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+# Larger batches of diffs are sent as a reset
+MAX_DIFFS = 500
+RETRY_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, loop, team_id=None):
+        self.loop = loop
+        self.team_id = team_id
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, diff):
+        return self.team_id is None or diff.get('team_id') == self.team_id
+
+    def deliver(self, event, data):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class LocalChannel:
+    """Delivers events to the subscribers of this process."""
+    shared = False
+
+    def __init__(self, **options):
+        # COLLECTION and COLLECTION_SIZE only apply to the mongo channel
+        self._listeners = []
+
+    def listen(self, dispatch):
+        if dispatch not in self._listeners:
+            self._listeners.append(dispatch)
+
+    def send(self, event, data):
+        for dispatch in list(self._listeners):
+            dispatch(event, data)
+
+
+class MongoChannel:
+    """
+    Relays events between processes through a capped collection. Each
+    listening process follows it with a tailable cursor on a daemon thread,
+    and sends its subscribers a ``reset`` whenever it had to reconnect.
+    """
+    shared = True
+
+    def __init__(self, collection='leaderboard_events', collection_size=1048576):
+        self.name = collection
+        self.size = collection_size
+        self._collection = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def collection(self):
+        if self._collection is None:
+            database = mongo.get_database()
+            try:
+                database.create_collection(self.name, capped=True, size=self.size)
+            except CollectionInvalid:
+                # Already created by another process
+                pass
+            else:
+                # A tailable cursor on an empty collection dies immediately
+                database[self.name].insert_one({'event': 'created', 'data': None})
+            self._collection = database[self.name]
+        return self._collection
+
+    def listen(self, dispatch):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._relay, args=(dispatch,), name='leaderboard-relay', daemon=True
+                )
+                self._thread.start()
+
+    def send(self, event, data):
+        try:
+            self.collection().insert_one({'event': event, 'data': data})
+        except PyMongoError:
+            logger.exception('Could not publish %s event', event)
+
+    def _relay(self, dispatch):
+        last_id = None
+        while True:
+            try:
+                last_id = self.follow(dispatch, last_id)
+            except PyMongoError:
+                logger.exception('Lost the %s cursor', self.name)
+            # Events may have been missed until the cursor is reopened
+            dispatch('reset', {})
+            time.sleep(RETRY_SECONDS)
+
+    def follow(self, dispatch, last_id=None):
+        """
+        Dispatch the events inserted after ``last_id`` (or after the newest
+        one) until the cursor dies; returns the id of the last one seen.
+        """
+        collection = self.collection()
+        if last_id is None:
+            newest = collection.find_one({}, sort=[('$natural', DESCENDING)])
+            last_id = newest['_id'] if newest else None
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            for document in cursor:
+                last_id = document['_id']
+                if document['event'] in EVENTS:
+                    dispatch(document['event'], document['data'])
+        return last_id
+
+
+CHANNELS = {
+    'local': LocalChannel,
+    'mongo': MongoChannel,
+}
+
+_channel = None
+_channel_lock = threading.Lock()
+
+
+def get_channel():
+    """Return the channel configured by ``OCTOFIT_REALTIME``."""
+    global _channel
+    with _channel_lock:
+        if _channel is None:
+            options = {key.lower(): value for key, value in getattr(settings, 'OCTOFIT_REALTIME', {}).items()}
+            _channel = CHANNELS[options.pop('channel', 'local')](**options)
+        return _channel
+
+
+def reset_channel():
+    global _channel
+    with _channel_lock:
+        _channel = None
+
+
+class LeaderboardBroadcaster:
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def has_subscribers(self):
+        """Whether publishing can reach anyone; always, on a shared channel."""
+        return get_channel().shared or bool(self._subscriptions)
+
+    def subscribe(self, team_id=None):
+        subscription = Subscription(asyncio.get_running_loop(), team_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        get_channel().listen(self.dispatch)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, diffs):
+        """Send ``diffs`` to every subscriber; safe to call from any thread."""
+        if len(diffs) > MAX_DIFFS:
+            self.reset()
+        else:
+            get_channel().send('leaderboard', diffs)
+
+    def reset(self):
+        """Tell every subscriber to refetch the leaderboard, e.g. after a rebuild."""
+        get_channel().send('reset', {})
+
+    def dispatch(self, event, data):
+        """Deliver an event from the channel to this process's subscribers."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if event == 'leaderboard':
+                wanted = [diff for diff in data if subscription.wants(diff)]
+                if not wanted:
+                    continue
+            else:
+                wanted = data
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event, wanted)
+
+
+broadcaster = LeaderboardBroadcaster()
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+async def leaderboard_stream(scope, receive, send):
+    """
+    ASGI application streaming leaderboard diffs as ``text/event-stream``.
+
+    ``?team_id=`` restricts the stream to entries of one team. A ``reset``
+    event tells a client that fell behind to refetch the leaderboard.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    team_id = query.get('team_id', [None])[0]
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+
+    subscription = broadcaster.subscribe(team_id)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while not disconnected.done():
+            message = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {message, disconnected},
+                timeout=HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if message in done:
+                body = _event(*message.result())
+            else:
+                message.cancel()
+                if disconnected in done:
+                    break
+                body = b': keepalive\n\n'
+            if subscription.overflowed:
+                subscription.overflowed = False
+                body += _event('reset', {})
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(subscription)
+        disconnected.cancel()
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
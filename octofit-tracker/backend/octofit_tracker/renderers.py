@@ -0,0 +1,72 @@
+"""
+Response renderers.
+
+``FastJSONRenderer`` encodes with orjson when it is installed and falls
+back to DRF's ``JSONRenderer`` otherwise, or when a client asks for
+indented output. ``ColumnarJSONRenderer`` sends lists of rows as a column
+header plus value arrays, and ``MessagePackRenderer`` (requires msgpack)
+sends the same data as the JSON renderer in binary form.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+
+def columnar(data):
+    """
+    Turn a list of dicts, or any list of dicts directly under a dict key
+    (such as ``results``), into ``{'columns': [...], 'rows': [[...], ...]}``.
+    """
+    if isinstance(data, dict):
+        return {key: _columns(value) for key, value in data.items()}
+    return _columns(data)
+
+
+def _columns(value):
+    if not isinstance(value, list) or not value or not all(isinstance(row, dict) for row in value):
+        return value
+    columns = list(value[0])
+    for row in value[1:]:
+        # Rows with different keys (e.g. trimmed diffs) add their columns
+        columns.extend(key for key in row if key not in columns)
+    return {'columns': columns, 'rows': [[row.get(column) for column in columns] for row in value]}
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    media_type = 'application/vnd.octofit.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
@@ -0,0 +1,243 @@
+"""
+Repositories for the hottest leaderboard and activity queries.
+
+``OrmRepository`` goes through the Django ORM (and so through djongo's
+SQL translation); ``MongoRepository`` issues the equivalent pymongo calls
+against the same collections. Both return the same rows, shaped like
+``values()`` dicts with aware datetimes, so the serializers render them
+identically. ``OCTOFIT_REPOSITORY`` selects the one the views use.
+"""
+import base64
+import datetime
+import json
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from . import mongo
+from .caching import invalidate_model
+from .models import Activity, Leaderboard
+
+LEADERBOARD_FIELDS = [field.attname for field in Leaderboard._meta.concrete_fields]
+ACTIVITY_FIELDS = [field.attname for field in Activity._meta.concrete_fields]
+
+DUPLICATE_KEY_CODE = 11000
+
+
+class OrmRepository:
+    def leaderboard_rank(self, user_id):
+        return Leaderboard.objects.filter(user_id=user_id).values_list('rank', flat=True).first()
+
+    def leaderboard_range(self, first_rank, last_rank):
+        """Entries ranked ``first_rank`` to ``last_rank`` inclusive, best first."""
+        return list(
+            Leaderboard.objects.filter(rank__gte=first_rank, rank__lte=last_rank)
+            .order_by('rank', 'id')
+            .values(*LEADERBOARD_FIELDS)
+        )
+
+    def activity_feed(self, user_id, limit, before=None):
+        """
+        The ``limit`` latest activities of a user, newest first, starting
+        after the ``(date, id)`` position ``before``.
+        """
+        queryset = Activity.objects.filter(user_id=user_id)
+        if before is not None:
+            date, last_id = before
+            queryset = queryset.filter(date__lte=date).exclude(date=date, id__gte=last_id)
+        return list(queryset.order_by('-date', '-id').values(*ACTIVITY_FIELDS)[:limit])
+
+    def get_activity(self, pk):
+        return Activity.objects.filter(pk=pk).first()
+
+    def create_activity(self, data):
+        return Activity.objects.create(**data)
+
+    def activities_by_hash(self, content_hashes):
+        """``{content_hash: activity}`` of the stored activities among ``content_hashes``."""
+        return {
+            activity.content_hash: activity
+            for activity in Activity.objects.filter(content_hash__in=list(content_hashes))
+        }
+
+    def activity_hashes(self, since):
+        """Hashes of the activities written since ``since``."""
+        queryset = Activity.objects.filter(updated_at__gte=since)
+        return queryset.values_list('content_hash', flat=True).iterator()
+
+
+class MongoRepository:
+    def __init__(self, database=None):
+        self.database = database if database is not None else mongo.get_database()
+
+    def leaderboard_rank(self, user_id):
+        document = self.database['leaderboard'].find_one({'user_id': user_id}, {'rank': 1})
+        return document['rank'] if document else None
+
+    def leaderboard_range(self, first_rank, last_rank):
+        cursor = self.database['leaderboard'].find(
+            {'rank': {'$gte': first_rank, '$lte': last_rank}}, _projection(LEADERBOARD_FIELDS)
+        ).sort([('rank', ASCENDING), ('id', ASCENDING)])
+        return [_row(document, LEADERBOARD_FIELDS) for document in cursor]
+
+    def activity_feed(self, user_id, limit, before=None):
+        query = {'user_id': user_id}
+        if before is not None:
+            date, last_id = before
+            date = to_mongo(date)
+            query['$or'] = [{'date': {'$lt': date}}, {'date': date, 'id': {'$lt': last_id}}]
+        cursor = self.database['activities'].find(query, _projection(ACTIVITY_FIELDS)).sort(
+            [('date', DESCENDING), ('id', DESCENDING)]
+        ).limit(limit)
+        return [_row(document, ACTIVITY_FIELDS) for document in cursor]
+
+    def get_activity(self, pk):
+        document = self.database['activities'].find_one({'id': int(pk)}, _projection(ACTIVITY_FIELDS))
+        return Activity(**_row(document, ACTIVITY_FIELDS)) if document else None
+
+    def create_activity(self, data):
+        activity = Activity(**data)
+        activity.id = self._next_id('activities')
+        activity.created_at = activity.updated_at = timezone.now()
+        activity.content_hash = activity.compute_content_hash()
+        try:
+            self.database['activities'].insert_one({
+                field: to_mongo(getattr(activity, field)) for field in ACTIVITY_FIELDS
+            })
+        except DuplicateKeyError as error:
+            raise IntegrityError(str(error)) from error
+        # No post_save outside the ORM
+        invalidate_model(Activity)
+        return activity
+
+    def activities_by_hash(self, content_hashes):
+        cursor = self.database['activities'].find(
+            {'content_hash': {'$in': list(content_hashes)}}, _projection(ACTIVITY_FIELDS)
+        )
+        return {
+            document['content_hash']: Activity(**_row(document, ACTIVITY_FIELDS))
+            for document in cursor
+        }
+
+    def activity_hashes(self, since):
+        cursor = self.database['activities'].find(
+            {'updated_at': {'$gte': to_mongo(since)}}, {'content_hash': 1, '_id': 0}
+        )
+        return (document['content_hash'] for document in cursor if document.get('content_hash'))
+
+    def allocate_ids(self, collection, count):
+        """Reserve ``count`` ids from djongo's counter, so ORM inserts don't collide."""
+        schema = self.database['__schema__'].find_one_and_update(
+            {'name': collection},
+            {'$inc': {'auto.seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        last = schema['auto']['seq']
+        return range(last - count + 1, last + 1)
+
+    def _next_id(self, collection):
+        return self.allocate_ids(collection, 1)[0]
+
+
+REPOSITORIES = {
+    'orm': OrmRepository,
+    'mongo': MongoRepository,
+}
+
+
+def get_repository():
+    return REPOSITORIES[getattr(settings, 'OCTOFIT_REPOSITORY', 'orm')]()
+
+
+@contextmanager
+def integrity_errors():
+    """
+    Raise unique index violations as ``IntegrityError``. djongo reports
+    them as a plain ``DatabaseError`` caused by pymongo's write error.
+    """
+    try:
+        yield
+    except IntegrityError:
+        raise
+    except DatabaseError as error:
+        if _is_duplicate_key(error):
+            raise IntegrityError(str(error)) from error
+        raise
+
+
+def _is_duplicate_key(error):
+    while error is not None:
+        if isinstance(error, DuplicateKeyError):
+            return True
+        if isinstance(error, BulkWriteError):
+            return any(
+                write_error.get('code') == DUPLICATE_KEY_CODE
+                for write_error in error.details.get('writeErrors', [])
+            )
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _projection(fields):
+    return dict.fromkeys(fields, 1) | {'_id': 0}
+
+
+def _row(document, fields):
+    return {field: from_mongo(document.get(field)) for field in fields}
+
+
+def to_mongo(value):
+    """``value`` as djongo stores it: datetimes naive in UTC, dates as their midnight."""
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            return timezone.make_naive(value, datetime.timezone.utc)
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def from_mongo(value):
+    """Inverse of ``to_mongo`` for datetimes: stored naive UTC values become aware."""
+    if isinstance(value, datetime.datetime) and timezone.is_naive(value):
+        return timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def encode_cursor(value, last_id):
+    """Opaque keyset position of the last row of a page."""
+    if isinstance(value, datetime.datetime):
+        value = {'$date': from_mongo(value).isoformat()}
+    return base64.urlsafe_b64encode(json.dumps([value, last_id]).encode()).decode()
+
+
+def decode_cursor(cursor, value_type=None):
+    """
+    The ``(value, last_id)`` position of ``cursor``, or ``None`` for no
+    cursor. Raises ``ValueError`` if it wasn't made by ``encode_cursor``,
+    or if its value isn't a ``value_type``.
+    """
+    if not cursor:
+        return None
+    position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(position, list) or len(position) != 2:
+        raise ValueError('Cursors are a [value, id] pair')
+    value, last_id = position
+    if isinstance(value, dict):
+        if list(value) != ['$date'] or not isinstance(value['$date'], str):
+            raise ValueError('Unexpected cursor value')
+        value = datetime.datetime.fromisoformat(value['$date'])
+        if timezone.is_naive(value):
+            raise ValueError('Cursor dates carry a time zone')
+    elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError('Unexpected cursor value')
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise ValueError('Cursor ids are integers')
+    if value_type is not None and not isinstance(value, value_type):
+        raise ValueError(f'Cursor value is not a {value_type.__name__}')
+    return value, last_id
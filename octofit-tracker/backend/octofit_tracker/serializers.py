@@ -1,66 +1,284 @@
+from operator import itemgetter
+
+from django.db.models import Count
 from rest_framework import serializers
-from .models import User, Team, Activity, Leaderboard, Workout
+from .buckets import WINDOWS
+from .models import User, Team, Activity, Leaderboard, TeamStanding, Workout
+
+
+def _pk_values(ids):
+    # Reference fields are stored as strings; skip anything that can't be a pk
+    pks = set()
+    for value in ids:
+        try:
+            pks.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return pks
+
+
+def user_names_by_id(user_ids):
+    """Resolve user names for many ids with a single query."""
+    users = User.objects.filter(pk__in=_pk_values(user_ids)).values_list('pk', 'name')
+    return {str(pk): name for pk, name in users}
+
+
+def user_teams_by_id(user_ids):
+    """Resolve the team of many users with a single query."""
+    users = User.objects.filter(pk__in=_pk_values(user_ids)).values_list('pk', 'team_id')
+    return {str(pk): team_id for pk, team_id in users}
+
+
+def team_names_by_id(team_ids):
+    """Resolve team names for many ids with a single query."""
+    teams = Team.objects.filter(pk__in=_pk_values(team_ids)).values_list('pk', 'name')
+    return {str(pk): name for pk, name in teams}
+
+
+def member_counts_by_team(team_ids):
+    """Count the members of many teams with a single aggregation."""
+    counts = (
+        User.objects.filter(team_id__in={str(team_id) for team_id in team_ids})
+        .values('team_id')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    return {row['team_id']: row['count'] for row in counts}
+
+
+def field_value(obj, name):
+    """Read ``name`` from a model instance or a ``values()`` row."""
+    return obj[name] if isinstance(obj, dict) else getattr(obj, name)
+
+
+# Fields whose to_representation is a no-op for the values the database returns
+_PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField)
 
 
-class UserSerializer(serializers.ModelSerializer):
-    id = serializers.SerializerMethodField()
+class RowListSerializer(serializers.ListSerializer):
+    """
+    Read-only fast path for lists of ``values()`` rows.
+
+    The child's fields are compiled once into ``(name, converter)`` pairs
+    that read straight from the row dicts, reusing each field's
+    ``to_representation`` only where it changes the value. The output
+    matches the regular serializer; model instances still take the regular
+    path.
+    """
+
+    def to_representation(self, data):
+        rows = data if isinstance(data, list) else list(data)
+        if not rows or not isinstance(rows[0], dict):
+            return super().to_representation(rows)
+        converters = self._converters()
+        return [{name: convert(row) for name, convert in converters} for row in rows]
+
+    def _converters(self):
+        pk_name = self.child.Meta.model._meta.pk.name
+        converters = []
+        for name, field in self.child.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                converters.append((name, getattr(self.child, field.method_name)))
+                continue
+            column = pk_name if field.source == 'pk' else field.source
+            if isinstance(field, _PASSTHROUGH_FIELDS) and column != pk_name:
+                converters.append((name, itemgetter(column)))
+            else:
+                converters.append((name, _converter(column, field.to_representation)))
+        return converters
+
+
+def _converter(column, to_representation):
+    def convert(row):
+        value = row[column]
+        return None if value is None else to_representation(value)
+    return convert
+
+
+class SparseFieldsMixin:
+    """
+    Limit the output to the ``fields`` set in the serializer context
+    (from ``?fields=``).
+
+    ``field_sources`` maps output fields that aren't model fields to the
+    model fields they are computed from, so views can load only those.
+    """
+    field_sources = {'id': ('id',)}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+    @classmethod
+    def readable_fields(cls):
+        return {name for name, field in cls().fields.items() if not field.write_only}
+
+    @classmethod
+    def model_fields_for(cls, names):
+        """Names of the model fields needed to render the output ``names``."""
+        concrete = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        needed = set()
+        for name in names:
+            needed.update(cls.field_sources.get(name, (name,) if name in concrete else ()))
+        return needed
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.CharField(source='pk', read_only=True)
     
     class Meta:
         model = User
         fields = ['id', 'name', 'email', 'password', 'team_id', 'created_at']
         extra_kwargs = {'password': {'write_only': True}}
+
+
+class UserBulkSerializer(UserSerializer):
+    """Per-item validation for bulk imports; email uniqueness is checked in one query by the view."""
     
-    def get_id(self, obj):
-        return str(obj.pk)
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            'password': {'write_only': True},
+            'email': {'validators': []},
+        }
 
 
-class TeamSerializer(serializers.ModelSerializer):
-    id = serializers.SerializerMethodField()
+class TeamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.CharField(source='pk', read_only=True)
     member_count = serializers.SerializerMethodField()
+    field_sources = {'id': ('id',), 'member_count': ('id',)}
     
     class Meta:
         model = Team
         fields = ['id', 'name', 'description', 'member_count', 'created_at']
     
-    def get_id(self, obj):
-        return str(obj.pk)
+    @classmethod
+    def prefetch_lookups(cls, teams, fields=None):
+        if fields and 'member_count' not in fields:
+            return {}
+        return {'member_counts': member_counts_by_team(team.pk for team in teams)}
     
     def get_member_count(self, obj):
+        member_counts = self.context.get('member_counts')
+        if member_counts is not None:
+            return member_counts.get(str(obj.pk), 0)
         # Count users that belong to this team
         return User.objects.filter(team_id=str(obj.pk)).count()
 
 
-class ActivitySerializer(serializers.ModelSerializer):
-    id = serializers.SerializerMethodField()
+class ActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.CharField(source='pk', read_only=True)
     
     class Meta:
         model = Activity
         fields = ['id', 'user_id', 'activity_type', 'duration', 'distance', 'calories', 'date', 'created_at']
-    
-    def get_id(self, obj):
-        return str(obj.pk)
+        list_serializer_class = RowListSerializer
+
+
+class ActivityFilterSerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    user_id = serializers.CharField(required=False)
+
+
+class ActivityFeedQuerySerializer(serializers.Serializer):
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=500)
+    cursor = serializers.CharField(required=False)
+
+
+class ActivityStatsQuerySerializer(ActivityFilterSerializer):
+    group_by = serializers.ChoiceField(choices=['user', 'team', 'activity_type', 'day', 'week'])
+
+
+class ActivityExportQuerySerializer(ActivityFilterSerializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+
+class LeaderboardExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    user_id = serializers.CharField(required=False)
+    team_id = serializers.CharField(required=False)
+
+
+class LeaderboardWindowQuerySerializer(serializers.Serializer):
+    window = serializers.ChoiceField(choices=list(WINDOWS))
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=500)
+
+
+class LeaderboardTopQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(default=10, min_value=1, max_value=500)
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
-    id = serializers.SerializerMethodField()
+class LeaderboardAroundQuerySerializer(serializers.Serializer):
+    radius = serializers.IntegerField(default=5, min_value=0, max_value=50)
+
+
+class LeaderboardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.CharField(source='pk', read_only=True)
     user = serializers.SerializerMethodField()
     team = serializers.SerializerMethodField()
+    field_sources = {'id': ('id',), 'user': ('user_id',), 'team': ('team_id',)}
     
     class Meta:
         model = Leaderboard
         fields = ['id', 'user_id', 'user', 'team_id', 'team', 'total_calories', 'total_activities', 'total_duration', 'rank', 'updated_at']
+        list_serializer_class = RowListSerializer
     
-    def get_id(self, obj):
-        return str(obj.pk)
+    @classmethod
+    def prefetch_lookups(cls, entries, fields=None):
+        lookups = {}
+        if not fields or 'user' in fields:
+            lookups['user_names'] = user_names_by_id(field_value(entry, 'user_id') for entry in entries)
+        if not fields or 'team' in fields:
+            lookups['team_names'] = team_names_by_id(field_value(entry, 'team_id') for entry in entries)
+        return lookups
     
     def get_user(self, obj):
+        user_id = field_value(obj, 'user_id')
+        user_names = self.context.get('user_names')
+        if user_names is not None:
+            return user_names.get(str(user_id), "Unknown User")
         try:
-            user = User.objects.get(pk=obj.user_id)
+            user = User.objects.get(pk=user_id)
             return user.name
         except User.DoesNotExist:
             return "Unknown User"
     
     def get_team(self, obj):
+        team_id = field_value(obj, 'team_id')
+        team_names = self.context.get('team_names')
+        if team_names is not None:
+            return team_names.get(str(team_id))
+        try:
+            team = Team.objects.get(pk=team_id)
+            return team.name
+        except (Team.DoesNotExist, ValueError):
+            return None
+
+
+class TeamStandingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.CharField(source='pk', read_only=True)
+    team = serializers.SerializerMethodField()
+    field_sources = {'id': ('id',), 'team': ('team_id',)}
+    
+    class Meta:
+        model = TeamStanding
+        fields = ['id', 'team_id', 'team', 'total_calories', 'total_activities', 'total_duration', 'member_count', 'average_calories', 'rank', 'updated_at']
+    
+    @classmethod
+    def prefetch_lookups(cls, standings, fields=None):
+        if fields and 'team' not in fields:
+            return {}
+        return {'team_names': team_names_by_id(standing.team_id for standing in standings)}
+    
+    def get_team(self, obj):
+        team_names = self.context.get('team_names')
+        if team_names is not None:
+            return team_names.get(str(obj.team_id))
         try:
             team = Team.objects.get(pk=obj.team_id)
             return team.name
@@ -68,12 +286,10 @@ class LeaderboardSerializer(serializers.ModelSerializer):
             return None
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
-    id = serializers.SerializerMethodField()
+class WorkoutSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.CharField(source='pk', read_only=True)
     
     class Meta:
         model = Workout
         fields = ['id', 'name', 'description', 'activity_type', 'difficulty', 'duration', 'calories_per_session', 'created_at']
-    
-    def get_id(self, obj):
-        return str(obj.pk)
+        list_serializer_class = RowListSerializer
@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
+from octofit_tracker.db_pool import client_options
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.middleware.RequestProfilingMiddleware',
+    'octofit_tracker.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -84,18 +89,63 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# MongoClient options (pool size, timeouts, compression) come from MONGO_*
+# environment variables, see octofit_tracker/db_pool.py
+
 DATABASES = {
     'default': {
         'ENGINE': 'djongo',
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
-        'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
+        'CLIENT': client_options(os.environ),
+    }
+}
+
+# OCTOFIT_DB=sqlite runs on the SQLite file OCTOFIT_SQLITE_NAME instead, e.g.
+# to benchmark the API without a MongoDB server:
+#   OCTOFIT_DB=sqlite python manage.py migrate
+#   OCTOFIT_DB=sqlite python manage.py benchmark_api --seed-users 100
+# The native MongoDB paths then default to the in-memory stand-in.
+OCTOFIT_DB = os.environ.get('OCTOFIT_DB', 'mongo')
+if OCTOFIT_DB == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('OCTOFIT_SQLITE_NAME', BASE_DIR / 'db.sqlite3'),
         }
     }
+
+# List endpoints read through a second client with this read preference
+# (e.g. 'secondaryPreferred') when set
+OCTOFIT_LIST_READ_PREFERENCE = os.environ.get('MONGO_LIST_READ_PREFERENCE')
+if OCTOFIT_LIST_READ_PREFERENCE and OCTOFIT_DB != 'sqlite':
+    DATABASES['list_reads'] = dict(
+        DATABASES['default'],
+        CLIENT=client_options(os.environ, read_preference=OCTOFIT_LIST_READ_PREFERENCE),
+        TEST={'MIRROR': 'default'},
+    )
+
+
+# Native MongoDB access used by the async read views: 'mongo' (motor/pymongo
+# clients built from DATABASES['default']) or 'memory' (in-process stand-in)
+OCTOFIT_MONGO = {
+    'BACKEND': os.environ.get('OCTOFIT_MONGO_BACKEND', 'memory' if OCTOFIT_DB == 'sqlite' else 'mongo'),
 }
 
+# Live leaderboard events: 'local' reaches the stream clients of the
+# publishing process only; 'mongo' relays them through the COLLECTION capped
+# collection (COLLECTION_SIZE bytes) to every worker, and makes each write
+# compute its rank diffs whether or not a client is connected
+OCTOFIT_REALTIME = {
+    'CHANNEL': os.environ.get('OCTOFIT_REALTIME_CHANNEL', 'local'),
+    'COLLECTION': 'leaderboard_events',
+    'COLLECTION_SIZE': 1048576,
+}
+
+# Data access for the hot leaderboard/activity queries: 'orm' (djongo) or
+# 'mongo' (pymongo through OCTOFIT_MONGO, skipping the SQL translation)
+OCTOFIT_REPOSITORY = os.environ.get('OCTOFIT_REPOSITORY', 'orm')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -138,6 +188,83 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        # Uses orjson when installed
+        'octofit_tracker.renderers.FastJSONRenderer',
+        'octofit_tracker.renderers.ColumnarJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ] + (
+        ['octofit_tracker.renderers.MessagePackRenderer'] if find_spec('msgpack') else []
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'octofit_tracker.pagination.OctofitCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('OCTOFIT_PAGE_SIZE', 50)),
+}
+
+# Number of activities written per insert by the bulk ingestion endpoint
+OCTOFIT_BULK_BATCH_SIZE = 500
+
+# Days of per-user activity buckets kept for the windowed leaderboards
+OCTOFIT_BUCKET_RETENTION_DAYS = 30
+
+# Days a delta-sync token stays valid (deletion tombstones are kept this long)
+OCTOFIT_TOMBSTONE_RETENTION_DAYS = 30
+
+# Delta-sync tokens trail the read by this much, so writes stamped before
+# the read but committed after it are still picked up by the next sync
+OCTOFIT_SYNC_SAFETY_LAG_SECONDS = 5
+
+# Duplicate activity detection: the per-process Bloom filter holds the
+# content hashes written in the last FILTER_WINDOW_HOURS, starting at
+# FILTER_CAPACITY and growing past it at FILTER_ERROR_RATE; Idempotency-Key
+# records are kept KEY_TTL_HOURS
+OCTOFIT_IDEMPOTENCY = {
+    'FILTER_CAPACITY': 100000,
+    'FILTER_ERROR_RATE': 0.01,
+    'FILTER_WINDOW_HOURS': 72,
+    'KEY_TTL_HOURS': 24,
+}
+
+# Octofit caches
+# Response cache BACKEND is 'local' (per process), 'django' (uses CACHES[ALIAS])
+# or the dotted path of a class with the same interface. Each backend takes
+# the options it knows: MAX_ENTRIES is local only, ALIAS and PREFIX django only.
+# GENERATIONS (local only) keeps the invalidation counters in 'mongo', shared
+# by all workers, or 'local'; unset, it is 'mongo' on a MongoDB database.
+
+OCTOFIT_RESPONSE_CACHE = {
+    'BACKEND': os.environ.get('OCTOFIT_RESPONSE_CACHE_BACKEND', 'local'),
+    'MAX_ENTRIES': 512,
+    'TIMEOUT': 300,
+    'GENERATIONS': os.environ.get('OCTOFIT_RESPONSE_CACHE_GENERATIONS'),
+}
+
+OCTOFIT_PASSWORD_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 300,
+}
+
+# Response compression: brotli (when installed) or gzip, negotiated by
+# Accept-Encoding, for non-streaming responses of at least MIN_SIZE bytes
+OCTOFIT_COMPRESSION = {
+    'ENABLED': os.environ.get('OCTOFIT_COMPRESSION', '1').lower() in ('1', 'true', 'yes'),
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+# Per-request query counts and timings (Server-Timing header and
+# /api/stats/requests/). Requests slower than LOG_THRESHOLD_MS are logged
+# with their queries; None disables the log.
+OCTOFIT_REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('OCTOFIT_REQUEST_PROFILING', '').lower() in ('1', 'true', 'yes'),
+    'SLOWEST': 20,
+    'LOG_THRESHOLD_MS': None,
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_METHODS = [
@@ -154,8 +281,13 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
 ]
+CORS_EXPOSE_HEADERS = [
+    'idempotent-replayed',
+    'x-sync-token',
+]
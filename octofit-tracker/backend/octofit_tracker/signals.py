@@ -0,0 +1,68 @@
+from django.core.signals import setting_changed
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import leaderboard, mongo, realtime, sync
+from .caching import invalidate_model, reset_response_cache
+from .models import User, Team, Activity, ActivityDayBucket, Leaderboard, TeamStanding, Workout
+
+CACHED_MODELS = (User, Team, Activity, ActivityDayBucket, Leaderboard, TeamStanding, Workout)
+SYNCED_MODELS = (User, Team, Activity, Leaderboard)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_responses(sender, **kwargs):
+    if sender in CACHED_MODELS:
+        invalidate_model(sender)
+
+
+@receiver(post_delete)
+def record_tombstone(sender, instance, **kwargs):
+    if sender in SYNCED_MODELS:
+        sync.record_deletion(instance)
+
+
+# Team of a user as last loaded or saved, or DEFERRED if it wasn't loaded
+@receiver(post_init, sender=User)
+def remember_team(sender, instance, **kwargs):
+    instance._saved_team_id = instance.__dict__.get('team_id', DEFERRED)
+
+
+@receiver(pre_save, sender=User)
+def load_saved_team(sender, instance, raw=False, **kwargs):
+    if instance._state.adding or raw or instance._saved_team_id is not DEFERRED:
+        return
+    if 'team_id' in instance.__dict__:
+        instance._saved_team_id = (
+            User.objects.filter(pk=instance.pk).values_list('team_id', flat=True).first()
+        )
+
+
+# Membership counts of the team standings; bulk_create sends no post_save,
+# so bulk inserts call leaderboard.record_users_created() themselves
+@receiver(post_save, sender=User)
+def track_team_membership(sender, instance, created, raw=False, **kwargs):
+    if not raw and leaderboard.membership_tracked():
+        if created:
+            leaderboard.record_users_created([instance])
+        elif 'team_id' in instance.__dict__:
+            leaderboard.record_user_moved(instance, instance._saved_team_id)
+    instance._saved_team_id = instance.__dict__.get('team_id', DEFERRED)
+
+
+@receiver(post_delete, sender=User)
+def untrack_team_membership(sender, instance, **kwargs):
+    if leaderboard.membership_tracked():
+        leaderboard.record_user_deleted(instance)
+
+
+@receiver(setting_changed)
+def reset_caches(setting, **kwargs):
+    if setting == 'OCTOFIT_RESPONSE_CACHE':
+        reset_response_cache()
+    elif setting == 'OCTOFIT_MONGO':
+        mongo.reset()
+    elif setting == 'OCTOFIT_REALTIME':
+        realtime.reset_channel()
@@ -0,0 +1,132 @@
+"""
+Activity summaries computed by the database.
+
+Each grouping is a single aggregation query (``$group`` on MongoDB), so
+only one row per group leaves the database. djongo can't translate
+``TruncDate``/``TruncWeek``, so on MongoDB days and weeks are grouped by a
+``$dateToString`` pipeline run through ``mongo`` instead of the ORM.
+"""
+import datetime
+
+from django.db import connections
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
+
+from . import mongo
+from .models import Activity
+from .repository import to_mongo
+from .serializers import team_names_by_id, user_teams_by_id
+
+TOTALS = {
+    'total_calories': Sum('calories'),
+    'total_duration': Sum('duration'),
+    'total_distance': Sum('distance'),
+    'total_activities': Count('pk'),
+}
+
+# ISO week-numbering year and week, so weeks sort as strings
+CALENDAR_FORMATS = {
+    'day': '%Y-%m-%d',
+    'week': '%G-%V',
+}
+
+
+def filter_activities(queryset, start=None, end=None, user_id=None):
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lt=end)
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    return queryset
+
+
+def activity_summary(group_by, start=None, end=None, user_id=None):
+    """
+    Return one totals row per group of the activities in ``[start, end)``,
+    largest calorie total first; days and weeks come in date order.
+    """
+    if group_by in CALENDAR_FORMATS:
+        return _calendar_summary(group_by, start, end, user_id)
+    queryset = filter_activities(Activity.objects.all(), start, end, user_id)
+    if group_by == 'team':
+        return _team_summary(queryset)
+    if group_by == 'user':
+        rows = queryset.values('user_id')
+    elif group_by == 'activity_type':
+        rows = queryset.values('activity_type')
+    else:
+        raise ValueError(f'Unknown grouping: {group_by}')
+    return list(rows.annotate(**TOTALS).order_by('-total_calories'))
+
+
+def _calendar_summary(group_by, start, end, user_id):
+    # Local days, or the Mondays of weeks
+    queryset = filter_activities(Activity.objects.all(), start, end, user_id)
+    if connections[queryset.db].vendor == 'djongo':
+        rows = _mongo_calendar_rows(group_by, start, end, user_id)
+    else:
+        trunc = TruncDate if group_by == 'day' else TruncWeek
+        period = trunc('date', output_field=DateField(), tzinfo=timezone.get_current_timezone())
+        rows = queryset.annotate(period=period).values('period').annotate(**TOTALS).order_by('period')
+    return [
+        {group_by: row['period'], **{field: row[field] or 0 for field in TOTALS}}
+        for row in rows
+    ]
+
+
+def _mongo_calendar_rows(group_by, start, end, user_id):
+    match = {}
+    if start is not None:
+        match.setdefault('date', {})['$gte'] = to_mongo(start)
+    if end is not None:
+        match.setdefault('date', {})['$lt'] = to_mongo(end)
+    if user_id is not None:
+        match['user_id'] = user_id
+    period = {'$dateToString': {
+        'format': CALENDAR_FORMATS[group_by],
+        'date': '$date',
+        'timezone': timezone.get_current_timezone_name(),
+    }}
+    pipeline = [
+        {'$match': match},
+        {'$group': {
+            '_id': period,
+            'total_calories': {'$sum': '$calories'},
+            'total_duration': {'$sum': '$duration'},
+            'total_distance': {'$sum': '$distance'},
+            'total_activities': {'$sum': 1},
+        }},
+        {'$sort': {'_id': 1}},
+    ]
+    for row in mongo.get_database()['activities'].aggregate(pipeline):
+        if group_by == 'week':
+            year, week = map(int, row['_id'].split('-'))
+            row['period'] = datetime.date.fromisocalendar(year, week, 1)
+        else:
+            row['period'] = datetime.date.fromisoformat(row['_id'])
+        yield row
+
+
+def _team_summary(queryset):
+    # Activities only reference users, so fold the per-user rows into teams
+    per_user = queryset.values('user_id').annotate(**TOTALS).order_by()
+    per_user = list(per_user)
+    user_teams = user_teams_by_id(row['user_id'] for row in per_user)
+    teams = {}
+    for row in per_user:
+        team_id = user_teams.get(str(row['user_id']))
+        team = teams.setdefault(team_id, {
+            'team_id': team_id,
+            'total_calories': 0,
+            'total_duration': 0,
+            'total_distance': 0,
+            'total_activities': 0,
+        })
+        for field in ('total_calories', 'total_duration', 'total_distance', 'total_activities'):
+            team[field] += row[field] or 0
+    names = team_names_by_id(team_id for team_id in teams if team_id)
+    for team in teams.values():
+        team['team'] = names.get(team['team_id'])
+    return sorted(teams.values(), key=lambda team: team['total_calories'], reverse=True)
@@ -0,0 +1,107 @@
+"""
+Delta sync: what changed in a collection since a client's last sync.
+
+Tracked models carry an indexed ``updated_at`` and leave a ``Tombstone``
+when deleted. A sync token is the server time at which a read started,
+less ``OCTOFIT_SYNC_SAFETY_LAG_SECONDS``; the next read with
+``?since=<token>`` returns only the rows updated and the ids deleted
+after it. ``updated_at`` is stamped before a write commits, so the lag
+has to cover the slowest write and the clock skew between servers; rows
+inside it are sent again by the next sync. Tombstones older than
+``OCTOFIT_TOMBSTONE_RETENTION_DAYS`` are pruned, so older tokens expire
+and the client has to fetch the full list again.
+"""
+import base64
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Tombstone
+
+PRUNE_INTERVAL_SECONDS = 3600
+
+_last_pruned = None
+_prune_lock = threading.Lock()
+_state = threading.local()
+
+
+class ExpiredToken(Exception):
+    pass
+
+
+def retention_days():
+    return getattr(settings, 'OCTOFIT_TOMBSTONE_RETENTION_DAYS', 30)
+
+
+def safety_lag():
+    return datetime.timedelta(seconds=getattr(settings, 'OCTOFIT_SYNC_SAFETY_LAG_SECONDS', 5))
+
+
+def token_time(read_at):
+    """The time to put in the token of a read that started at ``read_at``."""
+    return read_at - safety_lag()
+
+
+def encode_token(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode()
+
+
+def decode_token(token):
+    """Return the aware datetime of ``token``; raises ``ValueError`` if malformed."""
+    moment = datetime.datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    if timezone.is_naive(moment):
+        raise ValueError('Sync tokens carry a time zone')
+    return moment
+
+
+def changes(queryset, model, since, until):
+    """
+    Rows of ``queryset`` updated in ``(since, until]`` and the ids of
+    ``model`` rows deleted in that window.
+    """
+    if since < timezone.now() - datetime.timedelta(days=retention_days()):
+        raise ExpiredToken
+    changed = queryset.filter(updated_at__gt=since, updated_at__lte=until).order_by('updated_at', 'pk')
+    deleted = Tombstone.objects.filter(
+        model=model._meta.label_lower, deleted_at__gt=since, deleted_at__lte=until
+    ).order_by('deleted_at', 'pk').values_list('object_id', flat=True)
+    return changed, list(deleted)
+
+
+def record_deletion(instance):
+    if getattr(_state, 'suppressed', False):
+        return
+    Tombstone.objects.create(model=instance._meta.label_lower, object_id=str(instance.pk))
+    prune_if_due()
+
+
+@contextmanager
+def tombstones_suppressed():
+    """Skip tombstones for deletes in this block, e.g. when wiping a collection."""
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def prune(now=None):
+    """Delete the tombstones no valid token can ask for any more."""
+    oldest = (now or timezone.now()) - datetime.timedelta(days=retention_days())
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=oldest).delete()
+    return deleted
+
+
+def prune_if_due():
+    global _last_pruned
+    now = time.monotonic()
+    with _prune_lock:
+        if _last_pruned is not None and now - _last_pruned < PRUNE_INTERVAL_SECONDS:
+            return
+        _last_pruned = now
+    prune()
@@ -1,8 +1,84 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock, skipUnless
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import User, Team, Activity, Leaderboard, Workout
-from datetime import datetime
+from . import (
+    benchmark, buckets, caching, idempotency, leaderboard, middleware, mongo, realtime, renderers, repository,
+    sync
+)
+from .caching import DjangoResponseCache, TTLCache, get_response_cache
+from .db_pool import client_options, pool_listener
+from .management.commands.populate_db import Command as PopulateCommand
+from .management.commands.rebuild_leaderboard import aggregate_shard
+from .middleware import request_profiles
+from .models import (
+    User, Team, Activity, ActivityDayBucket, Leaderboard, TeamStanding, Tombstone, Workout
+)
+from .realtime import broadcaster
+from .renderers import FastJSONRenderer
+from .serializers import ActivitySerializer, LeaderboardSerializer, WorkoutSerializer
+from datetime import datetime, timedelta
+
+import djongo.base  # noqa: F401 - djongo.sql2mongo needs it imported first
+import sqlparse
+from djongo.sql2mongo.query import DeleteQuery, SelectQuery, UpdateQuery
+from pymongo import CursorType
+
+DJONGO_QUERIES = {'SELECT': SelectQuery, 'UPDATE': UpdateQuery, 'DELETE': DeleteQuery}
+
+
+class DjongoSQLMixin:
+    """
+    The tests run on SQLite, which accepts SQL djongo (the production
+    engine) can't translate to MongoDB; this runs the statements of a block
+    through djongo's translator as well.
+    """
+
+    @contextmanager
+    def assertDjongoTranslates(self):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            yield
+        rejected = []
+        for sql, params in statements:
+            indexes = iter(range(len(params or ())))
+            # djongo numbers the placeholders before parsing
+            statement = sqlparse.parse(re.sub('%s', lambda _: f'%({next(indexes)})s', sql))[0]
+            query = DJONGO_QUERIES.get(statement.get_type())
+            if query is None:
+                continue
+            try:
+                query(None, None, statement, params)
+            except Exception:
+                rejected.append(sql)
+        if rejected:
+            self.fail('djongo can\'t translate:\n' + '\n'.join(rejected))
 
 
 class UserModelTest(TestCase):
@@ -112,3 +188,1641 @@ class TeamAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Team.objects.count(), 1)
         self.assertEqual(Team.objects.get().name, 'API Test Team')
+
+
+class LeaderboardUpdateAPITest(DjongoSQLMixin, APITestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name="Team A", description="A team")
+        self.alice = User.objects.create(
+            name="Alice", email="alice@example.com", password="alicepass",
+            team_id=str(self.team.pk)
+        )
+        self.bob = User.objects.create(
+            name="Bob", email="bob@example.com", password="bobpass"
+        )
+
+    def post_activity(self, user, calories, duration=30):
+        data = {
+            'user_id': str(user.pk),
+            'activity_type': 'Running',
+            'duration': duration,
+            'calories': calories,
+            'date': '2026-01-01T10:00:00Z'
+        }
+        response = self.client.post('/api/activities/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def entry(self, user):
+        return Leaderboard.objects.get(user_id=str(user.pk))
+
+    def test_create_activity_updates_totals(self):
+        self.post_activity(self.alice, 300)
+        self.post_activity(self.alice, 200, duration=20)
+        entry = self.entry(self.alice)
+        self.assertEqual(entry.total_calories, 500)
+        self.assertEqual(entry.total_activities, 2)
+        self.assertEqual(entry.total_duration, 50)
+        self.assertEqual(entry.team_id, str(self.team.pk))
+        self.assertEqual(entry.rank, 1)
+
+    def test_ranks_follow_updates_and_deletes(self):
+        self.post_activity(self.alice, 300)
+        activity_id = self.post_activity(self.bob, 100)
+        self.assertEqual(self.entry(self.alice).rank, 1)
+        self.assertEqual(self.entry(self.bob).rank, 2)
+
+        response = self.client.patch(
+            f'/api/activities/{activity_id}/', {'calories': 400}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.entry(self.bob).total_calories, 400)
+        self.assertEqual(self.entry(self.bob).rank, 1)
+        self.assertEqual(self.entry(self.alice).rank, 2)
+
+        response = self.client.delete(f'/api/activities/{activity_id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        bob = self.entry(self.bob)
+        self.assertEqual(bob.total_calories, 0)
+        self.assertEqual(bob.total_activities, 0)
+        self.assertEqual(bob.rank, 2)
+        self.assertEqual(self.entry(self.alice).rank, 1)
+
+    def test_rank_shifts_run_on_djongo(self):
+        self.post_activity(self.alice, 300)
+        self.post_activity(self.bob, 100)
+        with self.assertDjongoTranslates():
+            self.post_activity(self.bob, 400, duration=40)
+        self.assertEqual(self.entry(self.bob).rank, 1)
+        self.assertEqual(self.entry(self.alice).rank, 2)
+
+    @override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'})
+    def test_updates_hold_the_board_locks_without_transactions(self):
+        mongo.reset()
+        self.addCleanup(mongo.reset)
+        locks = mongo.get_database()[mongo.LOCK_COLLECTION]
+        with mock.patch.object(connection.features, 'supports_transactions', False):
+            with leaderboard.serialized(Leaderboard):
+                # Nested updates of a board don't wait for their own lock
+                with leaderboard.serialized(Leaderboard):
+                    self.assertIsNotNone(locks.find_one({'name': 'leaderboard_updates'})['owner'])
+                with self.assertRaises(TimeoutError):
+                    with mongo.lock('leaderboard_updates', timeout=0):
+                        pass
+            self.post_activity(self.alice, 300)
+        self.assertEqual(self.entry(self.alice).total_calories, 300)
+        self.assertEqual(
+            {lock['name']: lock['owner'] for lock in locks.find()},
+            {'leaderboard_updates': None, 'team_standings_updates': None},
+        )
+
+    @override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'})
+    def test_expired_lock_is_taken_over(self):
+        mongo.reset()
+        self.addCleanup(mongo.reset)
+        with mongo.lock('leaderboard_updates', lease=-1):
+            with mongo.lock('leaderboard_updates', timeout=0):
+                pass
+
+
+class ListQueryCountAPITest(APITestCase):
+    def setUp(self):
+        self.teams = [
+            Team.objects.create(name=f"Team {i}", description="A team") for i in range(3)
+        ]
+        for i in range(6):
+            team = self.teams[i % 3]
+            user = User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com",
+                password="pbkdf2_sha256$already-hashed", team_id=str(team.pk)
+            )
+            Leaderboard.objects.create(
+                user_id=str(user.pk), team_id=str(team.pk),
+                total_calories=100 * i, rank=6 - i
+            )
+
+    def test_leaderboard_list_resolves_names_in_bulk(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.data['results'][0]
+        self.assertEqual(first['user'], 'User 5')
+        self.assertEqual(first['team'], 'Team 2')
+
+    def test_team_list_counts_members_in_bulk(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/teams/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([team['member_count'] for team in response.data['results']], [2, 2, 2])
+
+
+class CursorPaginationAPITest(APITestCase):
+    def setUp(self):
+        for i in range(5):
+            Activity.objects.create(
+                user_id="user123",
+                activity_type="Running",
+                duration=30,
+                calories=100 + i,
+                date=f"2026-01-0{i + 1}T10:00:00Z"
+            )
+
+    def test_pages_follow_ordering_without_overlap(self):
+        response = self.client.get('/api/activities/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        seen = [activity['calories'] for activity in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(activity['calories'] for activity in response.data['results'])
+        self.assertEqual(seen, [104, 103, 102, 101, 100])
+
+    def test_large_page_size_returns_single_page(self):
+        response = self.client.get('/api/activities/', {'page_size': 10000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+
+class SyncIndexesCommandTest(TransactionTestCase):
+    def test_reports_declared_indexes(self):
+        out = StringIO()
+        call_command('sync_indexes', stdout=out)
+        output = out.getvalue()
+        self.assertIn('ok       activities_user_date_idx', output)
+        self.assertIn('ok       leaderboard_team_rank_idx', output)
+        self.assertIn('All declared indexes exist', output)
+
+    def test_creates_missing_indexes(self):
+        index = Leaderboard._meta.indexes[0]
+        with connection.schema_editor() as schema_editor:
+            schema_editor.remove_index(Leaderboard, index)
+        out = StringIO()
+        call_command('sync_indexes', create=True, stdout=out)
+        self.assertIn(f'created  {index.name}', out.getvalue())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'leaderboard')
+        self.assertIn(index.name, constraints)
+
+
+class PopulateDbCommandTest(TestCase):
+    def test_synthetic_dataset_in_batches(self):
+        call_command(
+            'populate_db', users=20, activities_per_user=3, seed=7, batch_size=6,
+            stdout=StringIO()
+        )
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Activity.objects.count(), 60)
+        self.assertEqual(Leaderboard.objects.count(), 20)
+        self.assertEqual(
+            sum(TeamStanding.objects.values_list('member_count', flat=True)), 20
+        )
+        self.assertEqual(
+            sum(TeamStanding.objects.values_list('total_calories', flat=True)),
+            sum(Activity.objects.values_list('calories', flat=True))
+        )
+
+        entries = list(Leaderboard.objects.order_by('rank'))
+        self.assertEqual([entry.rank for entry in entries], list(range(1, 21)))
+        calories = [entry.total_calories for entry in entries]
+        self.assertEqual(calories, sorted(calories, reverse=True))
+        for entry in entries[:3]:
+            activities = Activity.objects.filter(user_id=entry.user_id)
+            self.assertEqual(entry.total_calories, sum(a.calories for a in activities))
+            self.assertEqual(entry.total_activities, 3)
+
+    def test_activities_spread_over_the_day(self):
+        call_command('populate_db', users=1, activities_per_user=50, seed=5, stdout=StringIO())
+        dates = list(Activity.objects.values_list('date', flat=True))
+        self.assertGreater(len({date.time() for date in dates}), len({date.date() for date in dates}))
+
+    def test_exhausted_draws_fail_clearly(self):
+        command = PopulateCommand()
+        # Every draw repeats the first activity
+        command.rng = mock.Mock(
+            choice=lambda items: items[0], randint=lambda low, high: low,
+            uniform=lambda low, high: low, randrange=lambda stop: 0,
+        )
+        with self.assertRaisesMessage(CommandError, 'Could not generate 2 distinct activities'):
+            list(command.generate_activities({'1': '1'}, 2, {'1': [0, 0, 0]}))
+
+    def test_seed_makes_dataset_reproducible(self):
+        call_command('populate_db', users=5, seed=3, stdout=StringIO())
+        first = sorted(Activity.objects.values_list('calories', flat=True))
+        call_command('populate_db', users=5, seed=3, stdout=StringIO())
+        second = sorted(Activity.objects.values_list('calories', flat=True))
+        self.assertEqual(first, second)
+
+
+class TTLCacheTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = TTLCache(maxsize=2, ttl=10, timer=lambda: self.now)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+
+class PasswordHashingTest(TestCase):
+    def test_verify_password_caches_successful_checks(self):
+        user = User.objects.create(name="Cached", email="cached@example.com", password="secret123")
+        with mock.patch('octofit_tracker.passwords.check_password', wraps=check_password) as checked:
+            self.assertTrue(user.verify_password("secret123"))
+            self.assertTrue(user.verify_password("secret123"))
+            self.assertFalse(user.verify_password("wrong"))
+        self.assertEqual(checked.call_count, 2)
+
+    def test_bulk_create_hashed(self):
+        users = [
+            User(name=f"Bulk {i}", email=f"bulk{i}@example.com", password=f"pass{i}")
+            for i in range(3)
+        ]
+        User.objects.bulk_create_hashed(users, processes=2)
+        for i, user in enumerate(User.objects.order_by('name')):
+            self.assertTrue(user.password.startswith('pbkdf2_'))
+            self.assertTrue(user.verify_password(f"pass{i}"))
+
+
+class UserBulkAPITest(APITestCase):
+    def test_bulk_create_users(self):
+        data = [
+            {'name': 'First', 'email': 'first@example.com', 'password': 'firstpass'},
+            {'name': 'Second', 'email': 'second@example.com', 'password': 'secondpass'},
+        ]
+        response = self.client.post('/api/users/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertTrue(User.objects.get(email='second@example.com').verify_password('secondpass'))
+
+    def test_bulk_rejects_duplicate_emails(self):
+        User.objects.create(name="Taken", email="taken@example.com", password="takenpass")
+        data = [
+            {'name': 'New', 'email': 'new@example.com', 'password': 'newpass'},
+            {'name': 'Again', 'email': 'taken@example.com', 'password': 'againpass'},
+        ]
+        response = self.client.post('/api/users/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('email', response.data[1])
+        self.assertEqual(User.objects.count(), 1)
+
+
+class ActivityStatsAPITest(DjongoSQLMixin, APITestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name="Stats Team", description="A team")
+        self.alice = User.objects.create(
+            name="Alice", email="alice@example.com",
+            password="pbkdf2_sha256$already-hashed", team_id=str(self.team.pk)
+        )
+        self.bob = User.objects.create(
+            name="Bob", email="bob@example.com",
+            password="pbkdf2_sha256$already-hashed", team_id=str(self.team.pk)
+        )
+        for user, activity_type, calories, date in [
+            (self.alice, 'Running', 300, '2026-01-05T08:00:00Z'),
+            (self.alice, 'Yoga', 100, '2026-01-06T08:00:00Z'),
+            (self.bob, 'Running', 250, '2026-01-12T08:00:00Z'),
+        ]:
+            Activity.objects.create(
+                user_id=str(user.pk), activity_type=activity_type,
+                duration=30, calories=calories, date=date
+            )
+
+    def stats(self, **params):
+        response = self.client.get('/api/activities/stats/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_group_by_user(self):
+        rows = self.stats(group_by='user')
+        self.assertEqual(
+            [(row['user_id'], row['total_calories'], row['total_activities']) for row in rows],
+            [(str(self.alice.pk), 400, 2), (str(self.bob.pk), 250, 1)]
+        )
+
+    def test_group_by_activity_type(self):
+        rows = self.stats(group_by='activity_type')
+        self.assertEqual(
+            [(row['activity_type'], row['total_calories']) for row in rows],
+            [('Running', 550), ('Yoga', 100)]
+        )
+
+    def test_group_by_team(self):
+        rows = self.stats(group_by='team')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['team'], 'Stats Team')
+        self.assertEqual(rows[0]['total_calories'], 650)
+        self.assertEqual(rows[0]['total_activities'], 3)
+
+    def test_group_by_week_with_date_filter(self):
+        rows = self.stats(group_by='week', start='2026-01-01T00:00:00Z', end='2026-01-12T00:00:00Z')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(str(rows[0]['week']), '2026-01-05')
+        self.assertEqual(rows[0]['total_calories'], 400)
+
+    def test_group_by_day(self):
+        rows = self.stats(group_by='day', user_id=str(self.alice.pk))
+        self.assertEqual([str(row['day']) for row in rows], ['2026-01-05', '2026-01-06'])
+
+    @override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'})
+    def test_calendar_groupings_run_on_mongo(self):
+        mongo.reset()
+        self.addCleanup(mongo.reset)
+        queries = [
+            {'group_by': 'day'},
+            {'group_by': 'week'},
+            {'group_by': 'week', 'start': '2026-01-01T00:00:00Z', 'end': '2026-01-12T00:00:00Z'},
+            {'group_by': 'day', 'user_id': str(self.bob.pk)},
+        ]
+        expected = [self.stats(**params) for params in queries]
+        self.assertEqual([row['total_calories'] for row in expected[0]], [300, 100, 250])
+        self.assertEqual([str(row['week']) for row in expected[1]], ['2026-01-05', '2026-01-12'])
+        mongo.get_database()['activities'].insert_many([
+            {field: repository.to_mongo(value) for field, value in row.items()}
+            for row in Activity.objects.values()
+        ])
+        # djongo can't translate TruncDate, so the grouping is a $group pipeline
+        with mock.patch.object(connections['default'], 'vendor', 'djongo'), self.assertNumQueries(0):
+            self.assertEqual([self.stats(**params) for params in queries], expected)
+
+    def test_unknown_grouping(self):
+        response = self.client.get('/api/activities/stats/', {'group_by': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(OCTOFIT_RESPONSE_CACHE={'BACKEND': 'local', 'MAX_ENTRIES': 16, 'TIMEOUT': 60})
+class ResponseCacheAPITest(APITestCase):
+    def setUp(self):
+        self.workout = Workout.objects.create(
+            name="Morning Run", description="A run", activity_type="Running",
+            difficulty="Easy", duration=30, calories_per_session=300
+        )
+
+    def test_repeated_reads_skip_the_database(self):
+        first = self.client.get('/api/workouts/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/workouts/')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get('/api/workouts/')['ETag']
+        response = self.client.get('/api/workouts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_varies_with_the_negotiated_format(self):
+        json_response = self.client.get('/api/workouts/')
+        columnar = self.client.get('/api/workouts/', HTTP_ACCEPT='application/vnd.octofit.columnar+json')
+        self.assertNotEqual(columnar['ETag'], json_response['ETag'])
+        self.assertIn('Accept', columnar['Vary'])
+        response = self.client.get(
+            '/api/workouts/', HTTP_ACCEPT='application/vnd.octofit.columnar+json',
+            HTTP_IF_NONE_MATCH=json_response['ETag'],
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_writes_invalidate_dependent_viewsets(self):
+        team = Team.objects.create(name="Cached Team", description="A team")
+        etag = self.client.get('/api/teams/')['ETag']
+        self.client.get('/api/workouts/')
+
+        User.objects.create(
+            name="Member", email="member@example.com",
+            password="pbkdf2_sha256$already-hashed", team_id=str(team.pk)
+        )
+        response = self.client.get('/api/teams/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['member_count'], 1)
+        with self.assertNumQueries(0):
+            self.client.get('/api/workouts/')
+
+
+class ResponseCacheBackendTest(APITestCase):
+    @override_settings(
+        OCTOFIT_MONGO={'BACKEND': 'memory'},
+        OCTOFIT_RESPONSE_CACHE={'BACKEND': 'local', 'GENERATIONS': 'mongo'},
+    )
+    def test_local_entries_follow_shared_generations(self):
+        mongo.reset()
+        self.addCleanup(mongo.reset)
+        Workout.objects.create(
+            name="Morning Run", description="A run", activity_type="Running",
+            difficulty="Easy", duration=30, calories_per_session=300
+        )
+        self.client.get('/api/workouts/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/workouts/')
+        generation = get_response_cache().generation(Workout._meta.label_lower)
+        # A write served by another worker, with its own local entries
+        other_worker = caching.LocalResponseCache(generations='mongo')
+        other_worker.bump(Workout._meta.label_lower)
+        self.assertEqual(get_response_cache().generation(Workout._meta.label_lower), generation + 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/workouts/')
+        self.assertTrue(queries.captured_queries)
+
+    def test_generations_are_shared_on_mongodb(self):
+        with mock.patch.dict(settings.DATABASES['default'], ENGINE='djongo'):
+            self.assertIsInstance(caching.LocalResponseCache()._generations, caching.MongoGenerations)
+        self.assertIsInstance(caching.LocalResponseCache()._generations, caching.LocalGenerations)
+
+    @override_settings(OCTOFIT_RESPONSE_CACHE={'BACKEND': 'django', 'MAX_ENTRIES': 16, 'TIMEOUT': 60})
+    def test_django_backend_ignores_local_options(self):
+        cache = get_response_cache()
+        self.assertIsInstance(cache, DjangoResponseCache)
+        self.assertEqual(cache.timeout, 60)
+        first = self.client.get('/api/workouts/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/workouts/')['ETag'], first['ETag'])
+
+
+class ActivityBulkAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            name="Synced", email="synced@example.com", password="pbkdf2_sha256$already-hashed"
+        )
+
+    def activity(self, calories, **overrides):
+        data = {
+            'user_id': str(self.user.pk),
+            'activity_type': 'Cycling',
+            'duration': 45,
+            'calories': calories,
+            'date': '2026-02-01T07:00:00Z'
+        }
+        data.update(overrides)
+        return data
+
+    def test_json_array_reports_per_item_errors(self):
+        data = [self.activity(200), self.activity(None), self.activity(300, date='2026-02-02T07:00:00Z')]
+        response = self.client.post('/api/activities/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(len(response.data['errors']), 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('calories', response.data['errors'][0]['errors'])
+
+        self.assertEqual(Activity.objects.count(), 2)
+        entry = Leaderboard.objects.get(user_id=str(self.user.pk))
+        self.assertEqual(entry.total_calories, 500)
+        self.assertEqual(entry.total_activities, 2)
+        self.assertEqual(entry.total_duration, 90)
+
+    def test_ndjson_body(self):
+        body = '\n'.join(
+            json.dumps(self.activity(100 + i, date=f'2026-02-0{i + 1}T07:00:00Z')) for i in range(3)
+        ) + '\n'
+        response = self.client.post(
+            '/api/activities/bulk/', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user.pk)).total_calories, 303)
+
+    def test_rejects_non_list_body(self):
+        response = self.client.post('/api/activities/bulk/', self.activity(100), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Activity.objects.count(), 0)
+
+
+class ExportTest(APITestCase):
+    def setUp(self):
+        for day, user_id in [(1, 'user1'), (2, 'user2'), (3, 'user1')]:
+            Activity.objects.create(
+                user_id=user_id, activity_type="Running", duration=30,
+                calories=100 * day, date=f"2026-03-0{day}T09:00:00Z"
+            )
+        Leaderboard.objects.create(user_id='user1', team_id='team1', total_calories=400, rank=1)
+        Leaderboard.objects.create(user_id='user2', team_id='team2', total_calories=200, rank=2)
+
+    def streamed(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_activity_csv_export_with_filters(self):
+        response = self.client.get('/api/activities/export/', {
+            'user_id': 'user1', 'start': '2026-03-02T00:00:00Z'
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.streamed(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user_id', 'activity_type'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('2026-03-03T09:00:00+00:00', lines[1])
+
+    def test_leaderboard_ndjson_export(self):
+        response = self.client.get('/api/leaderboard/export/', {'output': 'ndjson'})
+        rows = [json.loads(line) for line in self.streamed(response).splitlines()]
+        self.assertEqual([row['user_id'] for row in rows], ['user1', 'user2'])
+        self.assertEqual(rows[0]['total_calories'], 400)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_data', 'activities', '--format', 'ndjson', '--end', '2026-03-03', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['calories'] for row in rows], [100, 200])
+
+
+@override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'})
+class AsyncReadAPITest(TestCase):
+    def setUp(self):
+        mongo.reset()
+
+    async def seed(self):
+        database = mongo.get_async_database()
+        await database['users'].insert_many([
+            {'id': 1, 'name': 'Alice', 'team_id': '1'},
+            {'id': 2, 'name': 'Bob', 'team_id': '1'},
+        ])
+        await database['teams'].insert_one({'id': 1, 'name': 'Team A'})
+        await database['leaderboard'].insert_many([
+            {'id': 10 + rank, 'user_id': str(rank), 'team_id': '1', 'total_calories': 1000 // rank,
+             'total_activities': 3, 'total_duration': 90, 'rank': rank,
+             'updated_at': datetime(2026, 1, 1, 12, 0)}
+            for rank in (1, 2)
+        ])
+        await database['activities'].insert_many([
+            {'id': day, 'user_id': '1', 'activity_type': 'Running', 'duration': 30,
+             'distance': None, 'calories': 100 * day, 'date': datetime(2026, 1, day, 8, 0),
+             'created_at': datetime(2026, 1, day, 9, 0)}
+            for day in (1, 2, 3)
+        ])
+
+    async def test_leaderboard_list_resolves_names(self):
+        await self.seed()
+        response = await self.async_client.get('/api/async/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([row['user'] for row in results], ['Alice', 'Bob'])
+        self.assertEqual(results[0]['team'], 'Team A')
+        self.assertEqual(results[0]['updated_at'], '2026-01-01T12:00:00Z')
+
+    async def test_activity_list_follows_cursor(self):
+        await self.seed()
+        response = await self.async_client.get('/api/async/activities/', {'page_size': 2})
+        page = response.json()
+        self.assertEqual([row['calories'] for row in page['results']], [300, 200])
+        response = await self.async_client.get(page['next'])
+        page = response.json()
+        self.assertEqual([row['calories'] for row in page['results']], [100])
+        self.assertIsNone(page['next'])
+
+    async def test_cursor_must_match_the_sort_key(self):
+        await self.seed()
+        date_cursor = repository.encode_cursor(timezone.now(), 1)
+        rank_cursor = repository.encode_cursor(1, 11)
+        for path, cursor in (('leaderboard', date_cursor), ('activities', rank_cursor)):
+            response = await self.async_client.get(f'/api/async/{path}/', {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.get('/api/async/leaderboard/', {'cursor': rank_cursor})
+        self.assertEqual([row['user'] for row in response.json()['results']], ['Bob'])
+
+    async def test_page_size_must_be_positive(self):
+        await self.seed()
+        for page_size in (0, -1):
+            response = await self.async_client.get('/api/async/activities/', {'page_size': page_size})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(
+        DEBUG=True,
+        OCTOFIT_REQUEST_PROFILING={'ENABLED': True},
+        OCTOFIT_COMPRESSION={'ENABLED': True, 'MIN_SIZE': 0},
+    )
+    async def test_middleware_stays_async(self):
+        await self.seed()
+        # In DEBUG, Django logs each sync-only middleware it has to adapt
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            response = await self.async_client.get('/api/async/leaderboard/', **{'accept-encoding': 'gzip'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['results'][0]['user'], 'Alice')
+
+    async def test_detail(self):
+        await self.seed()
+        response = await self.async_client.get('/api/async/activities/2/')
+        self.assertEqual(response.json()['date'], '2026-01-02T08:00:00Z')
+        response = await self.async_client.get('/api/async/workouts/99/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LeaderboardStreamTest(TestCase):
+    def setUp(self):
+        Leaderboard.objects.create(user_id='1', team_id='red', total_calories=500, rank=1)
+        Leaderboard.objects.create(user_id='2', team_id='blue', total_calories=300, rank=2)
+
+    def test_deltas_publish_rank_diffs(self):
+        published = []
+        with mock.patch.object(broadcaster, 'has_subscribers', return_value=True), \
+                mock.patch.object(broadcaster, 'publish', side_effect=published.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                leaderboard.apply_deltas({'2': [400, 1, 30]})
+        diffs = {diff['user_id']: diff for diff in published[0]}
+        self.assertEqual(diffs['2']['rank'], 1)
+        self.assertEqual(diffs['2']['total_calories'], 700)
+        self.assertEqual(diffs['1'], {'user_id': '1', 'team_id': 'red', 'rank': 2})
+
+    def test_stream_filters_by_team(self):
+        async def scenario():
+            sent = []
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if b'event: leaderboard' in message.get('body', b''):
+                    disconnect.set()
+
+            scope = {'type': 'http', 'path': '/api/stream/leaderboard/', 'query_string': b'team_id=blue'}
+            stream = asyncio.ensure_future(realtime.leaderboard_stream(scope, receive, send))
+            while not broadcaster.has_subscribers():
+                await asyncio.sleep(0)
+            broadcaster.publish([
+                {'user_id': '1', 'team_id': 'red', 'rank': 2},
+                {'user_id': '2', 'team_id': 'blue', 'rank': 1},
+            ])
+            await asyncio.wait_for(stream, timeout=5)
+            return sent
+
+        sent = asyncio.run(scenario())
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        event = next(message['body'] for message in sent if b'event:' in message.get('body', b''))
+        data = json.loads(event.decode().split('data: ', 1)[1])
+        self.assertEqual(data, [{'user_id': '2', 'team_id': 'blue', 'rank': 1}])
+        self.assertFalse(sent[-1]['more_body'])
+        self.assertFalse(broadcaster.has_subscribers())
+
+    def test_resets_reach_every_subscriber(self):
+        async def scenario():
+            subscription = broadcaster.subscribe(team_id='blue')
+            try:
+                broadcaster.reset()
+                broadcaster.publish([{'user_id': str(i), 'team_id': 'blue', 'rank': i} for i in range(501)])
+                return [await subscription.queue.get() for _ in range(2)]
+            finally:
+                broadcaster.unsubscribe(subscription)
+
+        self.assertEqual(asyncio.run(scenario()), [('reset', {}), ('reset', {})])
+
+    @override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'}, OCTOFIT_REALTIME={'CHANNEL': 'mongo'})
+    def test_mongo_channel_publishes_to_the_shared_collection(self):
+        self.assertTrue(broadcaster.has_subscribers())
+        broadcaster.publish([{'user_id': '2', 'team_id': 'blue', 'rank': 1}])
+        broadcaster.reset()
+        events = mongo.get_database()['leaderboard_events'].find()
+        self.assertEqual(
+            [(event['event'], event['data']) for event in events],
+            [('created', None), ('leaderboard', [{'user_id': '2', 'team_id': 'blue', 'rank': 1}]), ('reset', {})],
+        )
+
+    def test_mongo_channel_follows_new_events(self):
+        collection = mock.Mock()
+        collection.find_one.return_value = {'_id': 1}
+        cursor = mock.MagicMock()
+        type(cursor).alive = mock.PropertyMock(side_effect=[True, False])
+        cursor.__iter__.return_value = iter([
+            {'_id': 2, 'event': 'leaderboard', 'data': [{'user_id': '1', 'rank': 1}]},
+            {'_id': 3, 'event': 'created', 'data': None},
+            {'_id': 4, 'event': 'reset', 'data': {}},
+        ])
+        collection.find.return_value = cursor
+        channel = realtime.MongoChannel()
+        dispatched = []
+        with mock.patch.object(channel, 'collection', return_value=collection):
+            last_id = channel.follow(lambda event, data: dispatched.append((event, data)))
+        self.assertEqual(last_id, 4)
+        collection.find.assert_called_once_with({'_id': {'$gt': 1}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        self.assertEqual(dispatched, [('leaderboard', [{'user_id': '1', 'rank': 1}]), ('reset', {})])
+
+
+class ConnectionPoolTest(APITestCase):
+    def setUp(self):
+        pool_listener.reset()
+        self.addCleanup(pool_listener.reset)
+
+    def test_client_options_from_environment(self):
+        options = client_options({
+            'MONGO_HOST': 'mongo', 'MONGO_MAX_POOL_SIZE': '50',
+            'MONGO_COMPRESSORS': 'zstd,zlib', 'MONGO_SOCKET_TIMEOUT_MS': '',
+        }, read_preference='secondaryPreferred')
+        self.assertEqual(options['host'], 'mongo')
+        self.assertEqual(options['port'], 27017)
+        self.assertEqual(options['maxPoolSize'], 50)
+        self.assertEqual(options['compressors'], 'zstd,zlib')
+        self.assertEqual(options['readPreference'], 'secondaryPreferred')
+        self.assertNotIn('socketTimeoutMS', options)
+        self.assertIn(pool_listener, options['event_listeners'])
+
+    def test_pool_stats_endpoint(self):
+        address = ('localhost', 27017)
+        event = mock.Mock(address=address)
+        pool_listener.connection_created(event)
+        pool_listener.connection_created(event)
+        pool_listener.connection_checked_out(event)
+        pool_listener.connection_checked_out(event)
+        pool_listener.connection_checked_in(event)
+        pool_listener.connection_check_out_failed(mock.Mock(address=address, reason='timeout'))
+
+        response = self.client.get('/api/stats/pool/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pool = response.data['localhost:27017']
+        self.assertEqual(pool['open'], 2)
+        self.assertEqual(pool['checked_out'], 1)
+        self.assertEqual(pool['peak_checked_out'], 2)
+        self.assertEqual(pool['checkouts'], 2)
+        self.assertEqual(pool['checkout_failures'], {'timeout': 1})
+
+
+class TeamStandingAPITest(DjongoSQLMixin, APITestCase):
+    def setUp(self):
+        self.red = Team.objects.create(name="Red", description="Red team")
+        self.blue = Team.objects.create(name="Blue", description="Blue team")
+
+    def create_user(self, name, team):
+        response = self.client.post('/api/users/', {
+            'name': name, 'email': f'{name.lower()}@example.com',
+            'password': 'pbkdf2_sha256$already-hashed', 'team_id': str(team.pk)
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def log(self, user_id, calories):
+        response = self.client.post('/api/activities/', {
+            'user_id': user_id, 'activity_type': 'Rowing', 'duration': 20,
+            'calories': calories, 'date': '2026-04-01T06:00:00Z'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def standing(self, team):
+        return TeamStanding.objects.get(team_id=str(team.pk))
+
+    def test_standings_follow_activities_and_membership(self):
+        ann = self.create_user('Ann', self.red)
+        ben = self.create_user('Ben', self.red)
+        cal = self.create_user('Cal', self.blue)
+        self.log(ann, 300)
+        self.log(ben, 100)
+        self.log(cal, 350)
+
+        red = self.standing(self.red)
+        self.assertEqual((red.total_calories, red.member_count, red.rank), (400, 2, 1))
+        self.assertEqual(red.average_calories, 200)
+        self.assertEqual(self.standing(self.blue).rank, 2)
+
+        response = self.client.patch(f'/api/users/{ann}/', {'team_id': str(self.blue.pk)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        blue = self.standing(self.blue)
+        self.assertEqual((blue.total_calories, blue.member_count, blue.rank), (650, 2, 1))
+        red = self.standing(self.red)
+        self.assertEqual((red.total_calories, red.member_count, red.rank), (100, 1, 2))
+        self.assertEqual(Leaderboard.objects.get(user_id=ann).team_id, str(self.blue.pk))
+
+        self.client.delete(f'/api/users/{cal}/')
+        self.assertEqual(self.standing(self.blue).total_calories, 300)
+        self.assertEqual(self.standing(self.blue).member_count, 1)
+
+    def test_team_leaderboard_endpoint(self):
+        self.log(self.create_user('Dee', self.blue), 500)
+        self.log(self.create_user('Eve', self.red), 200)
+        response = self.client.get('/api/team-leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([row['team'] for row in results], ['Blue', 'Red'])
+        self.assertEqual(results[0]['member_count'], 1)
+        self.assertEqual(results[0]['average_calories'], 500)
+
+    def test_members_written_outside_the_api_are_counted(self):
+        for name in ('Fay', 'Gus', 'Hal'):
+            User.objects.create(
+                name=name, email=f'{name.lower()}@example.com',
+                password='pbkdf2_sha256$already-hashed', team_id=str(self.red.pk)
+            )
+        ivy = self.create_user('Ivy', self.red)
+        with self.assertDjongoTranslates():
+            self.log(ivy, 400)
+        red = self.standing(self.red)
+        self.assertEqual((red.member_count, red.average_calories), (4, 100))
+
+        hal = User.objects.get(name='Hal')
+        hal.team_id = str(self.blue.pk)
+        hal.save()
+        User.objects.get(name='Gus').delete()
+        self.assertEqual(self.standing(self.red).member_count, 2)
+        self.assertEqual(self.standing(self.blue).member_count, 1)
+
+    def test_migration_backfills_standings(self):
+        migration = importlib.import_module('octofit_tracker.migrations.0007_backfill_team_standings')
+        with leaderboard.membership_untracked():
+            for name, team in (('Jo', self.red), ('Kim', self.red), ('Lou', self.blue)):
+                User.objects.create(
+                    name=name, email=f'{name.lower()}@example.com',
+                    password='pbkdf2_sha256$already-hashed', team_id=str(team.pk)
+                )
+        Activity.objects.create(
+            user_id=str(User.objects.get(name='Lou').pk), activity_type='Rowing', duration=20,
+            calories=300, date='2026-04-01T06:00:00Z'
+        )
+        with self.assertDjongoTranslates():
+            migration.backfill_team_standings(apps, None)
+        blue, red = self.standing(self.blue), self.standing(self.red)
+        self.assertEqual((blue.total_calories, blue.member_count, blue.rank), (300, 1, 1))
+        self.assertEqual((red.total_calories, red.member_count, red.rank), (0, 2, 2))
+
+
+class WindowedLeaderboardAPITest(APITestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.alice = User.objects.create(
+            name="Alice", email="alice@example.com", password="pbkdf2_sha256$already-hashed"
+        )
+        self.bob = User.objects.create(
+            name="Bob", email="bob@example.com", password="pbkdf2_sha256$already-hashed"
+        )
+
+    def log(self, user, calories, days_ago):
+        date = timezone.now() - timedelta(days=days_ago)
+        response = self.client.post('/api/activities/', {
+            'user_id': str(user.pk), 'activity_type': 'Running', 'duration': 30,
+            'calories': calories, 'date': date.isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def window(self, window):
+        response = self.client.get('/api/leaderboard/', {'window': window})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['user'], row['total_calories'], row['rank']) for row in response.data['results']]
+
+    def test_rankings_per_window(self):
+        self.log(self.alice, 100, days_ago=0)
+        self.log(self.alice, 100, days_ago=0)
+        self.log(self.bob, 500, days_ago=3)
+        self.log(self.alice, 900, days_ago=20)
+        self.log(self.bob, 900, days_ago=45)
+
+        self.assertEqual(ActivityDayBucket.objects.filter(user_id=str(self.alice.pk)).count(), 2)
+        self.assertEqual(self.window('day'), [('Alice', 200, 1)])
+        self.assertEqual(self.window('week'), [('Bob', 500, 1), ('Alice', 200, 2)])
+        self.assertEqual(self.window('month'), [('Alice', 1100, 1), ('Bob', 500, 2)])
+
+    def test_deleting_last_activity_removes_bucket(self):
+        activity_id = self.log(self.bob, 300, days_ago=1)
+        self.client.delete(f'/api/activities/{activity_id}/')
+        self.assertFalse(ActivityDayBucket.objects.exists())
+        self.assertEqual(self.window('week'), [])
+
+    def test_compaction_removes_expired_buckets(self):
+        ActivityDayBucket.objects.create(user_id='1', day=self.today - timedelta(days=40), total_activities=1)
+        ActivityDayBucket.objects.create(user_id='1', day=self.today, total_activities=1)
+        self.assertEqual(buckets.compact(), 1)
+        self.assertEqual(ActivityDayBucket.objects.count(), 1)
+
+    def test_migration_backfills_buckets(self):
+        migration = importlib.import_module('octofit_tracker.migrations.0008_backfill_activity_day_buckets')
+        for days_ago, calories in ((0, 100), (0, 50), (3, 500), (45, 900)):
+            Activity.objects.create(
+                user_id=str(self.alice.pk), activity_type='Rowing', duration=20, calories=calories,
+                date=timezone.now() - timedelta(days=days_ago)
+            )
+        migration.backfill_activity_day_buckets(apps, None)
+        self.assertEqual(self.window('day'), [('Alice', 150, 1)])
+        self.assertEqual(self.window('month'), [('Alice', 650, 1)])
+        self.assertEqual(ActivityDayBucket.objects.count(), 2)
+
+    def test_unknown_window(self):
+        response = self.client.get('/api/leaderboard/', {'window': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BenchmarkTest(TestCase):
+    def seed(self, users):
+        call_command('populate_db', users=users, activities_per_user=2, seed=1, stdout=StringIO())
+
+    def test_list_query_counts_do_not_grow_with_dataset(self):
+        endpoints = ['users', 'teams', 'activities', 'leaderboard', 'workouts']
+        self.seed(5)
+        small = benchmark.run(requests=2, concurrency=1, endpoints=endpoints)
+        self.seed(40)
+        large = benchmark.run(requests=2, concurrency=1, endpoints=endpoints)
+        for name in endpoints:
+            self.assertEqual(small[name]['status'], 200)
+            self.assertEqual(small[name]['queries'], large[name]['queries'], name)
+
+    def test_write_path_and_report(self):
+        self.seed(3)
+        results = benchmark.run(requests=5, concurrency=1, endpoints=['activity-create'])
+        result = results['activity-create']
+        self.assertEqual(result['status'], 201)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['requests'], 5)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_command_runs_on_sqlite_without_mongodb(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ, DJANGO_SETTINGS_MODULE='octofit_tracker.settings', OCTOFIT_DB='sqlite',
+                OCTOFIT_SQLITE_NAME=os.path.join(directory, 'db.sqlite3'),
+            )
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            output = os.path.join(directory, 'results.json')
+            for command in (
+                ['migrate', '--verbosity', '0'],
+                ['benchmark_api', '--seed-users', '3', '--activities-per-user', '2', '--requests', '2',
+                 '--concurrency', '1', '--endpoint', 'leaderboard', '--output', output],
+            ):
+                subprocess.run(manage + command, env=env, cwd=settings.BASE_DIR, check=True, capture_output=True)
+            with open(output) as results:
+                report = json.load(results)
+        self.assertEqual(report['meta']['database'], 'sqlite')
+        self.assertEqual(report['endpoints']['leaderboard']['status'], 200)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'leaderboard': {'queries': 3, 'p95_ms': 10.0}}
+        self.assertEqual(benchmark.compare({'leaderboard': {'queries': 3, 'p95_ms': 12.0}}, baseline), [])
+        regressions = benchmark.compare({'leaderboard': {'queries': 9, 'p95_ms': 20.0}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+PROFILING = {'ENABLED': True, 'SLOWEST': 2, 'LOG_THRESHOLD_MS': None}
+
+
+@override_settings(OCTOFIT_REQUEST_PROFILING=PROFILING)
+class RequestProfilingTest(APITestCase):
+    def setUp(self):
+        request_profiles.reset()
+        team = Team.objects.create(name="Team", description="A team")
+        for i in range(3):
+            user = User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com",
+                password="pbkdf2_sha256$already-hashed", team_id=str(team.pk)
+            )
+            Leaderboard.objects.create(
+                user_id=str(user.pk), team_id=str(team.pk), total_calories=10 * i, rank=3 - i
+            )
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/leaderboard/')
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'view', 'serialize', 'render', 'total'])
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('3 queries', response['Server-Timing'])
+
+    def test_serializer_data_is_its_own_phase(self):
+        def slow_representation(serializer, data):
+            time.sleep(0.05)
+            return original(serializer, data)
+
+        original = LeaderboardSerializer.Meta.list_serializer_class.to_representation
+        for path in ('/api/leaderboard/', '/api/leaderboard/top/'):
+            request_profiles.reset()
+            with mock.patch.object(
+                LeaderboardSerializer.Meta.list_serializer_class, 'to_representation', slow_representation
+            ):
+                self.client.get(path)
+            timings = request_profiles.snapshot()['slowest'][0]['timings_ms']
+            self.assertGreaterEqual(timings['serialize'], 50, path)
+            self.assertLess(timings['view'], 50, path)
+
+    def test_aggregates_per_url_name(self):
+        self.client.get('/api/leaderboard/')
+        self.client.get('/api/leaderboard/?page_size=1')
+        self.client.get('/api/teams/')
+        snapshot = self.client.get('/api/stats/requests/').data
+        leaderboard_list = snapshot['endpoints']['leaderboard-list']
+        self.assertEqual(leaderboard_list['count'], 2)
+        self.assertEqual(leaderboard_list['max_queries'], 3)
+        self.assertEqual(sum(leaderboard_list['histogram'].values()), 2)
+        self.assertIn('team-list', snapshot['endpoints'])
+        self.assertEqual(len(snapshot['slowest']), 2)
+        self.assertIn('sql', snapshot['slowest'][0]['queries'][0])
+
+    @override_settings(OCTOFIT_REQUEST_PROFILING={'ENABLED': False})
+    def test_disabled_by_default(self):
+        response = self.client.get('/api/leaderboard/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(request_profiles.snapshot()['endpoints'], {})
+
+
+class SparseFieldsAPITest(APITestCase):
+    def setUp(self):
+        team = Team.objects.create(name="Team", description="A long team description")
+        for i in range(3):
+            user = User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com",
+                password="pbkdf2_sha256$already-hashed", team_id=str(team.pk)
+            )
+            Leaderboard.objects.create(
+                user_id=str(user.pk), team_id=str(team.pk), total_calories=10 * i, rank=3 - i
+            )
+        Workout.objects.create(
+            name="Run", description="A long workout description", activity_type="Running",
+            difficulty="Easy", duration=30, calories_per_session=300
+        )
+
+    def test_trims_output_and_skips_unneeded_lookups(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/leaderboard/?fields=user,rank')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'user': 'User 2', 'rank': 1})
+
+    def test_projection_is_pushed_to_the_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/workouts/?fields=id,name')
+        self.assertEqual(response.data['results'][0], {'id': mock.ANY, 'name': 'Run'})
+        self.assertNotIn('description', queries[0]['sql'])
+
+    def test_retrieve_and_pagination_with_fields(self):
+        team = Team.objects.get()
+        response = self.client.get(f'/api/teams/{team.pk}/?fields=name,member_count')
+        self.assertEqual(response.data, {'name': 'Team', 'member_count': 3})
+        response = self.client.get('/api/leaderboard/?fields=user_id&page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(len(self.client.get(response.data['next']).data['results']), 1)
+
+    def test_unknown_and_write_only_fields_are_rejected(self):
+        response = self.client.get('/api/users/?fields=name,password')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['fields'], ['Unknown field: password'])
+
+    def test_writes_ignore_fields(self):
+        response = self.client.post('/api/workouts/?fields=name', {
+            'name': 'Swim', 'description': 'Laps', 'activity_type': 'Swimming',
+            'difficulty': 'Easy', 'duration': 30, 'calories_per_session': 250,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['description'], 'Laps')
+
+
+class FastSerializationTest(APITestCase):
+    def setUp(self):
+        team = Team.objects.create(name="Team", description="A team")
+        user = User.objects.create(
+            name="User", email="user@example.com",
+            password="pbkdf2_sha256$already-hashed", team_id=str(team.pk)
+        )
+        Activity.objects.create(
+            user_id=str(user.pk), activity_type="Running", duration=30,
+            distance=5.5, calories=300, date=timezone.now()
+        )
+        Activity.objects.create(
+            user_id=str(user.pk), activity_type="Yoga", duration=40,
+            calories=150, date=timezone.now() - timedelta(days=1)
+        )
+        Leaderboard.objects.create(
+            user_id=str(user.pk), team_id=str(team.pk), total_calories=450, rank=1
+        )
+        Leaderboard.objects.create(user_id="999", team_id="", total_calories=0, rank=2)
+        Workout.objects.create(
+            name="Run", description="Easy run", activity_type="Running",
+            difficulty="Easy", duration=30, calories_per_session=300
+        )
+
+    def test_rows_render_like_instances(self):
+        for serializer_class in (ActivitySerializer, LeaderboardSerializer, WorkoutSerializer):
+            model = serializer_class.Meta.model
+            context = serializer_class.prefetch_lookups(list(model.objects.all())) \
+                if hasattr(serializer_class, 'prefetch_lookups') else {}
+            from_instances = serializer_class(model.objects.order_by('id'), many=True, context=context).data
+            from_rows = serializer_class(list(model.objects.order_by('id').values()), many=True, context=context).data
+            self.assertEqual(json.loads(json.dumps(from_rows)), json.loads(json.dumps(from_instances)))
+
+    def test_list_endpoints_keep_the_schema(self):
+        response = self.client.get('/api/activities/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        activity = Activity.objects.order_by('-date').first()
+        self.assertEqual(response.json()['results'][0], json.loads(JSONRenderer().render(
+            ActivitySerializer(activity).data
+        )))
+        self.assertIsNone(response.json()['results'][1]['distance'])
+        entry = self.client.get('/api/leaderboard/').json()['results'][1]
+        self.assertEqual((entry['user'], entry['team']), ("Unknown User", None))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {'id': '1', 'date': timezone.now(), 'distance': 5.5, 'name': 'Zoë', 'rows': [None, 1]}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertIn(b'\n', FastJSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class LeaderboardRankQueryAPITest(APITestCase):
+    def setUp(self):
+        team = Team.objects.create(name="Team", description="A team")
+        self.users = []
+        for i in range(12):
+            user = User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com",
+                password="pbkdf2_sha256$already-hashed", team_id=str(team.pk)
+            )
+            Leaderboard.objects.create(
+                user_id=str(user.pk), team_id=str(team.pk), total_calories=100 * (12 - i), rank=i + 1
+            )
+            self.users.append(user)
+
+    def test_top_k(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/leaderboard/top/?k=3')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['rank'] for entry in response.data['results']], [1, 2, 3])
+        self.assertEqual(response.data['results'][0]['user'], 'User 0')
+        self.assertEqual(len(self.client.get('/api/leaderboard/top/').data['results']), 10)
+        self.assertEqual(self.client.get('/api/leaderboard/top/?k=0').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_around_user(self):
+        user = self.users[5]
+        response = self.client.get(f'/api/leaderboard/around/{user.pk}/?radius=2&fields=rank,user')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rank'], 6)
+        self.assertEqual([entry['rank'] for entry in response.data['results']], [4, 5, 6, 7, 8])
+        self.assertEqual(response.data['results'][2], {'rank': 6, 'user': 'User 5'})
+
+    def test_around_clamps_at_the_edges(self):
+        response = self.client.get(f'/api/leaderboard/around/{self.users[0].pk}/')
+        self.assertEqual([entry['rank'] for entry in response.data['results']], [1, 2, 3, 4, 5, 6])
+        response = self.client.get('/api/leaderboard/around/unknown/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RebuildLeaderboardCommandTest(DjongoSQLMixin, TestCase):
+    def test_rebuild_matches_activity_totals(self):
+        team = Team.objects.create(name="Team", description="A team")
+        users = [
+            User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com",
+                password="pbkdf2_sha256$already-hashed", team_id=str(team.pk) if i else None
+            )
+            for i in range(5)
+        ]
+        for i, user in enumerate(users):
+            for calories in range(i):
+                Activity.objects.create(
+                    user_id=str(user.pk), activity_type="Running", duration=10,
+                    calories=100 + calories, date=timezone.now()
+                )
+        # A stale, a duplicate and a wrong entry
+        Leaderboard.objects.create(user_id="999", team_id="", total_calories=5000, rank=1)
+        Leaderboard.objects.create(user_id=str(users[4].pk), team_id="", total_calories=1, rank=2)
+        Leaderboard.objects.create(user_id=str(users[4].pk), team_id="", total_calories=1, rank=3)
+        TeamStanding.objects.create(team_id="gone", rank=1)
+        ActivityDayBucket.objects.create(user_id="999", day=timezone.localdate(), total_activities=1)
+
+        with self.assertDjongoTranslates():
+            aggregate_shard([str(user.pk) for user in users])
+        out = StringIO()
+        with mock.patch.object(broadcaster, 'reset') as reset:
+            call_command('rebuild_leaderboard', shard_size=2, processes=1, batch_size=2, stdout=out)
+        # Stream clients refetch instead of replaying the rebuild
+        reset.assert_called_once_with()
+
+        entries = list(Leaderboard.objects.order_by('rank'))
+        self.assertEqual([entry.user_id for entry in entries], [str(user.pk) for user in reversed(users)])
+        self.assertEqual([entry.rank for entry in entries], [1, 2, 3, 4, 5])
+        self.assertEqual(
+            [(entry.total_calories, entry.total_activities, entry.total_duration) for entry in entries],
+            [(406, 4, 40), (303, 3, 30), (201, 2, 20), (100, 1, 10), (0, 0, 0)],
+        )
+        self.assertEqual(entries[-1].team_id, '')
+        standing = TeamStanding.objects.get()
+        self.assertEqual((standing.team_id, standing.total_calories, standing.member_count, standing.rank),
+                         (str(team.pk), 1010, 4, 1))
+        self.assertEqual(
+            sorted(ActivityDayBucket.objects.values_list('user_id', 'total_calories', 'total_activities')),
+            sorted((entry.user_id, entry.total_calories, entry.total_activities) for entry in entries[:-1]),
+        )
+
+        out = StringIO()
+        call_command('rebuild_leaderboard', shard_size=2, processes=1, stdout=out)
+        self.assertNotRegex(out.getvalue(), r'\([1-9]\d* written\)')
+
+    @override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'})
+    def test_mongo_collections_are_swapped(self):
+        mongo.reset()
+        self.addCleanup(mongo.reset)
+        database = mongo.get_database()
+        database['leaderboard'].create_index([('rank', 1)], name='leaderboard_rank_idx')
+        database['leaderboard'].insert_one({'id': 1, 'user_id': 'gone', 'rank': 1})
+        database['__schema__'].insert_one({'name': 'leaderboard', 'auto': {'seq': 1}})
+        stale = Leaderboard.objects.create(user_id='gone', team_id='', rank=1)
+        users = [
+            User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com", password="pbkdf2_sha256$already-hashed"
+            )
+            for i in range(2)
+        ]
+        Activity.objects.create(
+            user_id=str(users[1].pk), activity_type="Running", duration=10, calories=100, date=timezone.now()
+        )
+
+        with mock.patch.object(connections['default'], 'vendor', 'djongo'):
+            call_command('rebuild_leaderboard', processes=1, stdout=StringIO())
+
+        documents = list(database['leaderboard'].find().sort('rank'))
+        self.assertEqual(
+            [(document['user_id'], document['rank'], document['total_calories']) for document in documents],
+            [(str(users[1].pk), 1, 100), (str(users[0].pk), 2, 0)],
+        )
+        self.assertEqual(sorted(document['id'] for document in documents), [2, 3])
+        self.assertIn('leaderboard_rank_idx', database['leaderboard'].index_information())
+        self.assertEqual(database['leaderboard__rebuild'].count_documents({}), 0)
+        self.assertEqual(Tombstone.objects.filter(object_id=str(stale.pk)).count(), 1)
+
+
+@override_settings(OCTOFIT_MONGO={'BACKEND': 'memory'})
+class RepositoryTest(APITestCase):
+    def setUp(self):
+        mongo.reset()
+        self.orm = repository.OrmRepository()
+        self.mongo = repository.MongoRepository()
+        for rank in (1, 2, 3):
+            Leaderboard.objects.create(
+                user_id=str(rank), team_id='1', total_calories=1000 // rank, rank=rank
+            )
+        self.mongo.database['leaderboard'].insert_many([
+            {field: repository.to_mongo(value) for field, value in row.items()}
+            for row in Leaderboard.objects.values()
+        ])
+        start = timezone.now().replace(microsecond=0)
+        for duration, day in enumerate((1, 2, 2, 3), start=30):
+            data = {
+                'user_id': '1', 'activity_type': 'Running', 'duration': duration,
+                'distance': None, 'calories': 100 * day, 'date': start - timedelta(days=day),
+            }
+            self.orm.create_activity(dict(data))
+            self.mongo.create_activity(dict(data))
+
+    def feed(self, repo, **kwargs):
+        rows = repo.activity_feed('1', **kwargs)
+        return [{key: row[key] for key in row if key not in ('id', 'created_at', 'updated_at')} for row in rows]
+
+    def test_repositories_return_the_same_rows(self):
+        self.assertEqual(self.orm.leaderboard_range(2, 3), self.mongo.leaderboard_range(2, 3))
+        self.assertEqual(self.orm.leaderboard_rank('2'), self.mongo.leaderboard_rank('2'))
+        self.assertIsNone(self.mongo.leaderboard_rank('missing'))
+        self.assertEqual(self.feed(self.orm, limit=10), self.feed(self.mongo, limit=10))
+        for repo in (self.orm, self.mongo):
+            first = repo.activity_feed('1', limit=2)
+            rest = repo.activity_feed('1', limit=10, before=(first[-1]['date'], first[-1]['id']))
+            self.assertEqual([row['calories'] for row in first + rest], [100, 200, 200, 300])
+
+    def test_mongo_ids_follow_the_djongo_counter(self):
+        ids = [row['id'] for row in self.mongo.activity_feed('1', limit=10)]
+        self.assertEqual(sorted(ids), [1, 2, 3, 4])
+        schema = self.mongo.database['__schema__'].find_one({'name': 'activities'})
+        self.assertEqual(schema['auto']['seq'], 4)
+
+    @override_settings(OCTOFIT_REPOSITORY='mongo')
+    def test_views_use_the_configured_repository(self):
+        response = self.client.post('/api/activities/', {
+            'user_id': '3', 'activity_type': 'Yoga', 'duration': 20, 'calories': 700,
+            'date': '2026-01-05T08:00:00Z',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['id'], '5')
+        self.assertFalse(Activity.objects.filter(user_id='3').exists())
+        self.assertEqual(Leaderboard.objects.get(user_id='3').total_calories, 1033)
+
+        response = self.client.get('/api/activities/feed/1/?page_size=3')
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['calories'] for row in response.data['results']], [300])
+        self.assertIsNone(response.data['next'])
+        response = self.client.get('/api/leaderboard/top/?k=2')
+        self.assertEqual([entry['user_id'] for entry in response.data['results']], ['1', '2'])
+
+    def test_feed_rejects_bad_cursor(self):
+        malformed = [
+            [{'a': 1}, 1], [5, 1], [{'$date': '2026-01-01T00:00:00'}, 1], [{'$date': 5}, 1],
+            ['2026-01-01', 1], [{'$date': '2026-01-01T00:00:00+00:00'}, 'x'], [1, 2, 3], {'a': 1}, 7,
+        ]
+        cursors = ['nope', '%%%'] + [
+            base64.urlsafe_b64encode(json.dumps(position).encode()).decode() for position in malformed
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/activities/feed/1/', {'cursor': cursor})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(repository.decode_cursor(repository.encode_cursor('Alice', 3)), ('Alice', 3))
+
+
+class ResponseFormatTest(APITestCase):
+    def setUp(self):
+        for day in range(1, 41):
+            Activity.objects.create(
+                user_id='1', activity_type='Running', duration=30, distance=None,
+                calories=10 * day, date=timezone.now() - timedelta(days=day)
+            )
+
+    def test_columnar_json(self):
+        response = self.client.get('/api/activities/', HTTP_ACCEPT='application/vnd.octofit.columnar+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.octofit.columnar+json')
+        results = json.loads(response.content)['results']
+        self.assertEqual(results['columns'][:3], ['id', 'user_id', 'activity_type'])
+        self.assertEqual(len(results['rows']), 40)
+        self.assertEqual(results['rows'][0][results['columns'].index('calories')], 10)
+
+    @skipUnless(renderers.msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        response = self.client.get('/api/activities/?format=msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = renderers.msgpack.unpackb(response.content)
+        self.assertEqual(data['results'][0]['calories'], 10)
+        self.assertLess(len(response.content), len(self.client.get('/api/activities/').content))
+
+    def test_gzip_above_threshold(self):
+        plain = self.client.get('/api/activities/')
+        response = self.client.get('/api/activities/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content) // 3)
+
+    @skipUnless(middleware.brotli, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        response = self.client.get('/api/activities/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        response = self.client.get('/api/activities/', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_small_and_streaming_responses_are_not_compressed(self):
+        response = self.client.get('/api/leaderboard/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get('/api/activities/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(OCTOFIT_SYNC_SAFETY_LAG_SECONDS=0)
+class DeltaSyncAPITest(APITestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name="Team", description="A team")
+        self.users = [
+            User.objects.create(
+                name=f"User {i}", email=f"user{i}@example.com",
+                password="pbkdf2_sha256$already-hashed", team_id=str(self.team.pk)
+            )
+            for i in range(3)
+        ]
+
+    def post_activity(self, user, calories, duration=30):
+        return self.client.post('/api/activities/', {
+            'user_id': str(user.pk), 'activity_type': 'Running', 'duration': duration,
+            'calories': calories, 'date': '2026-01-01T08:00:00Z',
+        }, format='json')
+
+    def sync(self, path, token):
+        response = self.client.get(path, {'since': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_activity_changes_and_deletions(self):
+        first = self.post_activity(self.users[0], 100).data
+        token = self.client.get('/api/activities/')['X-Sync-Token']
+        second = self.post_activity(self.users[1], 200).data
+        self.client.patch(f"/api/activities/{first['id']}/", {'calories': 150}, format='json')
+
+        changes = self.sync('/api/activities/', token)
+        self.assertEqual([row['id'] for row in changes['changed']], [second['id'], first['id']])
+        self.assertEqual(changes['deleted'], [])
+
+        self.client.delete(f"/api/activities/{second['id']}/")
+        changes = self.sync('/api/activities/', changes['since'])
+        self.assertEqual(changes['changed'], [])
+        self.assertEqual(changes['deleted'], [second['id']])
+        self.assertEqual(self.sync('/api/activities/', changes['since']), {
+            'changed': [], 'deleted': [], 'since': mock.ANY,
+        })
+
+    def test_leaderboard_rank_shifts_are_changes(self):
+        for user in self.users:
+            self.post_activity(user, 100 * (user.pk % 10 + 1))
+        token = self.client.get('/api/leaderboard/')['X-Sync-Token']
+        # The last user overtakes everyone, shifting the others down
+        self.post_activity(self.users[0], 10000, duration=60)
+        changes = self.sync('/api/leaderboard/', token)
+        self.assertEqual(
+            sorted(row['user_id'] for row in changes['changed']),
+            sorted(str(user.pk) for user in self.users),
+        )
+        self.assertEqual(min(row['rank'] for row in changes['changed']), 1)
+
+    def test_users_and_teams(self):
+        token = self.client.get('/api/users/')['X-Sync-Token']
+        self.client.patch(f'/api/users/{self.users[1].pk}/', {'name': 'Renamed'}, format='json')
+        self.client.delete(f'/api/users/{self.users[2].pk}/')
+        changes = self.sync('/api/users/', token)
+        self.assertEqual([row['name'] for row in changes['changed']], ['Renamed'])
+        self.assertEqual(changes['deleted'], [str(self.users[2].pk)])
+        # Losing a member changes the team's member_count
+        teams = self.sync('/api/teams/', token)['changed']
+        self.assertEqual([(row['id'], row['member_count']) for row in teams], [(str(self.team.pk), 2)])
+
+    def test_membership_moves_change_both_teams(self):
+        other = Team.objects.create(name="Other", description="Another team")
+        token = self.client.get('/api/teams/')['X-Sync-Token']
+        self.client.patch(f'/api/users/{self.users[0].pk}/', {'team_id': str(other.pk)}, format='json')
+        teams = self.sync('/api/teams/', token)['changed']
+        self.assertEqual(
+            sorted((row['id'], row['member_count']) for row in teams),
+            sorted([(str(self.team.pk), 2), (str(other.pk), 1)]),
+        )
+
+    def test_cached_lists_carry_the_token_of_their_data(self):
+        first = self.client.get('/api/teams/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/teams/')
+        self.assertEqual(cached['X-Sync-Token'], first['X-Sync-Token'])
+
+    @override_settings(OCTOFIT_SYNC_SAFETY_LAG_SECONDS=60)
+    def test_tokens_trail_reads_by_the_safety_lag(self):
+        token = self.client.get('/api/activities/')['X-Sync-Token']
+        read_at = timezone.now()
+        self.assertLessEqual(sync.decode_token(token), read_at - timedelta(seconds=60))
+        # A write stamped before the read but committed after it
+        activity = self.post_activity(self.users[0], 100).data
+        Activity.objects.filter(pk=activity['id']).update(updated_at=read_at - timedelta(seconds=1))
+        changes = self.sync('/api/activities/', token)
+        self.assertEqual(changes['changed'], [])
+        with mock.patch('django.utils.timezone.now', return_value=read_at + timedelta(seconds=61)):
+            changes = self.sync('/api/activities/', changes['since'])
+        self.assertEqual([row['id'] for row in changes['changed']], [activity['id']])
+
+    def test_invalid_and_expired_tokens(self):
+        response = self.client.get('/api/activities/', {'since': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        expired = sync.encode_token(timezone.now() - timedelta(days=31))
+        response = self.client.get('/api/activities/', {'since': expired})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_prune_and_suppressed_tombstones(self):
+        with sync.tombstones_suppressed():
+            self.users[0].delete()
+        self.assertFalse(Tombstone.objects.exists())
+        self.users[1].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(sync.prune(), 1)
+
+
+class BloomFilterTest(TestCase):
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        bloom = idempotency.BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'stored-{i}')
+        self.assertEqual(len(bloom), 1000)
+        self.assertTrue(all(f'stored-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'new-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_scalable_filter_grows_past_its_capacity(self):
+        bloom = idempotency.ScalableBloomFilter(100, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'stored-{i}')
+        self.assertEqual(len(bloom), 1000)
+        self.assertTrue(all(f'stored-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'new-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class ActivityIdempotencyAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            name="Retrying", email="retrying@example.com", password="pbkdf2_sha256$already-hashed"
+        )
+        idempotency.reset()
+        self.addCleanup(idempotency.reset)
+
+    def activity(self, duration=30, **overrides):
+        data = {
+            'user_id': str(self.user.pk), 'activity_type': 'Running', 'duration': duration,
+            'calories': 300, 'date': '2026-04-01T07:00:00Z',
+        }
+        data.update(overrides)
+        return data
+
+    def post(self, data, **headers):
+        return self.client.post('/api/activities/', data, format='json', **headers)
+
+    def test_resubmission_returns_the_stored_activity(self):
+        first = self.post(self.activity())
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        # Calories aren't part of the identity of a workout
+        second = self.post(self.activity(calories=310))
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second.data['calories'], 300)
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user.pk)).total_activities, 1)
+
+    def test_new_activities_skip_the_duplicate_lookup(self):
+        self.post(self.activity())
+        with mock.patch.object(repository.OrmRepository, 'activities_by_hash') as lookup:
+            response = self.post(self.activity(duration=45))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        lookup.assert_not_called()
+
+    def test_rows_missing_from_the_filter_are_caught_by_the_index(self):
+        idempotency.content_filter(repository.OrmRepository())
+        # Written by another process, so this one's filter doesn't know it
+        stored = Activity.objects.create(
+            user_id=str(self.user.pk), activity_type='Running', duration=30,
+            calories=300, date='2026-04-01T07:00:00Z'
+        )
+        response = self.post(self.activity())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], str(stored.pk))
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_filter_only_loads_recent_hashes(self):
+        stored = Activity.objects.create(
+            user_id=str(self.user.pk), activity_type='Running', duration=30,
+            calories=300, date='2026-04-01T07:00:00Z'
+        )
+        Activity.objects.filter(pk=stored.pk).update(updated_at=timezone.now() - timedelta(days=30))
+        bloom = idempotency.content_filter(repository.OrmRepository())
+        self.assertNotIn(stored.content_hash, bloom)
+        # Still caught by the unique index
+        response = self.post(self.activity())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], str(stored.pk))
+        self.assertEqual(Activity.objects.count(), 1)
+
+    @override_settings(OCTOFIT_IDEMPOTENCY={'FILTER_CAPACITY': 1})
+    def test_filter_grows_without_reloading(self):
+        with mock.patch.object(
+            repository.OrmRepository, 'activity_hashes', return_value=iter([])
+        ) as activity_hashes:
+            for duration in (30, 45, 60):
+                self.post(self.activity(duration=duration))
+        activity_hashes.assert_called_once()
+        bloom = idempotency.content_filter(repository.OrmRepository())
+        self.assertTrue(all(activity.content_hash in bloom for activity in Activity.objects.all()))
+
+    def test_idempotency_key(self):
+        first = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        retry = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['id'], first.data['id'])
+
+        reused = self.post(self.activity(duration=45), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(reused.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_idempotency_key_follows_its_activity_when_edited(self):
+        first = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.client.patch(f"/api/activities/{first.data['id']}/", {'duration': 35}, format='json')
+        retry = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry.data['duration'], 35)
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_idempotency_key_of_a_deleted_activity_creates_it_again(self):
+        first = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.client.delete(f"/api/activities/{first.data['id']}/")
+        retry = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        again = self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(again.data['id'], retry.data['id'])
+
+    def test_expired_keys_are_pruned(self):
+        self.post(self.activity(), HTTP_IDEMPOTENCY_KEY='upload-1')
+        self.assertEqual(idempotency.prune(timezone.now() + timedelta(hours=23)), 0)
+        self.assertEqual(idempotency.prune(timezone.now() + timedelta(hours=25)), 1)
+
+    def test_update_to_an_existing_activity_is_rejected(self):
+        self.post(self.activity())
+        other = self.post(self.activity(duration=45)).data
+        response = self.client.patch(f"/api/activities/{other['id']}/", {'duration': 30}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_skips_stored_and_repeated_items(self):
+        self.post(self.activity())
+        data = [self.activity(), self.activity(duration=45), self.activity(duration=45, calories=1)]
+        response = self.client.post('/api/activities/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['duplicates'], [0, 2])
+        self.assertEqual(Activity.objects.count(), 2)
+        self.assertEqual(Leaderboard.objects.get(user_id=str(self.user.pk)).total_activities, 2)
+
+        response = self.client.post('/api/activities/bulk/', data[:2], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(response.data['duplicates'], [0, 1])
@@ -16,12 +16,16 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
+from . import async_views
 from .views import (
     api_root,
+    pool_stats,
+    request_stats,
     UserViewSet,
     TeamViewSet,
     ActivityViewSet,
     LeaderboardViewSet,
+    TeamStandingViewSet,
     WorkoutViewSet
 )
 import os
@@ -32,6 +36,7 @@ router.register(r'users', UserViewSet)
 router.register(r'teams', TeamViewSet)
 router.register(r'activities', ActivityViewSet)
 router.register(r'leaderboard', LeaderboardViewSet)
+router.register(r'team-leaderboard', TeamStandingViewSet, basename='team-leaderboard')
 router.register(r'workouts', WorkoutViewSet)
 
 # Get codespace URL for environment-aware base URL
@@ -45,5 +50,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', api_root, name='api-root'),
     path('api/', api_root, name='api-root'),
+    path('api/stats/pool/', pool_stats, name='pool-stats'),
+    path('api/stats/requests/', request_stats, name='request-stats'),
+    path('api/async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard-list'),
+    path('api/async/leaderboard/<int:pk>/', async_views.leaderboard_detail, name='async-leaderboard-detail'),
+    path('api/async/activities/', async_views.activity_list, name='async-activity-list'),
+    path('api/async/activities/<int:pk>/', async_views.activity_detail, name='async-activity-detail'),
+    path('api/async/workouts/', async_views.workout_list, name='async-workout-list'),
+    path('api/async/workouts/<int:pk>/', async_views.workout_detail, name='async-workout-detail'),
     path('api/', include(router.urls)),
 ]
@@ -0,0 +1,11 @@
+"""
+Small helpers shared by the management commands and the API.
+"""
+from itertools import islice
+
+
+def batched(iterable, size):
+    """Yield lists of up to ``size`` consecutive items of ``iterable``."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
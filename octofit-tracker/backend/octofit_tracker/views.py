@@ -1,11 +1,33 @@
+import copy
+import datetime
+import hashlib
+
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.reverse import reverse
-from .models import User, Team, Activity, Leaderboard, Workout
+from . import buckets, exports, idempotency, leaderboard, stats, sync
+from .caching import get_response_cache, invalidate_model
+from .db_pool import pool_listener
+from .middleware import request_profiles
+from .models import User, Team, Activity, ActivityDayBucket, Leaderboard, TeamStanding, Workout
+from .parsers import NDJSONParser
+from .repository import decode_cursor, encode_cursor, get_repository, integrity_errors
 from .serializers import (
-    UserSerializer, TeamSerializer, ActivitySerializer,
-    LeaderboardSerializer, WorkoutSerializer
+    UserSerializer, UserBulkSerializer, TeamSerializer, ActivitySerializer, ActivityFeedQuerySerializer,
+    ActivityStatsQuerySerializer, ActivityExportQuerySerializer, LeaderboardSerializer,
+    LeaderboardExportQuerySerializer, LeaderboardWindowQuerySerializer, LeaderboardTopQuerySerializer,
+    LeaderboardAroundQuerySerializer, TeamStandingSerializer, WorkoutSerializer,
+    team_names_by_id, user_names_by_id, user_teams_by_id
 )
 
 
@@ -19,45 +41,616 @@ def api_root(request, format=None):
         'teams': reverse('team-list', request=request, format=format),
         'activities': reverse('activity-list', request=request, format=format),
         'leaderboard': reverse('leaderboard-list', request=request, format=format),
+        'team-leaderboard': reverse('team-leaderboard-list', request=request, format=format),
         'workouts': reverse('workout-list', request=request, format=format),
     })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+def pool_stats(request, format=None):
+    """
+    Connection pool metrics of this worker's MongoDB clients.
+    """
+    return Response(pool_listener.snapshot())
+
+
+@api_view(['GET', 'DELETE'])
+def request_stats(request, format=None):
+    """
+    Per-endpoint request timings and the slowest requests of this worker,
+    collected when request profiling is enabled. DELETE resets them.
+    """
+    if request.method == 'DELETE':
+        request_profiles.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(dict(
+        request_profiles.snapshot(),
+        enabled=bool(settings.OCTOFIT_REQUEST_PROFILING.get('ENABLED')),
+    ))
+
+
+class ListReadsMixin:
+    """
+    Run ``list`` queries on the ``list_reads`` database when it is
+    configured, so they can be served by secondaries. Delta syncs stay on
+    the primary: a lagging secondary would miss changes inside the window.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if (
+            self.action == 'list'
+            and 'since' not in self.request.query_params
+            and 'list_reads' in connections.databases
+        ):
+            queryset = queryset.using('list_reads')
+        return queryset
+
+
+class SparseFieldsViewMixin:
+    """
+    ``?fields=a,b`` on reads: trim the serializer output to those fields
+    and load only the model fields needed to render them (plus the
+    pagination ordering).
+    """
+    sparse_field_actions = ('list', 'retrieve')
+
+    def requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = self._parse_fields()
+        return self._requested_fields
+
+    def _parse_fields(self):
+        raw = self.request.query_params.get('fields')
+        if self.request.method not in SAFE_METHODS or not raw:
+            return None
+        requested = {name.strip() for name in raw.split(',') if name.strip()}
+        unknown = requested - self.get_serializer_class().readable_fields()
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown field: {name}' for name in sorted(unknown)]})
+        return requested
+
+    def model_fields(self):
+        """Model fields needed to render and paginate the requested fields."""
+        serializer_class = self.get_serializer_class()
+        needed = serializer_class.model_fields_for(
+            self.requested_fields() or serializer_class.readable_fields()
+        )
+        needed.update(field.lstrip('-') for field in getattr(self, 'ordering', ()))
+        return needed
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.sparse_field_actions and self.requested_fields():
+            queryset = queryset.only(*self.model_fields())
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in self.sparse_field_actions:
+            context['fields'] = self.requested_fields()
+        return context
+
+
+class ValuesListMixin:
+    """
+    Fetch ``list`` pages (and any other ``values_actions``) as ``values()`` rows, which the serializer's
+    ``RowListSerializer`` renders without building model instances.
+    Must come before ``SparseFieldsViewMixin``.
+    """
+    values_actions = ('list',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.values_actions:
+            queryset = queryset.values(*self.model_fields())
+        return queryset
+
+
+class PrefetchedLookupsMixin:
+    """
+    Resolve the references of a whole page with one bulk query per type
+    and hand the lookup maps to the serializer through its context.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and args:
+            instances = list(args[0])
+            context = kwargs.setdefault('context', self.get_serializer_context())
+            context.update(self.get_serializer_class().prefetch_lookups(instances, context.get('fields')))
+            args = (instances,) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+
+
+class ProfiledSerializerMixin:
+    """
+    When request profiling is on, time the serializers' ``.data`` as the
+    ``serialize`` phase rather than as part of the view. ``list`` and
+    ``retrieve`` do it themselves; other reads go through ``serializer_data``.
+    """
+
+    def serializer_data(self, serializer):
+        profile = getattr(self.request, 'octofit_profile', None)
+        if profile is None:
+            return serializer.data
+        with profile.serializing():
+            return serializer.data
+
+    def list(self, request, *args, **kwargs):
+        # ListModelMixin.list, with the serializer output timed
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(self.serializer_data(serializer))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(self.serializer_data(serializer))
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(self.serializer_data(serializer))
+
+
+class DeltaSyncMixin:
+    """
+    Delta sync on ``list``. Every list response carries an ``X-Sync-Token``
+    header; ``?since=<token>`` then returns only the rows changed and the
+    ids deleted after it, with the token for the next sync. Must come
+    before ``CachedResponseMixin``, as these responses are never cached.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if 'since' in request.query_params:
+            return self.sync_changes(request)
+        started = timezone.now()
+        response = super().list(request, *args, **kwargs)
+        # A cached list is only as fresh as the moment it was read
+        response['X-Sync-Token'] = sync.encode_token(
+            sync.token_time(getattr(response, 'read_at', started))
+        )
+        return response
+
+    def sync_changes(self, request):
+        try:
+            since = sync.decode_token(request.query_params['since'])
+        except (TypeError, ValueError):
+            raise ValidationError({'since': ['Invalid sync token.']})
+        until = sync.token_time(timezone.now())
+        try:
+            changed, deleted = sync.changes(
+                self.filter_queryset(self.get_queryset()), self.queryset.model, since, until
+            )
+        except sync.ExpiredToken:
+            return Response(
+                {'detail': 'Sync token expired; fetch the full list again.'},
+                status=status.HTTP_410_GONE,
+            )
+        response = Response({
+            'changed': self.serializer_data(self.get_serializer(changed, many=True)),
+            'deleted': deleted,
+            'since': sync.encode_token(until),
+        })
+        response['X-Sync-Token'] = response.data['since']
+        return response
+
+
+class CachedResponseMixin:
+    """
+    Serve ``list`` and ``retrieve`` from the response cache.
+
+    Entries are keyed on the request path and on a generation counter for
+    the viewset's model and each of ``cache_dependencies``, which the
+    save/delete signals bump, so a write only invalidates the viewsets that
+    read that model. Responses carry an ETag per negotiated media type and
+    honour ``If-None-Match``, and their ``read_at`` attribute is when the
+    cached data was read.
+    """
+    cache_dependencies = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_response_cache()
+        models = (self.queryset.model,) + tuple(self.cache_dependencies)
+        generations = ','.join(str(cache.generation(model._meta.label_lower)) for model in models)
+        key = hashlib.sha1(f'{generations}|{request.get_full_path()}'.encode()).hexdigest()
+
+        cached = cache.get(key)
+        if cached is None:
+            read_at = timezone.now()
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            digest = hashlib.sha1(JSONRenderer().render(response.data)).hexdigest()
+            cached = (digest, response.data, read_at)
+            cache.set(key, cached)
+
+        digest, data, read_at = cached
+        # Each negotiated format is a different representation of the data
+        etag = '"%s"' % hashlib.sha1(f'{digest}|{request.accepted_media_type}'.encode()).hexdigest()
+        if etag in _if_none_match(request):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept',))
+        response.read_at = read_at
+        return response
+
+
+def export_response(queryset, fields, export_format, filename):
+    response = StreamingHttpResponse(
+        exports.export_lines(queryset, fields, export_format),
+        content_type=exports.CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def _if_none_match(request):
+    header = request.headers.get('If-None-Match', '')
+    return {tag.strip().removeprefix('W/') for tag in header.split(',') if tag.strip()}
+
+
+class UserViewSet(DeltaSyncMixin, SparseFieldsViewMixin, ProfiledSerializerMixin, ListReadsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     queryset = User.objects.all().order_by('-created_at')
+    ordering = ('-created_at', '-id')
     serializer_class = UserSerializer
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Import a list of users with one bulk insert. Passwords are hashed
+        in parallel before the insert.
+        """
+        serializer = UserBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        emails = [item['email'] for item in serializer.validated_data]
+        taken = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        errors = []
+        seen = set()
+        for item in serializer.validated_data:
+            email = item['email']
+            errors.append({'email': ['user with this email already exists.']}
+                          if email in taken or email in seen else {})
+            seen.add(email)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
-class TeamViewSet(viewsets.ModelViewSet):
+        users = User.objects.bulk_create_hashed(
+            User(**item) for item in serializer.validated_data
+        )
+        # bulk_create doesn't send post_save
+        invalidate_model(User)
+        leaderboard.record_users_created(users)
+        return Response({'created': len(users)}, status=status.HTTP_201_CREATED)
+
+
+class TeamViewSet(DeltaSyncMixin, CachedResponseMixin, PrefetchedLookupsMixin, SparseFieldsViewMixin, ProfiledSerializerMixin, ListReadsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows teams to be viewed or edited.
     """
     queryset = Team.objects.all().order_by('-created_at')
+    ordering = ('-created_at', '-id')
     serializer_class = TeamSerializer
+    cache_dependencies = (User,)
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(DeltaSyncMixin, ValuesListMixin, SparseFieldsViewMixin, ProfiledSerializerMixin, ListReadsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows activities to be viewed or edited.
     """
     queryset = Activity.objects.all().order_by('-date')
+    ordering = ('-date', '-id')
     serializer_class = ActivitySerializer
+    sparse_field_actions = ('list', 'retrieve', 'feed')
+
+    def create(self, request, *args, **kwargs):
+        """
+        Create an activity. Resubmitting one already stored (same user,
+        type, date and duration) returns the stored row with 200 and writes
+        nothing, and so does retrying with the same ``Idempotency-Key``,
+        which returns the row the key created; reusing a key for a
+        different activity is a 422.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        content_hash = Activity(**serializer.validated_data).compute_content_hash()
+        key = request.headers.get('Idempotency-Key')
+        repository = get_repository()
+
+        if key:
+            recorded = idempotency.recorded_key(key)
+            if recorded is not None and recorded.content_hash != content_hash:
+                return Response(
+                    {'detail': 'Idempotency-Key was already used for a different activity.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if recorded is not None:
+                # The row the key created, even if it was edited since
+                original = repository.get_activity(recorded.activity_id)
+                if original is not None:
+                    return self.replayed(original)
+        original = idempotency.find_duplicate(repository, content_hash)
+        if original is not None:
+            return self.replayed(original, key)
+
+        try:
+            # A savepoint, so a lost race doesn't break an outer transaction
+            with transaction.atomic(), integrity_errors():
+                self.perform_create(serializer)
+        except IntegrityError:
+            # A concurrent submission of the same activity won the insert
+            original = repository.activities_by_hash([content_hash]).get(content_hash)
+            if original is None:
+                raise
+            return self.replayed(original, key)
+        idempotency.remember([content_hash])
+        if key:
+            idempotency.record_key(key, content_hash, serializer.instance.pk)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    def replayed(self, original, key=None):
+        if key:
+            idempotency.record_key(key, original.content_hash, original.pk)
+        response = Response(self.get_serializer(original).data, status=status.HTTP_200_OK)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def perform_create(self, serializer):
+        activity = get_repository().create_activity(serializer.validated_data)
+        serializer.instance = activity
+        leaderboard.record_activity_created(activity)
+
+    def perform_update(self, serializer):
+        old_activity = copy.copy(serializer.instance)
+        try:
+            with transaction.atomic(), integrity_errors():
+                activity = serializer.save()
+        except IntegrityError:
+            raise ValidationError({'detail': 'An identical activity already exists.'})
+        idempotency.remember([activity.content_hash])
+        leaderboard.record_activity_updated(old_activity, activity)
 
+    def perform_destroy(self, instance):
+        leaderboard.record_activity_deleted(instance)
+        instance.delete()
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create many activities from a JSON array or an NDJSON body.
+
+        Valid items are inserted in chunks and the leaderboard is updated
+        once for the whole batch; invalid items are reported by index, and
+        so are items already stored or repeated earlier in the batch, which
+        are skipped.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({'detail': 'Expected a list of activities.'})
+
+        serializer = ActivitySerializer(data=request.data, many=True)
+        candidates = {}
+        duplicates = []
+        errors = []
+        for index, item in enumerate(request.data):
+            try:
+                activity = Activity(**serializer.child.run_validation(item))
+            except ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+                continue
+            # bulk_create doesn't call save()
+            activity.content_hash = activity.compute_content_hash()
+            if activity.content_hash in candidates:
+                duplicates.append(index)
+            else:
+                candidates[activity.content_hash] = (index, activity)
+
+        batch_size = getattr(settings, 'OCTOFIT_BULK_BATCH_SIZE', 500)
+        repository = get_repository()
+        pending = list(candidates.items())
+        activities = []
+        for start in range(0, len(pending), batch_size):
+            batch = dict(pending[start:start + batch_size])
+            stored = idempotency.find_duplicates(repository, batch)
+            try:
+                with transaction.atomic(), integrity_errors():
+                    created = self.insert_new(batch, stored)
+            except IntegrityError:
+                # Rows written concurrently since the lookup; retry without them
+                stored = repository.activities_by_hash(batch)
+                with transaction.atomic():
+                    created = self.insert_new(batch, stored)
+            duplicates.extend(index for content_hash, (index, _) in batch.items() if content_hash in stored)
+            activities.extend(created)
+        if activities:
+            # bulk_create doesn't send post_save
+            invalidate_model(Activity)
+            idempotency.remember(activity.content_hash for activity in activities)
+            leaderboard.record_activities_created(activities)
+
+        if activities:
+            response_status = status.HTTP_201_CREATED
+        elif duplicates:
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {'created': len(activities), 'duplicates': sorted(duplicates), 'errors': errors},
+            status=response_status,
+        )
+
+    @staticmethod
+    def insert_new(batch, stored):
+        activities = [activity for content_hash, (_, activity) in batch.items() if content_hash not in stored]
+        Activity.objects.bulk_create(activities)
+        return activities
+
+    @action(detail=False, methods=['get'], url_path=r'feed/(?P<user_id>[^/.]+)')
+    def feed(self, request, user_id=None):
+        """
+        A user's activities, newest first, paginated with an opaque
+        ``cursor`` and ``page_size``.
+        """
+        params = ActivityFeedQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page_size = params.validated_data.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE'])
+        try:
+            before = decode_cursor(params.validated_data.get('cursor'), datetime.datetime)
+        except (TypeError, ValueError):
+            raise ValidationError({'cursor': ['Invalid cursor.']})
+
+        rows = get_repository().activity_feed(user_id, page_size + 1, before)
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            query = request.query_params.copy()
+            query['cursor'] = encode_cursor(rows[-1]['date'], rows[-1]['id'])
+            next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+        return Response({'next': next_url, 'results': self.serializer_data(self.get_serializer(rows, many=True))})
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Summary rows grouped by ``user``, ``team``, ``activity_type``, ``day``
+        or ``week``, optionally filtered by ``start``, ``end`` and ``user_id``.
+        """
+        params = ActivityStatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = dict(params.validated_data)
+        group_by = filters.pop('group_by')
+        return Response(stats.activity_summary(group_by, **filters))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream activities as CSV or NDJSON (``?output=``), optionally filtered
+        by ``start``, ``end`` and ``user_id``.
+        """
+        params = ActivityExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = dict(params.validated_data)
+        export_format = filters.pop('output')
+        queryset = stats.filter_activities(Activity.objects.order_by('date', 'id'), **filters)
+        return export_response(queryset, exports.ACTIVITY_FIELDS, export_format, 'activities')
+
+
+class LeaderboardViewSet(DeltaSyncMixin, CachedResponseMixin, PrefetchedLookupsMixin, ValuesListMixin, SparseFieldsViewMixin, ProfiledSerializerMixin, ListReadsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows leaderboard entries to be viewed or edited.
     """
     queryset = Leaderboard.objects.all().order_by('rank')
+    ordering = ('rank', 'id')
     serializer_class = LeaderboardSerializer
+    cache_dependencies = (User, Team, ActivityDayBucket)
+    sparse_field_actions = ('list', 'retrieve', 'top', 'around')
+
+    def list(self, request, *args, **kwargs):
+        if 'window' in request.query_params:
+            return self.cached_response(self.window_list, request, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
+
+    def window_list(self, request, *args, **kwargs):
+        """
+        Ranking over a rolling ``window`` (``day``, ``week`` or ``month``)
+        summed from the per-day activity buckets.
+        """
+        params = LeaderboardWindowQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        window = params.validated_data['window']
+        limit = params.validated_data.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE'])
+
+        rows = buckets.window_ranking(window, limit)
+        user_ids = [row['user_id'] for row in rows]
+        user_names = user_names_by_id(user_ids)
+        user_teams = user_teams_by_id(user_ids)
+        team_names = team_names_by_id(team_id for team_id in user_teams.values() if team_id)
+        for row in rows:
+            team_id = user_teams.get(row['user_id'])
+            row['user'] = user_names.get(row['user_id'], "Unknown User")
+            row['team_id'] = team_id
+            row['team'] = team_names.get(str(team_id))
+        return Response({
+            'window': window,
+            'start': buckets.window_start(window),
+            'results': rows,
+        })
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """
+        The ``k`` best ranked entries (default 10), read through the rank
+        index rather than paging through the whole leaderboard.
+        """
+        return self.cached_response(self._top, request)
+
+    def _top(self, request):
+        params = LeaderboardTopQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        k = params.validated_data['k']
+        rows = get_repository().leaderboard_range(1, k)
+        return Response({'k': k, 'results': self.serializer_data(self.get_serializer(rows, many=True))})
+
+    @action(detail=False, methods=['get'], url_path=r'around/(?P<user_id>[^/.]+)')
+    def around(self, request, user_id=None):
+        """
+        The entry of ``user_id`` and the ``radius`` entries ranked directly
+        above and below it (default 5).
+        """
+        return self.cached_response(self._around, request, user_id=user_id)
+
+    def _around(self, request, user_id=None):
+        params = LeaderboardAroundQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        radius = params.validated_data['radius']
+        repository = get_repository()
+        rank = repository.leaderboard_rank(user_id)
+        if rank is None:
+            raise NotFound('No leaderboard entry for this user.')
+        rows = repository.leaderboard_range(max(rank - radius, 1), rank + radius)
+        return Response({
+            'user_id': user_id,
+            'rank': rank,
+            'results': self.serializer_data(self.get_serializer(rows, many=True)),
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream leaderboard entries as CSV or NDJSON (``?output=``), optionally
+        filtered by ``user_id`` and ``team_id``.
+        """
+        params = LeaderboardExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = dict(params.validated_data)
+        export_format = filters.pop('output')
+        queryset = Leaderboard.objects.filter(**filters).order_by('rank', 'id')
+        return export_response(queryset, exports.LEADERBOARD_FIELDS, export_format, 'leaderboard')
+
+
+class TeamStandingViewSet(CachedResponseMixin, PrefetchedLookupsMixin, SparseFieldsViewMixin, ProfiledSerializerMixin, ListReadsMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint that lists teams ranked by their total calories.
+    """
+    queryset = TeamStanding.objects.all().order_by('rank')
+    ordering = ('rank', 'id')
+    serializer_class = TeamStandingSerializer
+    cache_dependencies = (Team,)
 
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(CachedResponseMixin, ValuesListMixin, SparseFieldsViewMixin, ProfiledSerializerMixin, ListReadsMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows workouts to be viewed or edited.
     """
     queryset = Workout.objects.all().order_by('-created_at')
+    ordering = ('-created_at', '-id')
     serializer_class = WorkoutSerializer